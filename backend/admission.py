@@ -0,0 +1,347 @@
+"""Admission control in front of each upstream AWS service.
+
+Every call goes through the service's `AdmissionController`, which applies
+a token-bucket rate limit, an AIMD adaptive concurrency limit driven by
+throttling and latency, and a bounded FIFO wait queue with a deadline.
+The limit shrinks when AWS throttles a call or a call takes longer than
+the service's latency target (`<SERVICE>_LATENCY_TARGET_SECONDS`, 0 to
+react to throttling only), and grows back slowly while calls succeed.
+When a call can't be admitted in time it fails fast with `ServiceOverloaded`
+(429 for rate limiting, 503 for saturation) carrying a Retry-After hint,
+instead of piling more work onto a throttled service.
+
+Calls made inside `bulk_priority()` (background job work) always yield to
+interactive requests: they only take a free slot or rate token when no
+interactive call is waiting, freed slots go to interactive waiters first,
+and bulk calls may use at most `bulk_share` of the concurrency limit.
+"""
+import asyncio
+import contextlib
+import contextvars
+import math
+import os
+import time
+
+from fastapi import HTTPException
+
+from executors import pool_size, run_in_service
+
+# AWS error codes that mean "slow down"
+THROTTLING_ERROR_CODES = {
+    'ThrottlingException',
+    'ThrottledException',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'ServiceQuotaExceededException',
+    'RequestLimitExceeded',
+    'LimitExceededException',
+}
+
+# Default sustained requests/second per service (roughly the default AWS quotas)
+DEFAULT_RATES = {
+    'textract': 10.0,
+    'bedrock-text': 20.0,
+    'bedrock-image': 5.0,
+    'polly': 8.0,
+}
+
+# Default latency targets in seconds: well above a healthy call, well below the deadlines in resilience.py
+DEFAULT_LATENCY_TARGETS = {
+    'textract': 10.0,
+    'bedrock-text': 30.0,
+    'bedrock-image': 30.0,
+    'polly': 10.0,
+}
+
+
+_bulk = contextvars.ContextVar('admission_bulk', default=False)
+
+
+@contextlib.contextmanager
+def bulk_priority():
+    """Mark upstream calls made in this block (and tasks it starts) as background work."""
+    token = _bulk.set(True)
+    try:
+        yield
+    finally:
+        _bulk.reset(token)
+
+
+class ServiceOverloaded(HTTPException):
+    """Raised when an upstream call is rejected by admission control."""
+
+    def __init__(self, service: str, status_code: int, retry_after: float, reason: str, upstream: bool = False):
+        self.service = service
+        # True when AWS itself throttled us, as opposed to a local rejection
+        self.upstream = upstream
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=status_code,
+            detail=f"Tobi is very busy right now ({reason}). Please try again in {self.retry_after} seconds.",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+def is_throttling_error(error: Exception) -> bool:
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+    return False
+
+
+class TokenBucket:
+    """Token bucket where waiters reserve future tokens, keeping admission FIFO."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_wait: float):
+        """Take a token, returning how long to wait for it, or None if that exceeds `max_wait`."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if wait > max_wait:
+            return None
+        self.tokens -= 1
+        return wait
+
+    def time_until_token(self) -> float:
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate) if self.rate > 0 else 0.0
+
+
+class AIMDLimiter:
+    """Additive-increase / multiplicative-decrease concurrency limit."""
+
+    def __init__(self, max_limit: int, min_limit: int = 1, backoff: float = 0.7,
+                 latency_target: float = None, decrease_cooldown: float = 1.0):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.decrease_cooldown = decrease_cooldown
+        self.limit = float(max_limit)
+        self._last_decrease = 0.0
+
+    def on_success(self, latency: float):
+        if self.latency_target and latency > self.latency_target:
+            self.on_congestion()
+        else:
+            # Roughly +1 per limit's worth of successful calls
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def on_congestion(self):
+        # A burst of throttles from calls already in flight counts as one signal
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+
+    @property
+    def current(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+
+class AdmissionController:
+
+    def __init__(self, service: str, rate: float, burst: float, max_concurrency: int,
+                 max_queue: int, queue_timeout: float, latency_target: float = None,
+                 bulk_queue_timeout: float = None, bulk_share: float = 0.5):
+        self.service = service
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AIMDLimiter(max_concurrency, latency_target=latency_target)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.bulk_queue_timeout = bulk_queue_timeout or queue_timeout
+        self.bulk_share = bulk_share
+        self.in_flight = 0
+        self.in_flight_bulk = 0
+        self.admitted = 0
+        self.admitted_bulk = 0
+        self.rejected_rate = 0
+        self.rejected_queue = 0
+        self.throttled = 0
+        self._waiters = []
+        self._bulk_waiters = []
+
+    @classmethod
+    def from_env(cls, service: str) -> "AdmissionController":
+        prefix = service.upper().replace('-', '_')
+        rate = float(os.getenv(f'{prefix}_RATE_LIMIT', DEFAULT_RATES[service]))
+        latency_target = float(os.getenv(f'{prefix}_LATENCY_TARGET_SECONDS', DEFAULT_LATENCY_TARGETS[service]))
+        return cls(
+            service,
+            rate=rate,
+            burst=float(os.getenv(f'{prefix}_RATE_BURST', max(1.0, rate))),
+            max_concurrency=int(os.getenv(f'{prefix}_MAX_CONCURRENCY', pool_size(service))),
+            max_queue=int(os.getenv(f'{prefix}_MAX_QUEUE', 32)),
+            queue_timeout=float(os.getenv(f'{prefix}_QUEUE_TIMEOUT_SECONDS', 5.0)),
+            latency_target=latency_target or None,
+            bulk_queue_timeout=float(os.getenv(f'{prefix}_BULK_QUEUE_TIMEOUT_SECONDS', 15.0)),
+            bulk_share=float(os.getenv(f'{prefix}_BULK_SHARE', 0.5)),
+        )
+
+    @property
+    def bulk_limit(self) -> int:
+        return max(1, int(self.limiter.current * self.bulk_share))
+
+    def _bulk_slot_free(self) -> bool:
+        return self.in_flight < self.limiter.current and self.in_flight_bulk < self.bulk_limit
+
+    async def acquire(self):
+        if _bulk.get():
+            await self._acquire_bulk()
+            return
+        deadline = time.monotonic() + self.queue_timeout
+
+        wait = self.bucket.reserve(self.queue_timeout)
+        if wait is None:
+            self.rejected_rate += 1
+            raise ServiceOverloaded(self.service, 429, self.bucket.time_until_token(), "rate limited")
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        if self.in_flight < self.limiter.current and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue += 1
+            raise ServiceOverloaded(self.service, 503, self.queue_timeout, "queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=max(0.0, deadline - time.monotonic()))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as we gave up; pass it on
+                self._release_slot()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected_queue += 1
+            raise ServiceOverloaded(self.service, 503, self.queue_timeout, "timed out waiting for capacity")
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.admitted += 1
+
+    async def _acquire_bulk(self):
+        """Wait (without a queue limit) until no interactive call needs the token or slot."""
+        deadline = time.monotonic() + self.bulk_queue_timeout
+        # Only take tokens that are available now; reserving future ones would delay interactive calls
+        while self.bucket.reserve(0.0) is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.rejected_queue += 1
+                raise ServiceOverloaded(self.service, 503, self.bulk_queue_timeout, "busy with interactive requests")
+            await asyncio.sleep(min(remaining, max(0.01, self.bucket.time_until_token())))
+
+        if self._bulk_slot_free() and not self._waiters and not self._bulk_waiters:
+            self.in_flight += 1
+            self.in_flight_bulk += 1
+            self.admitted_bulk += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._bulk_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=max(0.0, deadline - time.monotonic()))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot(bulk=True)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected_queue += 1
+            raise ServiceOverloaded(self.service, 503, self.bulk_queue_timeout, "busy with interactive requests")
+        finally:
+            if waiter in self._bulk_waiters:
+                self._bulk_waiters.remove(waiter)
+        self.admitted_bulk += 1
+
+    def release(self, latency: float, throttled: bool, bulk: bool = False):
+        if throttled:
+            self.throttled += 1
+            self.limiter.on_congestion()
+        elif latency is not None:
+            self.limiter.on_success(latency)
+        self._release_slot(bulk)
+
+    def _release_slot(self, bulk: bool = False):
+        self.in_flight -= 1
+        if bulk:
+            self.in_flight_bulk -= 1
+        # Hand freed slots straight to the oldest waiters, interactive ones first
+        while self._waiters and self.in_flight < self.limiter.current:
+            waiter = self._waiters.pop(0)
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+        while self._bulk_waiters and self._bulk_slot_free():
+            waiter = self._bulk_waiters.pop(0)
+            if not waiter.done():
+                self.in_flight += 1
+                self.in_flight_bulk += 1
+                waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": self.limiter.current,
+            "in_flight": self.in_flight,
+            "in_flight_bulk": self.in_flight_bulk,
+            "queued": len(self._waiters),
+            "queued_bulk": len(self._bulk_waiters),
+            "admitted": self.admitted,
+            "admitted_bulk": self.admitted_bulk,
+            "rejected_rate_limited": self.rejected_rate,
+            "rejected_overloaded": self.rejected_queue,
+            "throttled": self.throttled,
+        }
+
+
+admission_controllers = {}
+
+
+def get_controller(service: str) -> AdmissionController:
+    controller = admission_controllers.get(service)
+    if controller is None:
+        controller = admission_controllers[service] = AdmissionController.from_env(service)
+    return controller
+
+
+@contextlib.asynccontextmanager
+async def admitted(service: str):
+    """Hold one admission slot for `service` for the duration of the block."""
+    controller = get_controller(service)
+    bulk = _bulk.get()
+    await controller.acquire()
+    started = time.monotonic()
+    throttled = False
+    latency = None
+    try:
+        yield
+        latency = time.monotonic() - started
+    except Exception as e:
+        throttled = is_throttling_error(e)
+        if throttled:
+            raise ServiceOverloaded(service, 503, 2.0, "upstream throttling", upstream=True) from e
+        raise
+    finally:
+        controller.release(latency, throttled, bulk)
+
+
+async def call_service(service: str, fn, *args, **kwargs):
+    """Run an upstream call on the service's pool, subject to admission control."""
+    async with admitted(service):
+        return await run_in_service(service, fn, *args, **kwargs)
@@ -0,0 +1,143 @@
+"""AWS settings and lazily built, pooled boto3 clients.
+
+Clients are built on first use (or by `warm()` in the background at
+startup) from one shared botocore session, so service models and endpoint
+data are loaded once per process and importing the app doesn't pay for
+clients a worker may not need yet. Every client gets an explicit pool
+size, connect/read timeouts and TCP keep-alive instead of botocore's
+defaults (10 connections, 60s timeouts, no keep-alive).
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_REGION = 'us-east-1'
+CONNECT_TIMEOUT_SECONDS = float(os.getenv('AWS_CONNECT_TIMEOUT_SECONDS', '5'))
+# resilience.py owns retries, deadlines and hedging; SDK retries on top would multiply attempts
+SDK_MAX_ATTEMPTS = int(os.getenv('AWS_SDK_MAX_ATTEMPTS', '1'))
+
+_env_loaded = False
+
+
+def load_environment():
+    """Load the first .env found (DOTENV_PATH, backend/.env, then the repo root's) once per process.
+
+    Variables already set in the environment win over the file.
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+    candidates = [os.getenv('DOTENV_PATH'), os.path.join(BACKEND_DIR, '.env'), os.path.join(os.path.dirname(BACKEND_DIR), '.env')]
+    for path in candidates:
+        if path and os.path.isfile(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            logger.info(f"Loaded environment from {path}")
+            return
+
+
+def aws_region() -> str:
+    return os.getenv('AWS_REGION', DEFAULT_REGION)
+
+
+class ClientSpec:
+
+    def __init__(self, service_name: str, max_pool_connections: int, read_timeout: float):
+        self.service_name = service_name
+        self.max_pool_connections = max_pool_connections
+        self.read_timeout = read_timeout
+
+
+class AWSClients:
+    """Registry of boto3 clients built on demand from a shared session."""
+
+    def __init__(self):
+        self._specs = {}
+        self._clients = {}
+        self._build_seconds = {}
+        self._session = None
+        self._lock = threading.Lock()
+
+    def register(self, name: str, service_name: str, max_pool_connections: int, read_timeout: float) -> "LazyClient":
+        """Declare a client; nothing is built until it is first used."""
+        prefix = name.upper().replace('-', '_')
+        read_timeout = float(os.getenv(f'{prefix}_READ_TIMEOUT_SECONDS', read_timeout))
+        self._specs[name] = ClientSpec(service_name, max_pool_connections, read_timeout)
+        return LazyClient(self, name)
+
+    def _get_session(self):
+        if self._session is None:
+            import boto3
+            self._session = boto3.session.Session(region_name=aws_region())
+        return self._session
+
+    def get(self, name: str):
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        # One lock for all clients: building them concurrently from one session isn't thread-safe
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                client = self._build(name)
+        return client
+
+    def _build(self, name: str):
+        from botocore.config import Config
+
+        spec = self._specs[name]
+        started = time.perf_counter()
+        client = self._get_session().client(
+            spec.service_name,
+            config=Config(
+                max_pool_connections=spec.max_pool_connections,
+                connect_timeout=CONNECT_TIMEOUT_SECONDS,
+                read_timeout=spec.read_timeout,
+                tcp_keepalive=True,
+                retries={'total_max_attempts': SDK_MAX_ATTEMPTS, 'mode': 'standard'},
+            ),
+        )
+        self._build_seconds[name] = time.perf_counter() - started
+        self._clients[name] = client
+        logger.info(f"Built {spec.service_name} client in {self._build_seconds[name] * 1000:.0f}ms "
+                    f"({spec.max_pool_connections} connections, region {client.meta.region_name})")
+        return client
+
+    def warm(self):
+        """Build every registered client (blocking; run it off the event loop)."""
+        for name in self._specs:
+            self.get(name)
+
+    def ready(self) -> bool:
+        return all(name in self._clients for name in self._specs)
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "service": spec.service_name,
+                "built": name in self._clients,
+                "build_ms": round(self._build_seconds[name] * 1000, 1) if name in self._build_seconds else None,
+                "max_pool_connections": spec.max_pool_connections,
+                "connect_timeout": CONNECT_TIMEOUT_SECONDS,
+                "read_timeout": spec.read_timeout,
+            }
+            for name, spec in self._specs.items()
+        }
+
+
+class LazyClient:
+    """Stands in for a boto3 client, building the real one on first attribute access."""
+
+    __slots__ = ('_clients', '_name')
+
+    def __init__(self, clients: AWSClients, name: str):
+        self._clients = clients
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._clients.get(self._name), attr)
@@ -0,0 +1,325 @@
+"""Caches shared by the backend endpoints.
+
+`LRUCache` is a size-bounded in-memory tier, `SQLiteStore` is an optional
+on-disk tier that survives restarts and can be shared by several uvicorn
+workers, and `ExtractionCache` combines both for content-addressed text
+extraction results. `SingleFlight` coalesces concurrent identical calls and
+`DiskBlobCache` stores binary artifacts (audio, images) as files.
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from executors import run_in_service
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class LRUCache:
+    """In-memory LRU cache evicting by total size rather than entry count.
+
+    Entries optionally expire `ttl` seconds after they were set. Expired
+    entries are kept until evicted so `get(key, allow_stale=True)` can still
+    serve them when the upstream is unavailable.
+    """
+
+    def __init__(self, max_bytes: int, sizeof=len, ttl: float = None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, allow_stale: bool = False):
+        with self._lock:
+            entry = self._entries.get(key)
+            expired = entry is not None and entry[2] is not None and entry[2] <= time.monotonic()
+            if entry is None or (expired and not allow_stale):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if expired:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            expires_at = time.monotonic() + self.ttl if self.ttl else None
+            self._entries[key] = (value, size, expires_at)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale_hits": self.stale_hits,
+        }
+
+
+class SQLiteStore:
+    """Key/value table in a SQLite file, safe to share across processes."""
+
+    def __init__(self, path: str, table: str):
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+        self._opened = False
+        self._open_lock = threading.Lock()
+
+    def open(self):
+        """Create the table. Done on first use unless called earlier, e.g. during startup warm-up."""
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._opened:
+            with self._open_lock:
+                if not self._opened:
+                    with conn:
+                        conn.execute(
+                            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+                        )
+                    self._opened = True
+        return conn
+
+    def get(self, key: str):
+        row = self._connect().execute(
+            f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str):
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+
+
+class ExtractionCache:
+    """Maps the SHA-256 of an uploaded document to its extracted text.
+
+    The memory tier is checked inline; the SQLite tier can wait on another
+    worker's lock, so it runs on the 'cache-db' pool.
+    """
+
+    def __init__(self, max_bytes: int, db_path: str = None):
+        self.memory = LRUCache(max_bytes, sizeof=lambda text: len(text.encode('utf-8')))
+        self.disk = SQLiteStore(db_path, "extractions") if db_path else None
+        self.disk_hits = 0
+
+    async def open(self):
+        if self.disk is not None:
+            await run_in_service('cache-db', self.disk.open)
+
+    async def get(self, key: str):
+        text = self.memory.get(key)
+        if text is None and self.disk is not None:
+            text = await run_in_service('cache-db', self.disk.get, key)
+            if text is not None:
+                self.disk_hits += 1
+                self.memory.set(key, text)
+        return text
+
+    async def set(self, key: str, text: str):
+        self.memory.set(key, text)
+        if self.disk is not None:
+            await run_in_service('cache-db', self.disk.set, key, text)
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        return {
+            "hits": memory["hits"] + self.disk_hits,
+            "misses": memory["misses"] - self.disk_hits,
+            "memory": memory,
+            "disk_enabled": self.disk is not None,
+            "disk_hits": self.disk_hits,
+        }
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto one in-flight task."""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._inflight = {}
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shield so one cancelled caller doesn't cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "coalesced": self.coalesced}
+
+
+class DiskBlobCache:
+    """Directory of content files with a total size cap and LRU eviction.
+
+    Recency is tracked through file mtimes, so several workers can share
+    the same directory. File I/O runs on the 'blob-cache' pool. Going over
+    the cap evicts down to `low_water` of it, so a full cache isn't
+    rescanned on every write. The directory is created and sized by
+    `open()`, or by the first write.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, extension: str = '', low_water: float = 0.9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._evicting = threading.Lock()
+        self._bytes = None
+
+    async def open(self):
+        await run_in_service('blob-cache', self._open)
+
+    def _open(self):
+        with self._evicting:
+            if self._bytes is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            total = sum(size for _, size, _ in self._scan())
+            with self._lock:
+                self._bytes = total
+
+    def _scan(self) -> list:
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(self.extension):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.extension)
+
+    async def get_path(self, key: str):
+        """Path of the cached file for `key`, or None. Marks it recently used."""
+        return await run_in_service('blob-cache', self._touch, key)
+
+    async def get(self, key: str):
+        return await run_in_service('blob-cache', self._read, key)
+
+    async def put(self, key: str, data: bytes) -> str:
+        return await run_in_service('blob-cache', self._write, key, data)
+
+    def _touch(self, key: str):
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def _read(self, key: str):
+        path = self._touch(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, data: bytes) -> str:
+        if self._bytes is None:
+            self._open()
+        path = self.path(key)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # Atomic so concurrent readers never see a partial file
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._bytes += len(data) - replaced
+            over = self._bytes > self.max_bytes
+        if over:
+            self._evict()
+        return path
+
+    def _evict(self):
+        # A write arriving mid-eviction can skip it; this pass frees enough room for both
+        if not self._evicting.acquire(blocking=False):
+            return
+        try:
+            target = self.max_bytes * self.low_water
+            entries = sorted(self._scan(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+            # Rescanning also picks up files other workers added or removed
+            with self._lock:
+                self._bytes = total
+        finally:
+            self._evicting.release()
+
+    def stats(self) -> dict:
+        return {
+            "bytes": self._bytes or 0,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,62 @@
+"""Splitting text into pieces that fit upstream request limits."""
+import re
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+def split_sentences(text: str) -> list:
+    return [s for s in SENTENCE_END.split(text.strip()) if s]
+
+
+def _split_long(piece: str, max_chars: int) -> list:
+    """Break a single over-long sentence at word boundaries (or hard, as a last resort)."""
+    parts = []
+    while len(piece) > max_chars:
+        cut = piece.rfind(' ', 0, max_chars + 1)
+        if cut <= 0:
+            cut = max_chars
+        parts.append(piece[:cut].strip())
+        piece = piece[cut:].strip()
+    if piece:
+        parts.append(piece)
+    return parts
+
+
+def pack(pieces: list, max_chars: int, separator: str = ' ') -> list:
+    """Greedily pack pieces, in order, into chunks of at most `max_chars`."""
+    chunks = []
+    current = ''
+    for piece in pieces:
+        for part in _split_long(piece, max_chars):
+            if current and len(current) + len(separator) + len(part) > max_chars:
+                chunks.append(current)
+                current = part
+            else:
+                current = f"{current}{separator}{part}" if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_sentences(text: str, max_chars: int) -> list:
+    """Split text into chunks of whole sentences, each at most `max_chars` long."""
+    return pack(split_sentences(text), max_chars)
+
+
+def chunk_paragraphs(text: str, max_chars: int) -> list:
+    """Split text into chunks of whole paragraphs, falling back to sentences.
+
+    Paragraphs longer than `max_chars` (including text with no blank-line
+    breaks at all, like Textract output) are split at sentence boundaries.
+    """
+    pieces = []
+    for paragraph in PARAGRAPH_BREAK.split(text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) > max_chars:
+            pieces.extend(split_sentences(paragraph))
+        else:
+            pieces.append(paragraph)
+    return pack(pieces, max_chars, separator='\n\n')
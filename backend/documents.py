@@ -0,0 +1,148 @@
+"""Server-side document sessions.
+
+`/upload` registers the extracted text under a `doc_id`, and later calls
+refer to the document by ID instead of re-sending its text. Documents
+expire after a sliding TTL and the in-memory tier is bounded by size.
+When a directory is configured, documents are also written there as JSON
+so they survive memory eviction and restarts and are visible to every
+uvicorn worker. The memory tier is checked inline; disk reads and writes
+run on the 'documents' pool so they never block the event loop.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from executors import run_in_service
+
+
+class DocumentStore:
+
+    def __init__(self, ttl: float, max_bytes: int, directory: str = None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.current_bytes = 0
+        self.evictions = 0
+        self.disk_loads = 0
+        self._last_sweep = time.monotonic()
+        self._documents = OrderedDict()  # doc_id -> (document, size, last_access)
+        self._lock = threading.Lock()
+        self._directory_ready = False
+
+    @staticmethod
+    def _sizeof(document: dict) -> int:
+        return len(json.dumps(document))
+
+    def _path(self, doc_id: str) -> str:
+        return os.path.join(self.directory, f"{doc_id}.json")
+
+    async def open(self):
+        """Create the directory, off the event loop. Otherwise done by the first write."""
+        if self.directory:
+            await run_in_service('documents', self._open)
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._directory_ready = True
+
+    def _write(self, doc_id: str, document: dict):
+        if not self._directory_ready:
+            self._open()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(document, f)
+        os.replace(tmp_path, self._path(doc_id))
+
+    def _load(self, doc_id: str):
+        path = self._path(doc_id)
+        try:
+            if os.path.getmtime(path) + self.ttl <= time.time():
+                os.remove(path)
+                return None
+            with open(path) as f:
+                document = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        self.disk_loads += 1
+        return document
+
+    def _remember(self, doc_id: str, document: dict):
+        size = self._sizeof(document)
+        with self._lock:
+            old = self._documents.pop(doc_id, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._documents[doc_id] = (document, size, time.monotonic())
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and len(self._documents) > 1:
+                _, (_, evicted_size, _) = self._documents.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def _sweep_disk(self):
+        """Delete expired documents from disk, at most once per TTL period."""
+        if self._last_sweep + self.ttl > time.monotonic():
+            return
+        self._last_sweep = time.monotonic()
+        cutoff = time.time() - self.ttl
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    if entry.name.endswith('.json') and entry.stat().st_mtime <= cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _persist(self, doc_id: str, document: dict):
+        self._write(doc_id, document)
+        self._sweep_disk()
+
+    async def put(self, doc_id: str, document: dict):
+        self._remember(doc_id, document)
+        if self.directory:
+            await run_in_service('documents', self._persist, doc_id, document)
+
+    async def get(self, doc_id: str):
+        """The document for `doc_id`, or None if it is unknown or expired."""
+        with self._lock:
+            entry = self._documents.get(doc_id)
+            if entry is not None:
+                document, size, last_access = entry
+                if last_access + self.ttl <= time.monotonic():
+                    del self._documents[doc_id]
+                    self.current_bytes -= size
+                    entry = None
+                else:
+                    self._documents[doc_id] = (document, size, time.monotonic())
+                    self._documents.move_to_end(doc_id)
+        if entry is not None:
+            return entry[0]
+        if self.directory:
+            document = await run_in_service('documents', self._load, doc_id)
+            if document is not None:
+                self._remember(doc_id, document)
+            return document
+        return None
+
+    async def update(self, doc_id: str, **fields):
+        """Merge derived artifacts (simplified output, audio IDs, ...) into a document."""
+        document = await self.get(doc_id)
+        if document is None:
+            return None
+        document = {**document, **fields}
+        await self.put(doc_id, document)
+        return document
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self._documents),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "disk_enabled": bool(self.directory),
+            "disk_loads": self.disk_loads,
+        }
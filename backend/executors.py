@@ -0,0 +1,167 @@
+"""Bounded per-service thread pools for blocking boto3, disk and SQLite calls.
+
+Each upstream service gets its own executor so a backlog on one of them
+(e.g. slow Titan image jobs) can't starve the others, and the event loop
+is never blocked by a synchronous AWS call. Local storage (cache files and
+SQLite databases) gets pools of its own for the same reason.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Service name -> (env var, default pool size)
+SERVICE_POOLS = {
+    'textract': ('TEXTRACT_POOL_SIZE', 8),
+    'bedrock-text': ('BEDROCK_TEXT_POOL_SIZE', 16),
+    'bedrock-image': ('BEDROCK_IMAGE_POOL_SIZE', 4),
+    'polly': ('POLLY_POOL_SIZE', 8),
+    'cache-db': ('CACHE_DB_POOL_SIZE', 2),
+    'blob-cache': ('BLOB_CACHE_POOL_SIZE', 4),
+    'documents': ('DOCUMENTS_POOL_SIZE', 2),
+    # One thread: job store transactions take the write lock, so more threads would only queue on it
+    'jobs-db': ('JOBS_DB_POOL_SIZE', 1),
+}
+
+_executors = {}
+_process_pool = None
+_lock = threading.Lock()
+
+
+def pool_size(service: str) -> int:
+    """Configured number of worker threads for a service."""
+    env_var, default = SERVICE_POOLS[service]
+    return max(1, int(os.getenv(env_var, default)))
+
+
+def get_executor(service: str) -> ThreadPoolExecutor:
+    executor = _executors.get(service)
+    if executor is None:
+        with _lock:
+            executor = _executors.get(service)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=pool_size(service),
+                    thread_name_prefix=f"pool-{service}",
+                )
+                _executors[service] = executor
+    return executor
+
+
+async def run_in_service(service: str, fn, *args, **kwargs):
+    """Run a blocking call on the service's (or local store's) pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(service), functools.partial(fn, *args, **kwargs))
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Shared pool for CPU-bound work (e.g. image processing) that would otherwise hold the GIL."""
+    global _process_pool
+    if _process_pool is None:
+        with _lock:
+            if _process_pool is None:
+                # spawn, not fork: the parent has live boto3 and executor threads
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=max(1, int(os.getenv('CPU_POOL_SIZE', min(4, os.cpu_count() or 1)))),
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return _process_pool
+
+
+async def run_in_process(fn, *args):
+    """Run a picklable, CPU-bound function in the process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), fn, *args)
+
+
+async def iterate_in_service(service: str, fn, *args, **kwargs):
+    """Consume a blocking iterator on the service's pool, yielding items on the loop.
+
+    `fn(*args, **kwargs)` must return an iterable; it is created and drained
+    entirely on a worker thread. Iteration stops early if the consumer goes away.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    finished = object()
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for item in fn(*args, **kwargs):
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (finished, e))
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, (finished, None))
+
+    loop.run_in_executor(get_executor(service), produce)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is finished:
+                if error is not None:
+                    raise error
+                break
+            yield item
+    finally:
+        stopped.set()
+
+
+async def ordered_map(fn, items, limit: int):
+    """Run `await fn(item)` for every item with at most `limit` in flight.
+
+    Results are yielded in input order as soon as each one (and everything
+    before it) is ready. Pending work is cancelled if the consumer stops early.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(item):
+        async with semaphore:
+            return await fn(item)
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def completed_map(fn, items, limit: int):
+    """Run `await fn(item)` for every item with at most `limit` in flight.
+
+    Yields `(index, result, error)` in completion order; a failing item
+    reports its exception instead of aborting the others.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(index, item):
+        async with semaphore:
+            try:
+                return index, await fn(item), None
+            except Exception as e:
+                return index, None, e
+
+    tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def shutdown_executors():
+    global _process_pool
+    with _lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
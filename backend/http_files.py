@@ -0,0 +1,86 @@
+"""Serving cached files with ETags, conditional GETs and byte ranges."""
+import os
+import re
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+READ_CHUNK_SIZE = 64 * 1024
+# Cached files are content-addressed, so their bytes never change
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _iter_file(path: str, start: int, length: int):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(READ_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def _parse_range(header: str, size: int):
+    """Return (start, end) inclusive for a single-range header.
+
+    Returns None for headers to ignore (malformed, or several ranges, which
+    aren't supported) so the whole file is served, and raises
+    RangeNotSatisfiable for a valid range that lies outside the file.
+    """
+    match = RANGE_HEADER.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.group(1), match.group(2)
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def cached_file_response(request: Request, path: str, media_type: str, etag: str) -> Response:
+    """Serve `path`, honouring If-None-Match and single byte-range requests."""
+    size = os.path.getsize(path)
+    quoted_etag = f'"{etag}"'
+    headers = {
+        "ETag": quoted_etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or quoted_etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    byte_range = None
+    if range_header and (not if_range or if_range.strip() == quoted_etag):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is not None:
+        start, end = byte_range
+        length = end - start + 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(_iter_file(path, start, length), status_code=206, media_type=media_type, headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_iter_file(path, 0, size), media_type=media_type, headers=headers)
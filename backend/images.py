@@ -0,0 +1,33 @@
+"""Re-encoded and resized variants of generated images.
+
+Pillow is optional: without it only the original PNG is served.
+"""
+import io
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = None
+
+IMAGE_FORMATS = {'png': 'image/png', 'webp': 'image/webp'}
+# Longest edge in pixels for each size; None keeps the original dimensions
+IMAGE_SIZES = {'full': None, 'medium': 256, 'thumb': 128}
+
+
+def variants_supported() -> bool:
+    return Image is not None
+
+
+def render_variant(png_bytes: bytes, image_format: str, size: str) -> bytes:
+    """Re-encode a PNG as `image_format`, downscaled to `size`."""
+    with Image.open(io.BytesIO(png_bytes)) as image:
+        image.load()
+        max_edge = IMAGE_SIZES[size]
+        if max_edge:
+            image.thumbnail((max_edge, max_edge))
+        output = io.BytesIO()
+        if image_format == 'webp':
+            image.save(output, format='WEBP', quality=80, method=4)
+        else:
+            image.save(output, format='PNG', optimize=True)
+        return output.getvalue()
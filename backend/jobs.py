@@ -0,0 +1,653 @@
+"""Persistent background jobs for batches of documents.
+
+A job is a batch of uploaded files; each file is one item that runs
+through the document pipeline (see pipeline.py). Jobs, items, finished
+stage results and progress events live in SQLite and the uploaded files
+in a directory, so after a restart finished stages are not run again and
+interrupted items are picked up where they left off.
+
+Items are claimed with a lease the worker keeps renewing, so several
+uvicorn workers can share one queue and an item held by a crashed process
+becomes claimable again once its lease runs out (until it has used up its
+attempts). Stage results and final statuses are only written while the
+worker still holds the lease, so a worker that lost it can't overwrite the
+new owner's progress. Upstream calls made by
+job workers run under `bulk_priority()`, so interactive requests always
+go ahead of them. `JobStore` is blocking; `JobQueue` runs every store call
+on the single-thread 'jobs-db' executor, so waiting for another worker's
+write lock never stalls the event loop.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+from fastapi import HTTPException
+
+from admission import bulk_priority
+from executors import run_in_service
+from pipeline import SkippedStage, run_stages
+from resilience import is_retryable
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying later: throttling, overload, open circuits, timeouts
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# Stage result fields small enough to repeat in progress events
+EVENT_FIELDS = ('doc_id', 'audio_id', 'audio_url', 'image_id', 'image_url')
+FINISHED_ITEM_STATES = ('done', 'failed', 'cancelled')
+INTERNAL_ERROR = {"stage": None, "detail": "An internal error occurred.", "status_code": 500}
+INTERRUPTED_ERROR = {"stage": None, "detail": "Processing was interrupted too many times.", "status_code": 500}
+
+
+class LeaseLost(Exception):
+    """The item's lease expired and it was claimed again (or released) meanwhile."""
+
+    def __init__(self, item: dict):
+        super().__init__(f"Lost the lease on job item {item['job_id']}/{item['index']}")
+
+
+class JobStore:
+    """SQLite tables for jobs, their items and their progress events."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._opened = False
+        self._open_lock = threading.Lock()
+
+    def open(self):
+        """Create the database and its tables. Done on first use unless called earlier, e.g. at startup."""
+        self._connect()
+
+    @staticmethod
+    def _create_tables(conn):
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                priority INTEGER NOT NULL,
+                options TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                cancelled INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                file_name TEXT NOT NULL,
+                file_ext TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                path TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                stages TEXT NOT NULL DEFAULT '{}',
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                not_before REAL NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_until REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job_id, idx)
+            );
+            CREATE INDEX IF NOT EXISTS job_items_queue ON job_items (status, priority DESC, created_at);
+            CREATE TABLE IF NOT EXISTS job_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                type TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, seq);
+        """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self._opened:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._opened:
+            with self._open_lock:
+                if not self._opened:
+                    self._create_tables(conn)
+                    self._opened = True
+        return conn
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can't claim the same item
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def _add_event(self, conn, job_id: str, event_type: str, data: dict):
+        conn.execute(
+            "INSERT INTO job_events (job_id, type, data, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, event_type, json.dumps(data), time.time()),
+        )
+
+    def create_job(self, job_id: str, files: list, priority: int, options: dict):
+        """`files` is a list of dicts with file_name, file_ext, content_hash and path."""
+        now = time.time()
+        conn = self._transaction()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, priority, options, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, priority, json.dumps(options), len(files), now, now),
+            )
+            conn.executemany(
+                "INSERT INTO job_items (job_id, idx, file_name, file_ext, content_hash, path, priority, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?)",
+                [(job_id, index, f["file_name"], f["file_ext"], f["content_hash"], f["path"], priority, now, now)
+                 for index, f in enumerate(files)],
+            )
+            self._add_event(conn, job_id, "queued", {"job_id": job_id, "total": len(files)})
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def claim(self, owner: str, lease_seconds: float, max_attempts: int):
+        """Take the highest-priority runnable item. Expired leases count as runnable.
+
+        Items whose lease expired on their last attempt (e.g. they keep crashing
+        the process) are failed instead. Returns (the claimed item or None,
+        [(failed item, whether its job is now finished), ...]).
+        """
+        now = time.time()
+        conn = self._transaction()
+        try:
+            abandoned = []
+            for row in conn.execute(
+                "SELECT * FROM job_items WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, max_attempts),
+            ).fetchall():
+                abandoned.append(self._fail_abandoned(conn, self._item(row), now))
+            row = conn.execute(
+                "SELECT * FROM job_items WHERE (status = 'queued' AND not_before <= ?) "
+                "OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY priority DESC, created_at, idx LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE job_items SET status = 'running', lease_owner = ?, lease_until = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE job_id = ? AND idx = ?",
+                    (owner, now + lease_seconds, now, row["job_id"], row["idx"]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None, abandoned
+        item = self._item(row)
+        item["options"] = json.loads(conn.execute("SELECT options FROM jobs WHERE id = ?", (item["job_id"],)).fetchone()[0])
+        item["status"] = "running"
+        item["attempts"] += 1
+        item["lease_owner"] = owner
+        return item, abandoned
+
+    def _fail_abandoned(self, conn, item: dict, now: float):
+        conn.execute(
+            "UPDATE job_items SET status = 'failed', error = ?, lease_owner = NULL, lease_until = NULL, updated_at = ? "
+            "WHERE job_id = ? AND idx = ?",
+            (json.dumps([INTERRUPTED_ERROR]), now, item["job_id"], item["index"]),
+        )
+        self._add_event(conn, item["job_id"], "item_failed", {
+            "index": item["index"], "file_name": item["file_name"], "attempts": item["attempts"], "errors": [INTERRUPTED_ERROR],
+        })
+        return item, self._maybe_finish_job(conn, item["job_id"], now)
+
+    def renew(self, job_id: str, index: int, owner: str, lease_seconds: float) -> bool:
+        """Extend the lease; False if `owner` no longer holds it."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE job_items SET lease_until = ? WHERE job_id = ? AND idx = ? AND lease_owner = ? AND status = 'running'",
+                (time.time() + lease_seconds, job_id, index, owner),
+            ).rowcount > 0
+
+    def save_stage(self, item: dict, stage: str, result: dict):
+        """Store a finished stage; raises LeaseLost if the item's lease has moved on."""
+        conn = self._transaction()
+        try:
+            updated = conn.execute(
+                "UPDATE job_items SET stages = ?, updated_at = ? WHERE job_id = ? AND idx = ? AND lease_owner = ? AND status = 'running'",
+                (json.dumps({**item["stages"], stage: result}), time.time(), item["job_id"], item["index"], item["lease_owner"]),
+            ).rowcount
+            if not updated:
+                raise LeaseLost(item)
+            self._add_event(conn, item["job_id"], "stage", {
+                "index": item["index"],
+                "file_name": item["file_name"],
+                "stage": stage,
+                **{field: result[field] for field in EVENT_FIELDS if field in result},
+            })
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        item["stages"][stage] = result
+
+    def finish(self, item: dict, status: str, errors: list = None, retry_at: float = None):
+        """Mark an item done or failed, or queue it again at `retry_at`.
+
+        Returns (the item's new status, whether the whole job is now finished).
+        Raises LeaseLost if the item's lease has moved on.
+        """
+        now = time.time()
+        conn = self._transaction()
+        try:
+            cancelled = conn.execute("SELECT cancelled FROM jobs WHERE id = ?", (item["job_id"],)).fetchone()[0]
+            if retry_at is not None:
+                status = "queued"
+                if cancelled:
+                    status, retry_at = "cancelled", None
+            updated = conn.execute(
+                "UPDATE job_items SET status = ?, error = ?, not_before = ?, lease_owner = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE job_id = ? AND idx = ? AND lease_owner = ? AND status = 'running'",
+                (status, json.dumps(errors) if errors else None,
+                 retry_at or 0, now, item["job_id"], item["index"], item["lease_owner"]),
+            ).rowcount
+            if not updated:
+                raise LeaseLost(item)
+            event = {"index": item["index"], "file_name": item["file_name"], "attempts": item["attempts"]}
+            if errors:
+                event["errors"] = errors
+            if retry_at is not None:
+                event["retry_in_seconds"] = round(retry_at - now, 1)
+            self._add_event(conn, item["job_id"], "item_retry" if retry_at is not None else f"item_{status}", event)
+            job_finished = self._maybe_finish_job(conn, item["job_id"], now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return status, job_finished
+
+    def _maybe_finish_job(self, conn, job_id: str, now: float) -> bool:
+        counts = self._counts(conn, job_id)
+        conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+        if counts.get("queued", 0) or counts.get("running", 0):
+            return False
+        cancelled = conn.execute("SELECT cancelled FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+        self._add_event(conn, job_id, "done", {"job_id": job_id, "status": job_status(counts, bool(cancelled)), "counts": counts})
+        return True
+
+    def cancel(self, job_id: str):
+        """Cancel the job's queued items. Running items finish their current attempt. Returns the job or None."""
+        now = time.time()
+        conn = self._transaction()
+        try:
+            if conn.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE jobs SET cancelled = 1, updated_at = ? WHERE id = ?", (now, job_id))
+            conn.execute(
+                "UPDATE job_items SET status = 'cancelled', updated_at = ? WHERE job_id = ? AND status = 'queued'",
+                (now, job_id),
+            )
+            self._add_event(conn, job_id, "cancelled", {"job_id": job_id})
+            self._maybe_finish_job(conn, job_id, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.job(job_id)
+
+    def release(self, owner: str) -> int:
+        """Put items this process was working on back in the queue (clean shutdown)."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE job_items SET status = 'queued', lease_owner = NULL, lease_until = NULL, "
+                "attempts = MAX(0, attempts - 1) WHERE lease_owner = ? AND status = 'running'",
+                (owner,),
+            ).rowcount
+
+    def events(self, job_id: str, after: int = 0, limit: int = 500) -> list:
+        rows = self._connect().execute(
+            "SELECT seq, type, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (job_id, after, limit),
+        ).fetchall()
+        return [(row["seq"], row["type"], json.loads(row["data"])) for row in rows]
+
+    @staticmethod
+    def _counts(conn, job_id: str) -> dict:
+        rows = conn.execute(
+            "SELECT status, COUNT(*) AS n FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+        ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    @staticmethod
+    def _item(row) -> dict:
+        return {
+            "job_id": row["job_id"],
+            "index": row["idx"],
+            "file_name": row["file_name"],
+            "file_ext": row["file_ext"],
+            "content_hash": row["content_hash"],
+            "path": row["path"],
+            "status": row["status"],
+            "stages": json.loads(row["stages"]),
+            "errors": json.loads(row["error"]) if row["error"] else [],
+            "attempts": row["attempts"],
+        }
+
+    def job(self, job_id: str):
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        counts = self._counts(conn, job_id)
+        items = conn.execute("SELECT * FROM job_items WHERE job_id = ? ORDER BY idx", (job_id,)).fetchall()
+        return {
+            "job_id": job_id,
+            "status": job_status(counts, bool(row["cancelled"])),
+            "priority": row["priority"],
+            "options": json.loads(row["options"]),
+            "total": row["total"],
+            "counts": counts,
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "items": [self._item(item) for item in items],
+        }
+
+    def purge(self, older_than: float) -> list:
+        """Delete finished jobs last updated before `older_than`. Returns their IDs."""
+        conn = self._transaction()
+        try:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE updated_at < ? AND NOT EXISTS ("
+                "SELECT 1 FROM job_items WHERE job_id = jobs.id AND status IN ('queued', 'running'))",
+                (older_than,),
+            ).fetchall()
+            job_ids = [row["id"] for row in rows]
+            for job_id in job_ids:
+                for table, column in (("job_events", "job_id"), ("job_items", "job_id"), ("jobs", "id")):
+                    conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (job_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return job_ids
+
+    def stats(self) -> dict:
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM job_items GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+def job_status(counts: dict, cancelled: bool) -> str:
+    if counts.get("running", 0):
+        return "running"
+    if counts.get("queued", 0):
+        return "running" if any(counts.get(state, 0) for state in FINISHED_ITEM_STATES) else "queued"
+    if cancelled:
+        return "cancelled"
+    if counts.get("failed", 0):
+        return "failed" if not counts.get("done", 0) else "completed_with_errors"
+    return "completed"
+
+
+class JobQueue:
+    """Worker pool running queued job items through `build_stages(item)`.
+
+    `describe_error(stage, error)` turns a stage failure into the JSON-safe
+    dict stored with the item. Failures whose status is in
+    RETRYABLE_STATUS_CODES (and store errors such as a locked database) are
+    retried with a growing delay up to `max_attempts`; finished stages are
+    kept between attempts. Store calls that fail are retried with backoff;
+    a worker only stops when the queue is stopped.
+    """
+
+    def __init__(self, store: JobStore, directory: str, build_stages, describe_error, workers: int = 2,
+                 lease_seconds: float = 60.0, max_attempts: int = 3, retry_delay: float = 30.0,
+                 poll_interval: float = 1.0):
+        self.store = store
+        self.directory = directory
+        self.build_stages = build_stages
+        self.describe_error = describe_error
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.owner = uuid.uuid4().hex
+        self.items_done = 0
+        self.items_failed = 0
+        self.items_retried = 0
+        self._tasks = []
+        self._running = False
+        self._wake = asyncio.Event()
+        self._changed = asyncio.Event()
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.directory, job_id)
+
+    @staticmethod
+    async def _db(fn, *args):
+        return await run_in_service('jobs-db', fn, *args)
+
+    async def _store(self, fn, *args):
+        """`_db` that waits out a locked or busy database instead of giving up."""
+        delay = self.poll_interval
+        while True:
+            try:
+                return await self._db(fn, *args)
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Job store call {fn.__name__} failed, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.lease_seconds / 3)
+
+    async def open(self):
+        """Create the file directory and the store's tables off the event loop."""
+        await self._db(self._open)
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.store.open()
+
+    async def job(self, job_id: str):
+        return await self._db(self.store.job, job_id)
+
+    async def events(self, job_id: str, after: int = 0) -> list:
+        return await self._db(self.store.events, job_id, after)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._running = True
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} job worker(s)")
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        # wait_for can swallow a cancellation that races its timeout (Python < 3.12), so also flag it
+        self._running = False
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        released = await self._db(self.store.release, self.owner)
+        if released:
+            logger.info(f"Returned {released} unfinished job item(s) to the queue")
+
+    async def submit(self, job_id: str, files: list, priority: int, options: dict):
+        await self._db(self.store.create_job, job_id, files, priority, options)
+        self._notify()
+
+    async def cancel(self, job_id: str):
+        job = await self._db(self._cancel, job_id)
+        if job is not None:
+            self._notify()
+        return job
+
+    def _cancel(self, job_id: str):
+        job = self.store.cancel(job_id)
+        if job is not None:
+            for item in job["items"]:
+                if item["status"] == "cancelled":
+                    self._remove_file(item)
+            if job["status"] == "cancelled":
+                shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        return job
+
+    def _notify(self):
+        self._wake.set()
+        # Wake event subscribers; each waits on the Event current when it started waiting
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_events(self, timeout: float):
+        """Return when new events may be available (or after `timeout`, for other processes' events)."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _worker(self):
+        while self._running:
+            try:
+                item = await self._db(self._claim)
+            except sqlite3.OperationalError as e:
+                # Another process holds the write lock for longer than the busy timeout
+                logger.warning(f"Could not claim a job item: {e}")
+                item = None
+            except Exception as e:
+                logger.error(f"Could not claim a job item: {e}", exc_info=True)
+                item = None
+            if item is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(item)
+            except asyncio.CancelledError:
+                raise
+            except LeaseLost as e:
+                logger.warning(f"{e}; dropping this attempt's result")
+            except Exception as e:
+                logger.error(f"Job item {item['job_id']}/{item['index']} crashed: {e}", exc_info=True)
+                try:
+                    if isinstance(e, sqlite3.OperationalError) and item["attempts"] < self.max_attempts:
+                        await self._retry_later(item, [INTERNAL_ERROR])
+                    else:
+                        await self._finish(item, "failed", [INTERNAL_ERROR])
+                except asyncio.CancelledError:
+                    raise
+                except LeaseLost as lost:
+                    logger.warning(f"{lost}; dropping this attempt's result")
+                except Exception as finish_error:
+                    # The lease runs out and the item is claimed again (or failed once out of attempts)
+                    logger.error(f"Could not finish job item {item['job_id']}/{item['index']}: {finish_error}", exc_info=True)
+
+    def _claim(self):
+        item, abandoned = self.store.claim(self.owner, self.lease_seconds, self.max_attempts)
+        for failed_item, job_finished in abandoned:
+            logger.warning(f"Job item {failed_item['job_id']}/{failed_item['index']} failed: lease expired on its last attempt")
+            self.items_failed += 1
+            self._cleanup(failed_item, "failed", job_finished)
+        return item
+
+    async def _heartbeat(self, item: dict):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                held = await self._db(self.store.renew, item["job_id"], item["index"], self.owner, self.lease_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Try again next beat; the lease is only lost if this keeps failing
+                logger.warning(f"Could not renew the lease on job item {item['job_id']}/{item['index']}: {e}")
+                continue
+            if not held:
+                logger.warning(f"Lost the lease on job item {item['job_id']}/{item['index']}")
+                return
+
+    async def _run(self, item: dict):
+        logger.info(f"Job {item['job_id']}: processing {item['file_name']} (attempt {item['attempts']})")
+        heartbeat = asyncio.ensure_future(self._heartbeat(item))
+        errors = []
+        try:
+            # Tasks started inside inherit the bulk priority through the context
+            with bulk_priority():
+                stages = run_stages(self.build_stages(item), completed=item["stages"])
+                try:
+                    async for name, result, error, _ in stages:
+                        if error is None:
+                            await self._store(self.store.save_stage, item, name, result)
+                            self._notify()
+                        elif not isinstance(error, SkippedStage):
+                            errors.append((name, error))
+                finally:
+                    # Cancels stages still running if the lease was lost
+                    await stages.aclose()
+        finally:
+            heartbeat.cancel()
+
+        if not errors:
+            await self._finish(item, "done")
+            return
+        described = [self.describe_error(name, error) for name, error in errors]
+        retryable = all(is_retryable(error) or (isinstance(error, HTTPException) and error.status_code in RETRYABLE_STATUS_CODES)
+                        for _, error in errors)
+        if retryable and item["attempts"] < self.max_attempts:
+            await self._retry_later(item, described)
+        else:
+            await self._finish(item, "failed", described)
+
+    async def _retry_later(self, item: dict, errors: list):
+        self.items_retried += 1
+        await self._finish(item, "queued", errors, retry_at=time.time() + self.retry_delay * item["attempts"])
+
+    async def _finish(self, item: dict, status: str, errors: list = None, retry_at: float = None):
+        status = await self._store(self._finish_item, item, status, errors, retry_at)
+        if status == "done":
+            self.items_done += 1
+        elif status == "failed":
+            self.items_failed += 1
+        self._notify()
+
+    def _finish_item(self, item: dict, status: str, errors: list, retry_at: float) -> str:
+        status, job_finished = self.store.finish(item, status, errors, retry_at)
+        self._cleanup(item, status, job_finished)
+        return status
+
+    def _cleanup(self, item: dict, status: str, job_finished: bool):
+        if status != "queued":
+            self._remove_file(item)
+        if job_finished:
+            shutil.rmtree(self.job_dir(item["job_id"]), ignore_errors=True)
+
+    @staticmethod
+    def _remove_file(item: dict):
+        try:
+            os.remove(item["path"])
+        except FileNotFoundError:
+            pass
+
+    async def purge(self, retention_seconds: float):
+        await self._db(self._purge, time.time() - retention_seconds)
+
+    def _purge(self, older_than: float):
+        for job_id in self.store.purge(older_than):
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    async def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "items_by_status": await self._db(self.store.stats),
+            "items_done": self.items_done,
+            "items_failed": self.items_failed,
+            "items_retried": self.items_retried,
+        }
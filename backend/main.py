@@ -1,28 +1,46 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Path, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-import boto3
 import os
-from dotenv import load_dotenv
 import tempfile
 from typing import Optional, List
 import logging
 import json
 import base64
+import re
+import asyncio
+import shutil
+import time
+import uuid
+from aws_clients import AWSClients, load_environment
+
+# Load environment variables before the modules below read their settings
+load_environment()
+
+from executors import completed_map, iterate_in_service, ordered_map, pool_size, run_in_process, shutdown_executors
+from admission import admission_controllers, admitted
+from metrics import METRICS_ENABLED, MetricsMiddleware, observe_preprocess, observe_upstream, register_caches, span
+from metrics import render as render_metrics
+from resilience import CircuitOpen, get_breaker, is_retryable, record_outcome, resilience_stats, resilient_call
+from cache import DiskBlobCache, ExtractionCache, LRUCache, SingleFlight, sha256_hex
+from streaming import IncrementalJSONParser, sse_event
+from chunking import chunk_paragraphs, chunk_sentences
+from http_files import cached_file_response
+from pdf_pages import Pages, PdfPages, StaticPages
+from pipeline import SkippedStage, Stage, run_stages
+from jobs import JobQueue, JobStore
+from ocr_images import preprocess_for_ocr, preprocessing_supported
+from uploads import MULTIPART_OVERHEAD_BYTES, SNIFF_BYTES, UPLOAD_CHUNK_BYTES, UploadLimitMiddleware, UploadStats, UploadTooLarge, copy_stream, hash_stream, read_stream, same_type, sniff_extension
+from documents import DocumentStore
+from retrieval import BM25Index, RetrievalStats, estimate_tokens
+from images import IMAGE_FORMATS, render_variant, variants_supported
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 import json
 
-# Load environment variables
-load_dotenv()
-
-# Debug: Print environment variables (without secret)
-logger.info(f"AWS Access Key ID: {os.getenv('AWS_ACCESS_KEY_ID')[:5]}...")
-logger.info(f"AWS Region: {os.getenv('AWS_REGION')}")
-
 app = FastAPI()
 
 # Configure CORS
@@ -37,6 +55,65 @@ app.add_middleware(
 # Constants
 MAX_FILE_SIZE = 25 * 1024 * 1024  # 25MB
 ALLOWED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png'}
+UPLOAD_PATHS = ('/upload', '/upload/stream', '/process')
+JOB_MAX_BATCH_BYTES = int(os.getenv('JOB_MAX_BATCH_MB', '500')) * 1024 * 1024
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+upload_stats = UploadStats()
+# Oversized bodies are rejected before the multipart parser buffers them
+app.add_middleware(
+    UploadLimitMiddleware,
+    paths=UPLOAD_PATHS,
+    max_body_bytes=MAX_FILE_SIZE + MULTIPART_OVERHEAD_BYTES,
+    max_file_bytes=MAX_FILE_SIZE,
+    stats=upload_stats,
+)
+# Job batches hold many files, so they get their own (larger) limit
+app.add_middleware(
+    UploadLimitMiddleware,
+    paths=('/jobs',),
+    max_body_bytes=JOB_MAX_BATCH_BYTES,
+    max_file_bytes=JOB_MAX_BATCH_BYTES,
+    stats=upload_stats,
+)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Content-addressed cache of extracted text, keyed by SHA-256 of the uploaded bytes.
+# Set EXTRACTION_CACHE_DB to a SQLite path to persist it and share it across workers.
+extraction_cache = ExtractionCache(
+    max_bytes=int(os.getenv('EXTRACTION_CACHE_MAX_MB', '64')) * 1024 * 1024,
+    db_path=os.getenv('EXTRACTION_CACHE_DB') or None
+)
+
+# Server-side document sessions, so follow-up calls can send a doc_id instead of the text.
+# Set DOCUMENT_STORE_DIR to also keep documents on disk, shared across workers.
+document_store = DocumentStore(
+    ttl=float(os.getenv('DOCUMENT_TTL_SECONDS', str(6 * 60 * 60))),
+    max_bytes=int(os.getenv('DOCUMENT_STORE_MAX_MB', '128')) * 1024 * 1024,
+    directory=os.getenv('DOCUMENT_STORE_DIR') or None
+)
+
+async def register_document(content_hash: str, extracted_text: str, file_name: str, file_type: str) -> str:
+    """Store extracted text under an ID derived from the file hash and return the ID.
+
+    Re-uploading the same file keeps any artifacts already derived from it.
+    """
+    doc_id = content_hash[:32]
+    existing = await document_store.get(doc_id) or {}
+    await document_store.put(doc_id, {
+        **existing,
+        "extracted_text": extracted_text,
+        "file_name": file_name,
+        "file_type": file_type,
+    })
+    return doc_id
+
+async def get_document(doc_id: str) -> dict:
+    document = await document_store.get(doc_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found or expired. Please upload the file again.")
+    return document
 
 # Response Models
 class TextExtractionResponse(BaseModel):
@@ -44,6 +121,7 @@ class TextExtractionResponse(BaseModel):
     extracted_text: str
     file_name: str
     file_type: str
+    doc_id: Optional[str] = None
 
 class TextSimplificationResponse(BaseModel):
     simplified_text: str
@@ -51,7 +129,9 @@ class TextSimplificationResponse(BaseModel):
     step_by_step: List[str]
 
 class NarrationResponse(BaseModel):
-    audio_base64: str
+    audio_base64: Optional[str] = None
+    audio_id: Optional[str] = None
+    audio_url: Optional[str] = None
 
 class ErrorResponse(BaseModel):
     detail: str
@@ -60,7 +140,11 @@ class TextSimplificationRequest(BaseModel):
     text: str
 
 class NarrationRequest(BaseModel):
-    text: str
+    text: Optional[str] = None
+    # Narrate a registered document (its simplified text if available) instead of `text`
+    doc_id: Optional[str] = None
+    # Return a short audio ID/URL for GET /audio/{audio_id} instead of base64 audio
+    return_url: bool = False
 
 class VisualizeRequest(BaseModel):
     step_by_step: List[str]
@@ -69,6 +153,8 @@ class VisualizeResponse(BaseModel):
     steps: List[str]
     image_prompts: List[str]
     image_urls: List[str]
+    # Indexes of steps whose image could not be generated (their URL is empty)
+    failed_steps: List[int] = []
 
 class QARequest(BaseModel):
     context: str
@@ -77,94 +163,268 @@ class QARequest(BaseModel):
 class QAResponse(BaseModel):
     answer: str
 
-# Initialize AWS clients
-textract_client = boto3.client(
-    'textract',
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('AWS_REGION', 'us-east-1')
-)
+# AWS clients are built on first use (or by the startup warm-up) from one shared session.
+# Each client's connection pool is sized to match the thread pool(s) that call it,
+# so no worker thread ever waits on a botocore connection. Read timeouts match the
+# per-call deadlines in resilience.py.
+aws_clients = AWSClients()
+textract_client = aws_clients.register('textract', 'textract', pool_size('textract'), read_timeout=30)
 
-# Initialize Bedrock client if not present
-bedrock_client = boto3.client(
-    'bedrock-runtime',
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('AWS_REGION', 'us-east-1')
-)
+# Text and image generation share this client but run on separate pools.
+bedrock_client = aws_clients.register(
+    'bedrock', 'bedrock-runtime', pool_size('bedrock-text') + pool_size('bedrock-image'), read_timeout=60)
 
-polly_client = boto3.client(
-    'polly',
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('AWS_REGION', 'us-east-1')
-)
+polly_client = aws_clients.register('polly', 'polly', pool_size('polly'), read_timeout=20)
 
-@app.post("/upload", response_model=TextExtractionResponse, responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
-async def upload_file(file: UploadFile = File(...)):
+# Blocking helpers so retries, hedges and deadlines cover reading the response body too
+def invoke_bedrock_json(**kwargs) -> dict:
+    response = bedrock_client.invoke_model(**kwargs)
+    return json.loads(response['body'].read())
+
+def synthesize_speech_bytes(**kwargs) -> bytes:
+    response = polly_client.synthesize_speech(**kwargs)
+    audio_stream = response.get("AudioStream")
+    if not audio_stream:
+        raise RuntimeError("Polly did not return an audio stream.")
+    return audio_stream.read()
+
+@app.on_event("shutdown")
+async def shutdown_aws_executors():
+    if "jobs" in warmup_tasks:
+        # Don't start workers after shutdown
+        warmup_tasks["jobs"].cancel()
+    # Hand running job items back to the queue before their upstream calls are cut off
+    await job_queue.stop()
+    shutdown_executors()
+
+# Concurrent page-level Textract calls per PDF
+PDF_PAGE_CONCURRENCY = int(os.getenv('PDF_PAGE_CONCURRENCY', '4'))
+# Longer PDFs are rejected before any page is split out
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', '200'))
+
+async def read_upload(file: UploadFile):
+    """Validate a spooled upload without loading it whole. Returns (stream, file_ext, content_hash)."""
+    # 1. Validate the size the parser already counted
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        logger.error(f"Upload failed for {file.filename}: too large ({file.size} bytes)")
+        upload_stats.rejected_streaming += 1
+        raise UploadTooLarge(MAX_FILE_SIZE)
+
+    # 2. Detect the type from the magic bytes; the filename extension is only a hint
+    head = await file.read(SNIFF_BYTES)
+    await file.seek(0)
+    file_ext = os.path.splitext(file.filename or '')[1].lower()
+    sniffed_ext = sniff_extension(head)
+    if sniffed_ext is None:
+        error_msg = f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
+        logger.error(f"Upload failed for {file.filename}: {error_msg}")
+        upload_stats.rejected_type += 1
+        raise HTTPException(status_code=400, detail=error_msg)
+    if not same_type(file_ext, sniffed_ext):
+        logger.warning(f"{file.filename} looks like a {sniffed_ext} file; treating it as one")
+        file_ext = sniffed_ext
+
+    # 3. Hash in chunks straight from the spooled file
+    loop = asyncio.get_running_loop()
+    with span('read_upload'):
+        content_hash, size = await loop.run_in_executor(None, hash_stream, file.file)
+    spooled = getattr(file.file, '_rolled', False)
+    upload_stats.record_accepted(size, 0 if spooled else size, spooled)
+
+    return file.file, file_ext, content_hash
+
+def textract_http_error(error: Exception, file_name: str) -> HTTPException:
+    """Map a Textract failure to the HTTP error shown to the user."""
+    if isinstance(error, HTTPException):
+        # Already mapped, e.g. a 429/503 from admission control
+        return error
+    if isinstance(error, textract_client.exceptions.UnsupportedDocumentException):
+        logger.warning(f"Unsupported document format for {file_name}")
+        return HTTPException(
+            status_code=400,
+            detail="This document format is not supported by our text extraction service. Please try: 1) A different PDF file, 2) An image file (JPG, PNG), or 3) Ensure the PDF contains readable text (not scanned images)."
+        )
+    if isinstance(error, textract_client.exceptions.DocumentTooLargeException):
+        logger.warning(f"Document too large for {file_name}")
+        return HTTPException(
+            status_code=400,
+            detail="This document is too large to process. Please try a smaller file (under 25MB) or split the document into smaller parts."
+        )
+    if isinstance(error, textract_client.exceptions.BadDocumentException):
+        logger.warning(f"Bad document format for {file_name}")
+        return HTTPException(
+            status_code=400,
+            detail="The document appears to be corrupted or in an unsupported format. Please try a different file."
+        )
+    logger.error(f"Textract error for {file_name}: {error}")
+    return HTTPException(
+        status_code=500,
+        detail="Failed to extract text from the document. This might be due to the document format or content. Please try a different file."
+    )
+
+# Image uploads are made upright, grayscale and at most OCR_MAX_EDGE pixels before Textract
+OCR_PREPROCESS = os.getenv('OCR_PREPROCESS', '1') == '1' and preprocessing_supported()
+OCR_MAX_EDGE = int(os.getenv('OCR_MAX_EDGE', '2000'))
+OCR_JPEG_QUALITY = int(os.getenv('OCR_JPEG_QUALITY', '85'))
+
+# Background warm-up work; /ready reports 503 until all of it has finished
+warmup_tasks = {}
+
+@app.on_event("startup")
+async def start_warmup():
+    loop = asyncio.get_running_loop()
+    # Off the event loop and not awaited, so the server starts answering right away
+    warmup_tasks["aws_clients"] = loop.run_in_executor(None, aws_clients.warm)
+    # Spawning a worker (and importing Pillow in it) takes ~1s; pay it before the first upload
+    if OCR_PREPROCESS:
+        warmup_tasks["process_pool"] = asyncio.ensure_future(run_in_process(preprocessing_supported))
+    warmup_tasks["storage"] = asyncio.ensure_future(open_storage())
+    for name, task in warmup_tasks.items():
+        task.add_done_callback(lambda task, name=name: log_warmup_failure(name, task))
+
+async def open_storage():
+    """Create cache directories and tables and size the blob caches, each on its own pool.
+
+    Until this finishes, each store does the same on first use.
+    """
+    await asyncio.gather(
+        extraction_cache.open(),
+        document_store.open(),
+        image_cache.open(),
+        image_variant_cache.open(),
+        audio_cache.open(),
+    )
+
+def log_warmup_failure(name: str, task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Warm-up of {name} failed: {task.exception()}")
+
+async def preprocess_image(data: bytes, file_name: str) -> bytes:
+    started = time.monotonic()
     try:
-        # 1. Read the file content ONCE to avoid stream issues
-        content = await file.read()
-
-        # 2. Validate file size from the content we just read
-        if len(content) > MAX_FILE_SIZE:
-            error_msg = f"File size exceeds maximum limit of {MAX_FILE_SIZE/1024/1024:.1f}MB"
-            logger.error(f"Upload failed for {file.filename}: {error_msg}")
-            raise HTTPException(status_code=400, detail=error_msg)
-
-        # 3. Validate file extension from the filename
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in ALLOWED_EXTENSIONS:
-            error_msg = f"File type '{file_ext}' not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
-            logger.error(f"Upload failed for {file.filename}: {error_msg}")
-            raise HTTPException(status_code=400, detail=error_msg)
-
-        # 4. Process the file using the 'content' variable
-        try:
-            response = textract_client.detect_document_text(
-                Document={'Bytes': content}
-            )
-            
-            # Extract text from response
-            extracted_text = ' '.join([item['Text'] for item in response['Blocks'] if item['BlockType'] == 'LINE'])
-            
-            # Check if we got any text
-            if not extracted_text.strip():
-                raise HTTPException(
-                    status_code=400, 
-                    detail="No text could be extracted from this document. Please ensure the document contains readable text."
-                )
-            
-        except textract_client.exceptions.UnsupportedDocumentException:
-            logger.warning(f"Unsupported document format for {file.filename}")
-            raise HTTPException(
-                status_code=400,
-                detail="This document format is not supported by our text extraction service. Please try: 1) A different PDF file, 2) An image file (JPG, PNG), or 3) Ensure the PDF contains readable text (not scanned images)."
-            )
-        except textract_client.exceptions.DocumentTooLargeException:
-            logger.warning(f"Document too large for {file.filename}")
+        with span('preprocess'):
+            processed = await run_in_process(preprocess_for_ocr, data, OCR_MAX_EDGE, OCR_JPEG_QUALITY)
+    except Exception as e:
+        # Let Textract accept or reject the original with its usual errors
+        logger.warning(f"Image preprocessing failed for {file_name}: {e}")
+        return data
+    upload_stats.record_preprocess(len(data), len(processed), time.monotonic() - started)
+    observe_preprocess(len(data), len(processed))
+    logger.info(f"Preprocessed {file_name}: {len(data)} -> {len(processed)} bytes")
+    return processed
+
+async def document_pages(stream, file_ext: str, file_name: str = '') -> Pages:
+    """PDF pages are split out one by one as they're loaded; images are a single (preprocessed) page.
+
+    Takes ownership of `stream`: closing the returned pages closes it.
+    """
+    loop = asyncio.get_running_loop()
+    if file_ext == '.pdf':
+        with span('split_pages'):
+            pages = await loop.run_in_executor(None, PdfPages, stream)
+        if len(pages) > PDF_MAX_PAGES:
+            pages.close()
             raise HTTPException(
                 status_code=400,
-                detail="This document is too large to process. Please try a smaller file (under 25MB) or split the document into smaller parts."
+                detail=f"This document has {len(pages)} pages; at most {PDF_MAX_PAGES} can be processed at once. Please split it into smaller parts."
             )
-        except textract_client.exceptions.BadDocumentException:
-            logger.warning(f"Bad document format for {file.filename}")
-            raise HTTPException(
-                status_code=400,
-                detail="The document appears to be corrupted or in an unsupported format. Please try a different file."
+        return pages
+    try:
+        page = await loop.run_in_executor(None, read_stream, stream)
+    finally:
+        stream.close()
+    if OCR_PREPROCESS:
+        upload_stats.record_materialized(len(page))
+        page = await preprocess_image(page, file_name)
+    return StaticPages([page])
+
+async def detached_pages(stream, file_ext: str, file_name: str = '') -> Pages:
+    """document_pages() over a copy of the upload, for pages read after the handler returns."""
+    if file_ext == '.pdf':
+        stream = await asyncio.get_running_loop().run_in_executor(None, copy_stream, stream)
+    return await document_pages(stream, file_ext, file_name)
+
+async def extract_document_page(pages: Pages, index: int) -> str:
+    """Split out one page, extract it and drop its bytes."""
+    page = await asyncio.get_running_loop().run_in_executor(None, pages.load, index)
+    try:
+        # Textract needs each page as bytes; count every page of the document held at once
+        upload_stats.record_materialized(pages.peak_bytes)
+        return await extract_page_text(page)
+    finally:
+        pages.release(page)
+
+async def extract_page_text(page: bytes) -> str:
+    """Run Textract on one page, reusing the cached text of identical pages."""
+    page_hash = sha256_hex(page)
+    cached_text = await extraction_cache.get(page_hash)
+    if cached_text is not None:
+        return cached_text
+
+    with span('textract'):
+        response = await resilient_call(
+            'textract',
+            textract_client.detect_document_text,
+            Document={'Bytes': page}
+        )
+    
+    # Extract text from response
+    page_text = ' '.join([item['Text'] for item in response['Blocks'] if item['BlockType'] == 'LINE'])
+    await extraction_cache.set(page_hash, page_text)
+    return page_text
+
+NO_TEXT_DETAIL = "No text could be extracted from this document. Please ensure the document contains readable text."
+
+async def extract_text(pages: Pages, content_hash: str, file_name: str) -> str:
+    """Extract every page concurrently, stitch the text back in page order and cache it."""
+    try:
+        page_texts = [page_text async for page_text in ordered_map(
+            lambda index: extract_document_page(pages, index), range(len(pages)), PDF_PAGE_CONCURRENCY)]
+    except Exception as textract_error:
+        raise textract_http_error(textract_error, file_name)
+
+    extracted_text = ' '.join(page_text for page_text in page_texts if page_text)
+
+    # Check if we got any text
+    if not extracted_text.strip():
+        raise HTTPException(status_code=400, detail=NO_TEXT_DETAIL)
+
+    await extraction_cache.set(content_hash, extracted_text)
+    return extracted_text
+
+@app.post("/upload", response_model=TextExtractionResponse, responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
+async def upload_file(file: UploadFile = File(...)):
+    try:
+        stream, file_ext, content_hash = await read_upload(file)
+
+        # 4. Return the cached text if this exact document was already extracted
+        cached_text = await extraction_cache.get(content_hash)
+        if cached_text is not None:
+            logger.info(f"Extraction cache hit for {file.filename}")
+            return TextExtractionResponse(
+                message="File processed successfully",
+                extracted_text=cached_text,
+                file_name=file.filename,
+                file_type=file_ext,
+                doc_id=await register_document(content_hash, cached_text, file.filename, file_ext)
             )
+
+        # 5. Extract every page concurrently and stitch the text back in page order
+        try:
+            pages = await document_pages(stream, file_ext, file.filename)
         except Exception as textract_error:
-            logger.error(f"Textract error for {file.filename}: {textract_error}")
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to extract text from the document. This might be due to the document format or content. Please try a different file."
-            )
-        
+            raise textract_http_error(textract_error, file.filename)
+        try:
+            extracted_text = await extract_text(pages, content_hash, file.filename)
+        finally:
+            pages.close()
+
         return TextExtractionResponse(
             message="File processed successfully",
             extracted_text=extracted_text,
             file_name=file.filename,
-            file_type=file_ext
+            file_type=file_ext,
+            doc_id=await register_document(content_hash, extracted_text, file.filename, file_ext)
         )
             
     except HTTPException as he:
@@ -178,18 +438,71 @@ async def upload_file(file: UploadFile = File(...)):
             detail="An unexpected server error occurred while processing the file."
         )
 
-@app.post("/simplify")
-async def simplify_text(request: dict):
-    try:
-        text = request.get("text", "")
-        file_name = request.get("file_name", "Unknown file")
-        if not text:
-            raise HTTPException(status_code=400, detail="Text to simplify cannot be empty.")
+@app.post("/upload/stream")
+async def upload_file_stream(file: UploadFile = File(...)):
+    """Extract a document page by page, streaming NDJSON lines as each page completes."""
+    stream, file_ext, content_hash = await read_upload(file)
+    cached_text = await extraction_cache.get(content_hash)
+    pages = None if cached_text is not None else await detached_pages(stream, file_ext, file.filename)
+
+    def line(payload: dict) -> str:
+        return json.dumps(payload) + "\n"
+
+    async def body():
+        if cached_text is not None:
+            logger.info(f"Extraction cache hit for {file.filename}")
+            doc_id = await register_document(content_hash, cached_text, file.filename, file_ext)
+            yield line({"type": "done", "extracted_text": cached_text, "file_name": file.filename, "file_type": file_ext, "failed_pages": [], "doc_id": doc_id})
+            return
+
+        page_texts = [''] * len(pages)
+        failed_pages = []
+        try:
+            async for index, page_text, error in completed_map(
+                    lambda index: extract_document_page(pages, index), range(len(pages)), PDF_PAGE_CONCURRENCY):
+                if error is not None:
+                    failed_pages.append(index + 1)
+                    http_error = textract_http_error(error, file.filename)
+                    yield line({"type": "page_error", "page": index + 1, "page_count": len(pages), "detail": http_error.detail})
+                else:
+                    page_texts[index] = page_text
+                    yield line({"type": "page", "page": index + 1, "page_count": len(pages), "text": page_text})
+        finally:
+            pages.close()
+
+        extracted_text = ' '.join(page_text for page_text in page_texts if page_text)
+        if not extracted_text.strip():
+            yield line({"type": "error", "detail": NO_TEXT_DETAIL})
+            return
+        doc_id = None
+        if not failed_pages:
+            await extraction_cache.set(content_hash, extracted_text)
+            doc_id = await register_document(content_hash, extracted_text, file.filename, file_ext)
+        yield line({"type": "done", "extracted_text": extracted_text, "file_name": file.filename, "file_type": file_ext, "failed_pages": sorted(failed_pages), "doc_id": doc_id})
 
-        logger.info(f"Simplifying text for: {file_name}")
+    return StreamingResponse(body(), media_type="application/x-ndjson")
 
-        # Final, extremely strict prompt to force JSON output
-        prompt = f"""Your task is to convert the following text into a valid JSON object.
+SIMPLIFY_MODEL_ID = 'anthropic.claude-3-haiku-20240307-v1:0'
+# Bump whenever the simplify prompt changes so stale cached results are not served
+SIMPLIFY_PROMPT_VERSION = 'v1'
+# Cheaper model used while the primary model's circuit is open and nothing (even stale) is cached
+SIMPLIFY_FALLBACK_MODEL_ID = os.getenv('SIMPLIFY_FALLBACK_MODEL_ID', 'meta.llama3-8b-instruct-v1:0')
+
+# Successful /simplify results, keyed on normalized text + model + prompt version
+simplify_cache = LRUCache(
+    max_bytes=int(os.getenv('SIMPLIFY_CACHE_MAX_MB', '32')) * 1024 * 1024,
+    sizeof=lambda content: len(json.dumps(content)),
+    ttl=float(os.getenv('SIMPLIFY_CACHE_TTL_SECONDS', '3600'))
+)
+simplify_flights = SingleFlight()
+
+def simplify_cache_key(text: str, model_id: str = SIMPLIFY_MODEL_ID) -> str:
+    normalized = ' '.join(text.split())
+    return sha256_hex(f"{model_id}|{SIMPLIFY_PROMPT_VERSION}|{normalized}".encode('utf-8'))
+
+def build_simplify_prompt(text: str) -> str:
+    # Final, extremely strict prompt to force JSON output
+    return f"""Your task is to convert the following text into a valid JSON object.
 Your response MUST start with `{{` and end with `}}`. Do not include any other text, comments, or markdown.
 
 <text_to_convert>
@@ -202,42 +515,191 @@ The JSON object must have these exact keys:
 - "step_by_step": An array of strings explaining the process step-by-step.
 """
 
-        response = bedrock_client.invoke_model(
-            modelId='anthropic.claude-3-haiku-20240307-v1:0',
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 2048,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [{"type": "text", "text": prompt}]
-                    }
-                ]
-            })
+def build_simplify_body(text: str, model_id: str = SIMPLIFY_MODEL_ID) -> str:
+    if model_id.startswith('meta.'):
+        return json.dumps({
+            "prompt": build_simplify_prompt(text),
+            "max_gen_len": 2048,
+            "temperature": 0.2
+        })
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 2048,
+        "messages": [
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": build_simplify_prompt(text)}]
+            }
+        ]
+    })
+
+SIMPLIFY_FALLBACK = {
+    "simplified_text": "Tobi had trouble simplifying this text. Please try again with a different document.",
+    "key_terms": [],
+    "step_by_step": []
+}
+
+async def invoke_simplify_model(text: str, file_name: str, model_id: str = SIMPLIFY_MODEL_ID):
+    """Call Bedrock once and parse its JSON. Returns (content, parsed_ok)."""
+    with span('bedrock'):
+        response_body = await resilient_call(
+            'bedrock-text',
+            invoke_bedrock_json,
+            name=model_id,
+            idempotent=False,
+            modelId=model_id,
+            body=build_simplify_body(text, model_id)
         )
-        
-        response_body = json.loads(response['body'].read())
+    
+    if model_id.startswith('meta.'):
+        generated_text = response_body.get('generation', '{}').strip()
+    else:
         generated_text = response_body.get('content', [{}])[0].get('text', '{}').strip()
 
-        # Most robust JSON parsing method
+    # Most robust JSON parsing method
+    try:
+        # Use regex to find the JSON block, even with leading/trailing text
+        match = re.search(r'{.*}', generated_text, re.DOTALL)
+        if match:
+            json_str = match.group(0)
+            with span('parse_json'):
+                return json.loads(json_str), True
+        else:
+            raise ValueError("No valid JSON object found in the model's response via regex.")
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.error(f"Final attempt to parse JSON failed for {file_name}: {e}\\nResponse text: {generated_text}")
+        return dict(SIMPLIFY_FALLBACK), False
+
+def is_simplify_fallback(content: dict) -> bool:
+    return content.get("simplified_text") == SIMPLIFY_FALLBACK["simplified_text"]
+
+async def simplify_with_cache(text: str, file_name: str) -> dict:
+    key = simplify_cache_key(text)
+    cached = simplify_cache.get(key)
+    if cached is not None:
+        logger.info(f"Simplify cache hit for: {file_name}")
+        return cached
+
+    async def compute():
         try:
-            import re
-            # Use regex to find the JSON block, even with leading/trailing text
-            match = re.search(r'{.*}', generated_text, re.DOTALL)
-            if match:
-                json_str = match.group(0)
-                simplified_content = json.loads(json_str)
-            else:
-                raise ValueError("No valid JSON object found in the model's response via regex.")
-        except (json.JSONDecodeError, ValueError, ImportError) as e:
-            logger.error(f"Final attempt to parse JSON failed for {file_name}: {e}\\nResponse text: {generated_text}")
-            simplified_content = {
-                "simplified_text": "Tobi had trouble simplifying this text. Please try again with a different document.",
-                "key_terms": [],
-                "step_by_step": []
-            }
-        
-        return simplified_content
+            content, parsed_ok = await invoke_simplify_model(text, file_name)
+        except CircuitOpen:
+            return await simplify_degraded(text, file_name, key)
+        # Never cache the fallback payload, so the next request retries Bedrock
+        if parsed_ok:
+            simplify_cache.set(key, content)
+        return content
+
+    # Concurrent identical requests all wait on the same Bedrock call
+    return await simplify_flights.do(key, compute)
+
+async def simplify_degraded(text: str, file_name: str, key: str) -> dict:
+    """Serve a stale cached result, else the fallback model, while the primary model's circuit is open."""
+    stale = simplify_cache.get(key, allow_stale=True)
+    if stale is not None:
+        logger.warning(f"Serving stale simplification for {file_name}: {SIMPLIFY_MODEL_ID} circuit is open")
+        return stale
+    if not SIMPLIFY_FALLBACK_MODEL_ID or get_breaker(SIMPLIFY_FALLBACK_MODEL_ID).is_open():
+        raise CircuitOpen(SIMPLIFY_MODEL_ID, get_breaker(SIMPLIFY_MODEL_ID).reset_timeout)
+    logger.warning(f"Simplifying {file_name} with {SIMPLIFY_FALLBACK_MODEL_ID}: {SIMPLIFY_MODEL_ID} circuit is open")
+    fallback_key = simplify_cache_key(text, SIMPLIFY_FALLBACK_MODEL_ID)
+    cached = simplify_cache.get(fallback_key)
+    if cached is not None:
+        return cached
+    content, parsed_ok = await invoke_simplify_model(text, file_name, SIMPLIFY_FALLBACK_MODEL_ID)
+    if parsed_ok:
+        simplify_cache.set(fallback_key, content)
+    return content
+
+# Texts longer than this are simplified chunk by chunk and merged
+SIMPLIFY_CHUNK_CHARS = int(os.getenv('SIMPLIFY_CHUNK_CHARS', '6000'))
+# Concurrent Bedrock calls per chunked simplification
+SIMPLIFY_CHUNK_CONCURRENCY = int(os.getenv('SIMPLIFY_CHUNK_CONCURRENCY', '4'))
+
+STEP_NUMBER_PREFIX = re.compile(r'^\s*(?:step\s*)?\d+\s*[.):-]\s*', re.IGNORECASE)
+
+def normalize_term(term: str) -> str:
+    return ' '.join(term.lower().split()).strip(' .,:;')
+
+def merge_simplified(parts: List[dict]) -> dict:
+    """Merge per-chunk results: join the text, dedupe key terms, renumber steps in order."""
+    key_terms = []
+    seen_terms = set()
+    for part in parts:
+        for key_term in part.get("key_terms", []):
+            normalized = normalize_term(str(key_term.get("term", "")))
+            if normalized and normalized not in seen_terms:
+                seen_terms.add(normalized)
+                key_terms.append(key_term)
+
+    # Drop any numbering the model added per chunk; the client numbers the merged list
+    steps = [
+        STEP_NUMBER_PREFIX.sub('', step, count=1)
+        for part in parts
+        for step in part.get("step_by_step", [])
+    ]
+
+    return {
+        "simplified_text": "\n\n".join(part.get("simplified_text", "").strip() for part in parts),
+        "key_terms": key_terms,
+        "step_by_step": steps,
+    }
+
+async def simplify_chunked(text: str, file_name: str) -> dict:
+    """Map-reduce simplification: each chunk is simplified (and cached) independently.
+
+    Chunks that fell back are left out of the merge and listed (1-based) in
+    "failed_chunks"; retrying only calls the model for those, the rest are cached.
+    """
+    chunks = chunk_paragraphs(text, SIMPLIFY_CHUNK_CHARS)
+    if len(chunks) <= 1:
+        return await simplify_with_cache(text, file_name)
+
+    logger.info(f"Simplifying {file_name} in {len(chunks)} chunks")
+    results = [
+        result async for result in ordered_map(
+            lambda chunk: simplify_with_cache(chunk, file_name), chunks, SIMPLIFY_CHUNK_CONCURRENCY
+        )
+    ]
+    parts = [result for result in results if not is_simplify_fallback(result)]
+    if not parts:
+        return dict(SIMPLIFY_FALLBACK)
+    failed_chunks = [index + 1 for index, result in enumerate(results) if is_simplify_fallback(result)]
+    if failed_chunks:
+        logger.warning(f"{len(failed_chunks)} of {len(results)} chunks could not be simplified for {file_name}")
+    return {**merge_simplified(parts), "failed_chunks": failed_chunks}
+
+async def simplify_document(text: str, file_name: str, doc_id: Optional[str] = None, chunked: Optional[bool] = None) -> dict:
+    logger.info(f"Simplifying text for: {file_name}")
+
+    # Long texts default to chunked mode; "chunked" in the request overrides that
+    if chunked is None:
+        chunked = len(text) > SIMPLIFY_CHUNK_CHARS
+    if chunked:
+        simplified_content = await simplify_chunked(text, file_name)
+    else:
+        simplified_content = await simplify_with_cache(text, file_name)
+    # Keep partial merges out of the document, so the next request retries the missing chunks
+    if doc_id and not is_simplify_fallback(simplified_content) and not simplified_content.get("failed_chunks"):
+        await document_store.update(doc_id, simplified=simplified_content)
+    return simplified_content
+
+@app.post("/simplify")
+async def simplify_text(request: dict):
+    try:
+        text = request.get("text", "")
+        file_name = request.get("file_name", "Unknown file")
+        doc_id = request.get("doc_id")
+        if doc_id:
+            document = await get_document(doc_id)
+            if document.get("simplified"):
+                return document["simplified"]
+            text = document["extracted_text"]
+            file_name = request.get("file_name", document["file_name"])
+        if not text:
+            raise HTTPException(status_code=400, detail="Text to simplify cannot be empty.")
+
+        return await simplify_document(text, file_name, doc_id, request.get("chunked"))
 
     except HTTPException as he:
         raise he
@@ -245,103 +707,292 @@ The JSON object must have these exact keys:
         logger.error(f"An unexpected error occurred in /simplify for {file_name}: {e}", exc_info=True)
         return JSONResponse(status_code=500, content={"error": "An internal server error occurred during simplification."})
 
-@app.post("/visual-model")
-async def generate_visual_model(request: Request):
+# SSE event name for each element of the array fields
+SIMPLIFY_ITEM_EVENTS = {"key_terms": "key_term", "step_by_step": "step"}
+
+def simplify_stream_deltas(text: str):
+    """Blocking generator over the text deltas of a streamed Claude completion."""
+    response = bedrock_client.invoke_model_with_response_stream(
+        modelId=SIMPLIFY_MODEL_ID,
+        body=build_simplify_body(text)
+    )
+    for event in response['body']:
+        chunk = event.get('chunk')
+        if not chunk:
+            continue
+        payload = json.loads(chunk['bytes'])
+        if payload.get('type') == 'content_block_delta':
+            yield payload.get('delta', {}).get('text', '')
+
+def simplify_sse_events(content: dict):
+    yield sse_event("simplified_text", {"simplified_text": content.get("simplified_text", "")})
+    for key, event in SIMPLIFY_ITEM_EVENTS.items():
+        for index, item in enumerate(content.get(key, [])):
+            yield sse_event(event, {"index": index, "item": item})
+    yield sse_event("done", content)
+
+async def stream_simplified(text: str, file_name: str, doc_id: Optional[str] = None):
+    key = simplify_cache_key(text)
+    cached = simplify_cache.get(key)
+    if cached is not None:
+        logger.info(f"Simplify cache hit for: {file_name}")
+        for event in simplify_sse_events(cached):
+            yield event
+        return
+
+    breaker = get_breaker(SIMPLIFY_MODEL_ID)
     try:
-        body = await request.json()
-        simplified_text = body.get("simplified_text", "")
+        trial = breaker.check()
+    except CircuitOpen:
+        # Can't stream from the primary model; send a degraded result in one go
+        try:
+            content = await simplify_degraded(text, file_name, key)
+        except HTTPException as he:
+            yield sse_event("error", {"error": he.detail, "status_code": he.status_code})
+            return
+        for event in simplify_sse_events(content):
+            yield event
+        return
 
-        if not simplified_text:
-            raise HTTPException(status_code=400, detail="Missing 'simplified_text' in request.")
+    parser = IncrementalJSONParser()
+    deltas = iterate_in_service('bedrock-text', simplify_stream_deltas, text)
+    stream_started = time.monotonic()
+    settled = False
+    try:
+        async with admitted('bedrock-text'):
+            async for delta in deltas:
+                for parsed in parser.feed(delta):
+                    if parsed[0] == "field":
+                        _, field, value = parsed
+                        yield sse_event(field, {field: value})
+                    elif parsed[0] == "item":
+                        _, field, index, value = parsed
+                        yield sse_event(SIMPLIFY_ITEM_EVENTS.get(field, field), {"index": index, "item": value})
+                    else:
+                        simplify_cache.set(key, parsed[1])
+                        if doc_id:
+                            await document_store.update(doc_id, simplified=parsed[1])
+                        yield sse_event("done", parsed[1])
+                if parser.done:
+                    break
+            if not parser.done:
+                raise ValueError("Model stream ended before a complete JSON object was received.")
+        settled = True
+        breaker.record_success()
+        observe_upstream('bedrock-text', SIMPLIFY_MODEL_ID, time.monotonic() - stream_started)
+    except (json.JSONDecodeError, ValueError) as e:
+        settled = True
+        breaker.record_success()
+        observe_upstream('bedrock-text', SIMPLIFY_MODEL_ID, time.monotonic() - stream_started)
+        logger.error(f"Streaming JSON parse failed for {file_name}: {e}\\nResponse text: {parser.buffer}")
+        yield sse_event("error", SIMPLIFY_FALLBACK)
+    except HTTPException as he:
+        settled = True
+        record_outcome(breaker, he, trial)
+        observe_upstream('bedrock-text', SIMPLIFY_MODEL_ID, time.monotonic() - stream_started, he)
+        yield sse_event("error", {"error": he.detail, "status_code": he.status_code})
+    except Exception as e:
+        settled = True
+        if is_retryable(e):
+            breaker.record_failure()
+        elif trial:
+            breaker.abandon_trial()
+        observe_upstream('bedrock-text', SIMPLIFY_MODEL_ID, time.monotonic() - stream_started, e)
+        logger.error(f"An unexpected error occurred in /simplify/stream for {file_name}: {e}", exc_info=True)
+        yield sse_event("error", {"error": "An internal server error occurred during simplification."})
+    finally:
+        if not settled and trial:
+            # The client went away mid-stream; don't leave a half-open trial marked as in flight
+            breaker.abandon_trial()
+        await deltas.aclose()
 
-        # Calculate available space for the content text
-        # Base prompt: "Colorful minimalist vector illustration, simple icon, vibrant colors, high contrast. A clean visual representation of: "
-        # Base prompt length: ~120 characters
-        # Suffix: "Solid color background. Absolutely no words, no letters, no text, no numbers."
-        # Suffix length: ~85 characters
-        # Total base prompt: ~205 characters
-        # Available for content: 512 - 205 = 307 characters
-        max_content_length = 300  # Leave some buffer
-        
-        # Truncate the simplified text to fit within the limit
-        image_prompt_text = simplified_text[:max_content_length]
-        if len(simplified_text) > max_content_length:
-            # Try to truncate at a word boundary
-            last_space = image_prompt_text.rfind(' ')
-            if last_space > max_content_length * 0.7:  # If we can find a good break point
-                image_prompt_text = image_prompt_text[:last_space]
-
-        # Create the prompt with proper length control
+@app.post("/simplify/stream")
+async def simplify_text_stream(request: dict):
+    text = request.get("text", "")
+    file_name = request.get("file_name", "Unknown file")
+    doc_id = request.get("doc_id")
+    if doc_id:
+        document = await get_document(doc_id)
+        text = document["extracted_text"]
+        file_name = request.get("file_name", document["file_name"])
+    if not text:
+        raise HTTPException(status_code=400, detail="Text to simplify cannot be empty.")
+
+    logger.info(f"Streaming simplification for: {file_name}")
+
+    return StreamingResponse(
+        stream_simplified(text, file_name, doc_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+IMAGE_MODEL_ID = "amazon.titan-image-generator-v2:0"
+
+# The most exhaustive negative prompt I can create to fight text generation.
+IMAGE_NEGATIVE_PROMPT = (
+    "text, words, letters, numbers, writing, signature, watermark, labels, charts, graphs, text blocks, sentences, paragraphs, fonts, typography, characters, symbols, script, calligraphy, logotype, "
+    "ugly, deformed, noisy, blurry, distorted, low resolution, "
+    "complex, complicated, busy, cluttered, detailed background, distracting elements, "
+    "photorealistic, 3d render, shadows, gradients, violence, nudity, unsafe content, realistic people"
+)
+
+IMAGE_GENERATION_CONFIG = {
+    "numberOfImages": 1,
+    "quality": "standard",
+    "height": 512,
+    "width": 512,
+    "cfgScale": 8.0,
+}
+
+# Concurrent Titan calls per /visualize request
+VISUALIZE_CONCURRENCY = int(os.getenv('VISUALIZE_CONCURRENCY', '3'))
+# Steps per /visualize request; each one is a Titan call
+VISUALIZE_MAX_STEPS = int(os.getenv('VISUALIZE_MAX_STEPS', '20'))
+
+# Generated PNGs, keyed by hash of model + prompt + negative prompt + generation config
+image_cache = DiskBlobCache(
+    directory=os.getenv('IMAGE_CACHE_DIR', os.path.join(CACHE_DIR, 'images')),
+    max_bytes=int(os.getenv('IMAGE_CACHE_MAX_MB', '512')) * 1024 * 1024,
+    extension='.png'
+)
+# WebP / resized renditions of cached images, created on first request
+image_variant_cache = DiskBlobCache(
+    directory=os.path.join(image_cache.directory, 'variants'),
+    max_bytes=int(os.getenv('IMAGE_VARIANT_CACHE_MAX_MB', '128')) * 1024 * 1024,
+    extension='.img'
+)
+image_flights = SingleFlight()
+
+def build_image_prompt(text: str) -> str:
+    # Calculate available space for the content text
+    # Base prompt: "Colorful minimalist vector illustration, simple icon, vibrant colors, high contrast. A clean visual representation of: "
+    # Base prompt length: ~120 characters
+    # Suffix: "Solid color background. Absolutely no words, no letters, no text, no numbers."
+    # Suffix length: ~85 characters
+    # Total base prompt: ~205 characters
+    # Available for content: 512 - 205 = 307 characters
+    max_content_length = 300  # Leave some buffer
+    
+    # Truncate the text to fit within the limit
+    image_prompt_text = text[:max_content_length]
+    if len(text) > max_content_length:
+        # Try to truncate at a word boundary
+        last_space = image_prompt_text.rfind(' ')
+        if last_space > max_content_length * 0.7:  # If we can find a good break point
+            image_prompt_text = image_prompt_text[:last_space]
+
+    # Create the prompt with proper length control
+    prompt = (
+        f"Colorful minimalist vector illustration, simple icon, vibrant colors, high contrast. "
+        f"A clean visual representation of: {image_prompt_text}. "
+        f"Solid color background. Absolutely no words, no letters, no text, no numbers."
+    )
+
+    # Verify the total prompt length
+    if len(prompt) > 512:
+        # Emergency truncation if still too long
+        excess = len(prompt) - 512
+        image_prompt_text = image_prompt_text[:-excess-10]  # Leave some buffer
         prompt = (
             f"Colorful minimalist vector illustration, simple icon, vibrant colors, high contrast. "
             f"A clean visual representation of: {image_prompt_text}. "
             f"Solid color background. Absolutely no words, no letters, no text, no numbers."
         )
+    return prompt
 
-        # Verify the total prompt length
-        if len(prompt) > 512:
-            # Emergency truncation if still too long
-            excess = len(prompt) - 512
-            image_prompt_text = image_prompt_text[:-excess-10]  # Leave some buffer
-            prompt = (
-                f"Colorful minimalist vector illustration, simple icon, vibrant colors, high contrast. "
-                f"A clean visual representation of: {image_prompt_text}. "
-                f"Solid color background. Absolutely no words, no letters, no text, no numbers."
-            )
+def image_cache_key(prompt: str) -> str:
+    return sha256_hex(json.dumps({
+        "model": IMAGE_MODEL_ID,
+        "prompt": prompt,
+        "negative_prompt": IMAGE_NEGATIVE_PROMPT,
+        "config": IMAGE_GENERATION_CONFIG,
+    }, sort_keys=True).encode('utf-8'))
+
+async def invoke_image_model(prompt: str) -> bytes:
+    with span('bedrock'):
+        response_data = await resilient_call(
+            'bedrock-image',
+            invoke_bedrock_json,
+            name=IMAGE_MODEL_ID,
+            idempotent=False,
+            modelId=IMAGE_MODEL_ID,
+            body=json.dumps({
+                "taskType": "TEXT_IMAGE",
+                "textToImageParams": {
+                    "text": prompt,
+                    "negativeText": IMAGE_NEGATIVE_PROMPT
+                },
+                "imageGenerationConfig": IMAGE_GENERATION_CONFIG,
+            }),
+            contentType="application/json",
+            accept="application/json",
+        )
+    with span('base64_decode'):
+        return base64.b64decode(response_data["images"][0])
+
+async def generate_image(prompt: str):
+    """Returns (image_id, png_bytes); identical prompts are generated once and cached."""
+    image_id = image_cache_key(prompt)
+    image_bytes = await image_cache.get(image_id)
+    if image_bytes is not None:
+        logger.info(f"Image cache hit for prompt {image_id[:12]}")
+        return image_id, image_bytes
+
+    async def compute():
+        generated = await invoke_image_model(prompt)
+        await image_cache.put(image_id, generated)
+        return generated
+
+    return image_id, await image_flights.do(image_id, compute)
+
+async def visual_summary(simplified_text: str):
+    """Generate the summary image for a simplified text. Returns (result dict, png_bytes)."""
+    prompt = build_image_prompt(simplified_text)
 
-        # Log the final prompt length for debugging
-        logger.info(f"Visual model prompt length: {len(prompt)} characters")
-        logger.info(f"Visual model prompt: {prompt[:100]}...")
+    # Log the final prompt length for debugging
+    logger.info(f"Visual model prompt length: {len(prompt)} characters")
+    logger.debug(f"Visual model prompt: {prompt[:100]}...")
 
-        # The most exhaustive negative prompt I can create to fight text generation.
-        negative_prompt = (
-            "text, words, letters, numbers, writing, signature, watermark, labels, charts, graphs, text blocks, sentences, paragraphs, fonts, typography, characters, symbols, script, calligraphy, logotype, "
-            "ugly, deformed, noisy, blurry, distorted, low resolution, "
-            "complex, complicated, busy, cluttered, detailed background, distracting elements, "
-            "photorealistic, 3d render, shadows, gradients, violence, nudity, unsafe content, realistic people"
+    try:
+        image_id, image_bytes = await generate_image(prompt)
+    except bedrock_client.exceptions.ValidationException as ve:
+        logger.error(f"Validation error in visual model generation: {ve}")
+        raise HTTPException(
+            status_code=400,
+            detail="The text is too long for image generation. Please try with a shorter text."
+        )
+    except HTTPException:
+        raise
+    except Exception as bedrock_error:
+        logger.error(f"Bedrock error in visual model generation: {bedrock_error}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to generate the visual model. Please try again."
         )
 
-        try:
-            response = bedrock_client.invoke_model(
-                modelId="amazon.titan-image-generator-v2:0",
-                body=json.dumps({
-                    "taskType": "TEXT_IMAGE",
-                    "textToImageParams": {
-                        "text": prompt,
-                        "negativeText": negative_prompt
-                    },
-                    "imageGenerationConfig": {
-                        "numberOfImages": 1,
-                        "quality": "standard",
-                        "height": 512,
-                        "width": 512,
-                        "cfgScale": 8.0,
-                    },
-                }),
-                contentType="application/json",
-                accept="application/json",
-            )
-            
-            response_data = json.loads(response["body"].read())
-            base64_image = response_data["images"][0]
+    result = {
+        "title": "Visual Summary",
+        "description": "Here is a visual summary of the key concepts.",
+        "image_id": image_id,
+        "image_url": f"/images/{image_id}",
+    }
+    return result, image_bytes
 
-            return {
-                "title": "Visual Summary",
-                "description": "Here is a visual summary of the key concepts.",
-                "image_base64": base64_image,
-            }
-        except bedrock_client.exceptions.ValidationException as ve:
-            logger.error(f"Validation error in visual model generation: {ve}")
-            raise HTTPException(
-                status_code=400,
-                detail="The text is too long for image generation. Please try with a shorter text."
-            )
-        except Exception as bedrock_error:
-            logger.error(f"Bedrock error in visual model generation: {bedrock_error}")
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to generate the visual model. Please try again."
-            )
+@app.post("/visual-model")
+async def generate_visual_model(request: Request):
+    try:
+        body = await request.json()
+        simplified_text = body.get("simplified_text", "")
+
+        if not simplified_text:
+            raise HTTPException(status_code=400, detail="Missing 'simplified_text' in request.")
+
+        result, image_bytes = await visual_summary(simplified_text)
+        # Inline base64 is opt-in; the image URL is cacheable and avoids decoding on the client
+        if body.get("response_format") == "base64":
+            with span('base64_encode'):
+                result["image_base64"] = base64.b64encode(image_bytes).decode('utf-8')
+        return result
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -351,36 +1002,543 @@ async def generate_visual_model(request: Request):
             detail="An error occurred while generating the visual model."
         )
 
+def visualize_steps(steps: List[str]):
+    """Generate one image per step, yielding (index, image_url, error) as each completes."""
+    async def step_image(step: str) -> str:
+        image_id, _ = await generate_image(build_image_prompt(step))
+        return f"/images/{image_id}"
+
+    return completed_map(step_image, steps, VISUALIZE_CONCURRENCY)
+
+def validate_visualize_request(request: VisualizeRequest) -> List[str]:
+    steps = [step for step in request.step_by_step if step.strip()]
+    if not steps:
+        raise HTTPException(status_code=400, detail="Missing 'step_by_step' in request.")
+    if len(steps) > VISUALIZE_MAX_STEPS:
+        raise HTTPException(status_code=400, detail=f"Too many steps: at most {VISUALIZE_MAX_STEPS} can be visualized per request.")
+    return steps
+
+@app.get("/images/{image_id}")
+async def get_image(
+    request: Request,
+    image_id: str = Path(..., pattern="^[0-9a-f]{64}$"),
+    format: str = Query("png", pattern="^(png|webp)$"),
+    size: str = Query("full", pattern="^(full|medium|thumb)$"),
+):
+    """Serve a generated image (optionally as WebP and/or a thumbnail) with long-lived cache headers."""
+    original_path = await image_cache.get_path(image_id)
+    if original_path is None:
+        raise HTTPException(status_code=404, detail="Image not found. Please generate it again.")
+    if format == "png" and size == "full":
+        return cached_file_response(request, original_path, media_type=IMAGE_FORMATS["png"], etag=image_id)
+
+    if not variants_supported():
+        raise HTTPException(status_code=400, detail="Image variants are not available on this server. Request format=png&size=full.")
+    variant_id = f"{image_id}-{format}-{size}"
+    variant_path = await image_variant_cache.get_path(variant_id)
+    if variant_path is None:
+        original = await image_cache.get(image_id)
+        if original is None:
+            raise HTTPException(status_code=404, detail="Image not found. Please generate it again.")
+        loop = asyncio.get_running_loop()
+        variant = await loop.run_in_executor(None, render_variant, original, format, size)
+        variant_path = await image_variant_cache.put(variant_id, variant)
+    return cached_file_response(request, variant_path, media_type=IMAGE_FORMATS[format], etag=variant_id)
+
+@app.post("/visualize", response_model=VisualizeResponse)
+async def visualize_steps_endpoint(request: VisualizeRequest):
+    """One image per step, generated concurrently. Failed steps get an empty image URL."""
+    steps = validate_visualize_request(request)
+    image_urls = [''] * len(steps)
+    failed_steps = []
+    last_error = None
+    async for index, image_url, error in visualize_steps(steps):
+        if error is not None:
+            logger.error(f"Image generation failed for step {index + 1}: {error}")
+            failed_steps.append(index)
+            last_error = error
+        else:
+            image_urls[index] = image_url
+
+    if len(failed_steps) == len(steps):
+        if isinstance(last_error, HTTPException):
+            raise last_error
+        raise HTTPException(status_code=500, detail="Failed to generate the visual story. Please try again.")
+
+    return VisualizeResponse(
+        steps=steps,
+        image_prompts=[build_image_prompt(step) for step in steps],
+        image_urls=image_urls,
+        failed_steps=sorted(failed_steps)
+    )
+
+@app.post("/visualize/stream")
+async def visualize_steps_stream(request: VisualizeRequest):
+    """Stream NDJSON lines with each step's image as soon as it is ready."""
+    steps = validate_visualize_request(request)
+
+    async def body():
+        failed_steps = []
+        async for index, image_url, error in visualize_steps(steps):
+            if error is not None:
+                logger.error(f"Image generation failed for step {index + 1}: {error}")
+                failed_steps.append(index)
+                yield json.dumps({"type": "image_error", "index": index, "step": steps[index], "detail": "Failed to generate this image."}) + "\n"
+            else:
+                yield json.dumps({"type": "image", "index": index, "step": steps[index], "image_prompt": build_image_prompt(steps[index]), "image_url": image_url}) + "\n"
+        yield json.dumps({"type": "done", "count": len(steps), "failed_steps": sorted(failed_steps)}) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+NARRATION_VOICE_ID = 'Joanna'  # A clear, standard voice
+# Polly rejects requests above 3000 billable characters; stay safely below that
+NARRATION_MAX_CHUNK_CHARS = int(os.getenv('NARRATION_MAX_CHUNK_CHARS', '2500'))
+# Concurrent Polly calls per narration request
+NARRATION_FANOUT = int(os.getenv('NARRATION_FANOUT', '4'))
+NARRATION_OUTPUT_FORMAT = 'mp3'
+
+# Synthesized narration, keyed by hash of text + voice + output format
+audio_cache = DiskBlobCache(
+    directory=os.getenv('AUDIO_CACHE_DIR', os.path.join(CACHE_DIR, 'audio')),
+    max_bytes=int(os.getenv('AUDIO_CACHE_MAX_MB', '512')) * 1024 * 1024,
+    extension='.mp3'
+)
+
+def narration_audio_id(text: str) -> str:
+    return sha256_hex(f"{NARRATION_VOICE_ID}|{NARRATION_OUTPUT_FORMAT}|{text}".encode('utf-8'))
+
+async def synthesize_chunk(text: str) -> bytes:
+    with span('polly'):
+        return await resilient_call(
+            'polly',
+            synthesize_speech_bytes,
+            Text=text,
+            OutputFormat=NARRATION_OUTPUT_FORMAT,
+            VoiceId=NARRATION_VOICE_ID
+        )
+
+async def narration_text(request: NarrationRequest) -> str:
+    """The text to narrate: explicit text, or the document's simplified (else extracted) text."""
+    if request.doc_id:
+        document = await get_document(request.doc_id)
+        simplified = document.get("simplified") or {}
+        text = simplified.get("simplified_text") or document["extracted_text"]
+    else:
+        text = request.text or ""
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Text to narrate cannot be empty.")
+    return text
+
+def narration_audio(text: str):
+    """Async iterator over the MP3 audio of each Polly-sized chunk, in order."""
+    chunks = chunk_sentences(text, NARRATION_MAX_CHUNK_CHARS)
+    logger.info(f"Narrating {len(text)} characters in {len(chunks)} chunk(s)")
+    return ordered_map(synthesize_chunk, chunks, NARRATION_FANOUT)
+
+async def narrate_to_cache(text: str):
+    """Returns (audio_id, mp3_bytes), synthesizing and caching the audio if needed."""
+    audio_id = narration_audio_id(text)
+    audio_bytes = await audio_cache.get(audio_id)
+    if audio_bytes is None:
+        audio_parts = [part async for part in narration_audio(text)]
+        audio_bytes = b''.join(audio_parts)
+        await audio_cache.put(audio_id, audio_bytes)
+    else:
+        logger.info(f"Narration cache hit for audio {audio_id}")
+    return audio_id, audio_bytes
+
 @app.post("/narrate", response_model=NarrationResponse)
 async def narrate_text(request: NarrationRequest):
+    text = await narration_text(request)
+
     try:
-        logger.info(f"Narrating text of length: {len(request.text)} characters")
-        logger.info(f"Text preview: {request.text[:100]}...")
-        
-        response = polly_client.synthesize_speech(
-            Text=request.text,
-            OutputFormat='mp3',
-            VoiceId='Joanna'  # A clear, standard voice
-        )
-        
-        audio_stream = response.get("AudioStream")
-        if audio_stream:
-            audio_base64 = base64.b64encode(audio_stream.read()).decode('utf-8')
-            logger.info(f"Successfully generated audio, base64 length: {len(audio_base64)}")
-            return NarrationResponse(audio_base64=audio_base64)
-        else:
-            logger.error("Polly did not return an audio stream")
-            raise HTTPException(status_code=500, detail="Polly did not return an audio stream.")
+        logger.info(f"Narrating text of length: {len(text)} characters")
+        logger.debug(f"Text preview: {text[:100]}...")
+
+        audio_id, audio_bytes = await narrate_to_cache(text)
+        if request.doc_id:
+            await document_store.update(request.doc_id, audio_id=audio_id)
+
+        if request.return_url:
+            return NarrationResponse(audio_id=audio_id, audio_url=f"/audio/{audio_id}")
 
+        with span('base64_encode'):
+            audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+        logger.info(f"Successfully generated audio, base64 length: {len(audio_base64)}")
+        return NarrationResponse(audio_base64=audio_base64, audio_id=audio_id, audio_url=f"/audio/{audio_id}")
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"An error occurred in /narrate: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to generate audio: {str(e)}")
 
+@app.post("/narrate/stream")
+async def narrate_text_stream(request: NarrationRequest):
+    """Stream MP3 audio chunk by chunk so playback can start after the first chunk."""
+    text = await narration_text(request)
+
+    audio_id = narration_audio_id(text)
+    cached_path = await audio_cache.get_path(audio_id)
+    if cached_path is not None:
+        return FileResponse(cached_path, media_type="audio/mpeg", headers={"X-Audio-Id": audio_id})
+
+    audio = narration_audio(text)
+    try:
+        # Synthesize the first chunk before responding so failures still map to a 500
+        first_chunk = await audio.__anext__()
+    except HTTPException:
+        await audio.aclose()
+        raise
+    except Exception as e:
+        await audio.aclose()
+        logger.error(f"An error occurred in /narrate/stream: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to generate audio: {str(e)}")
+
+    async def body():
+        audio_parts = [first_chunk]
+        try:
+            yield first_chunk
+            async for part in audio:
+                audio_parts.append(part)
+                yield part
+            # Only complete narrations are cached
+            await audio_cache.put(audio_id, b''.join(audio_parts))
+            if request.doc_id:
+                await document_store.update(request.doc_id, audio_id=audio_id)
+        except Exception as e:
+            # Headers are already sent; all we can do is end the stream early
+            logger.error(f"Narration stream aborted: {e}", exc_info=True)
+        finally:
+            await audio.aclose()
+
+    return StreamingResponse(body(), media_type="audio/mpeg", headers={"X-Audio-Id": audio_id})
+
+@app.get("/audio/{audio_id}")
+async def get_audio(request: Request, audio_id: str = Path(..., pattern="^[0-9a-f]{64}$")):
+    """Serve cached narration audio with ETag, conditional GET and Range support."""
+    path = await audio_cache.get_path(audio_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Audio not found. Please narrate the text again.")
+    return cached_file_response(request, path, media_type="audio/mpeg", etag=audio_id)
+
+def pipeline_error(stage: str, error: Exception) -> dict:
+    if isinstance(error, SkippedStage):
+        return {"type": "skipped", "stage": stage, "detail": f"Skipped because {error.failed_dependency} failed."}
+    if isinstance(error, HTTPException):
+        return {"type": "error", "stage": stage, "detail": error.detail, "status_code": error.status_code}
+    logger.error(f"Pipeline stage {stage} failed: {error}", exc_info=error)
+    return {"type": "error", "stage": stage, "detail": f"An error occurred during {stage}.", "status_code": 500}
+
+PIPELINE_EVENT_TYPES = {"extract": "extracted", "simplify": "simplified"}
+
+def stage_event(stage: str, result: dict) -> dict:
+    return {"type": PIPELINE_EVENT_TYPES.get(stage, stage), **result}
+
+def document_stages(content_hash: str, file_name: str, file_ext: str, load_pages, narrate: bool = True, visualize: bool = True) -> list:
+    """extract -> simplify -> (narration | visual) for one document.
+
+    `load_pages()` is awaited for the document's pages only when its text isn't cached;
+    they're closed once extracted.
+    """
+    async def extract(results):
+        extracted_text = await extraction_cache.get(content_hash)
+        if extracted_text is not None:
+            logger.info(f"Extraction cache hit for {file_name}")
+        else:
+            try:
+                pages = await load_pages()
+            except Exception as textract_error:
+                raise textract_http_error(textract_error, file_name)
+            try:
+                extracted_text = await extract_text(pages, content_hash, file_name)
+            finally:
+                pages.close()
+        doc_id = await register_document(content_hash, extracted_text, file_name, file_ext)
+        return {"doc_id": doc_id, "extracted_text": extracted_text, "file_name": file_name, "file_type": file_ext}
+
+    async def simplify(results):
+        extracted = results["extract"]
+        content = await simplify_document(extracted["extracted_text"], file_name, extracted["doc_id"])
+        if is_simplify_fallback(content):
+            # Don't narrate or illustrate the apology
+            raise HTTPException(status_code=502, detail=content["simplified_text"])
+        return content
+
+    async def narration(results):
+        audio_id, _ = await narrate_to_cache(results["simplify"]["simplified_text"])
+        await document_store.update(results["extract"]["doc_id"], audio_id=audio_id)
+        return {"audio_id": audio_id, "audio_url": f"/audio/{audio_id}"}
+
+    async def visual(results):
+        result, _ = await visual_summary(results["simplify"]["simplified_text"])
+        return result
+
+    stages = [Stage("extract", extract), Stage("simplify", simplify, ["extract"])]
+    if narrate:
+        stages.append(Stage("narration", narration, ["simplify"]))
+    if visualize:
+        stages.append(Stage("visual", visual, ["simplify"]))
+    return stages
+
+@app.post("/process")
+async def process_document(
+    file: UploadFile = File(...),
+    stream_format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+    narrate: bool = True,
+    visualize: bool = True,
+):
+    """Run extract -> simplify -> (narrate | visualize) in one request.
+
+    Narration and the summary image both start as soon as the simplified text
+    is ready and run in parallel. Every stage result is streamed back (NDJSON
+    lines, or SSE events with stream_format=sse) the moment it completes.
+    """
+    stream, file_ext, content_hash = await read_upload(file)
+    # The upload is closed once the handler returns, so open the pages before streaming
+    pages = None
+    if await extraction_cache.get(content_hash) is None:
+        try:
+            pages = await detached_pages(stream, file_ext, file.filename)
+        except Exception as textract_error:
+            raise textract_http_error(textract_error, file.filename)
+
+    async def load_pages():
+        return pages
+
+    stages = document_stages(content_hash, file.filename, file_ext, load_pages, narrate, visualize)
+
+    def event(payload: dict) -> str:
+        if stream_format == "sse":
+            return sse_event(payload["type"], payload)
+        return json.dumps(payload) + "\n"
+
+    async def body():
+        started = time.perf_counter()
+        timings = {}
+        failed_stages = []
+        try:
+            async for name, result, error, seconds in run_stages(stages):
+                if not isinstance(error, SkippedStage):
+                    timings[name] = round(seconds * 1000, 1)
+                if error is not None:
+                    failed_stages.append(name)
+                    yield event(pipeline_error(name, error))
+                else:
+                    yield event(stage_event(name, result))
+        finally:
+            if pages is not None:
+                # Already closed unless the text was cached meanwhile
+                pages.close()
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        yield event({"type": "done", "failed_stages": failed_stages, "timings_ms": timings})
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type)
+
+# Background jobs: batches of documents processed by a worker pool, persisted in SQLite
+JOBS_DIR = os.getenv('JOBS_DIR', os.path.join(CACHE_DIR, 'jobs'))
+JOB_MAX_FILES = int(os.getenv('JOB_MAX_FILES', '100'))
+JOB_EVENTS_POLL_SECONDS = float(os.getenv('JOB_EVENTS_POLL_SECONDS', '1.0'))
+JOB_RETENTION_SECONDS = float(os.getenv('JOB_RETENTION_SECONDS', str(7 * 24 * 60 * 60)))
+
+def job_item_stages(item: dict) -> list:
+    options = item["options"]
+
+    async def load_pages():
+        return await document_pages(open(item["path"], 'rb'), item["file_ext"], item["file_name"])
+
+    return document_stages(item["content_hash"], item["file_name"], item["file_ext"], load_pages,
+                           options["narrate"], options["visualize"])
+
+job_store = JobStore(os.getenv('JOBS_DB', os.path.join(JOBS_DIR, 'jobs.db')))
+job_queue = JobQueue(
+    job_store,
+    JOBS_DIR,
+    build_stages=job_item_stages,
+    describe_error=pipeline_error,
+    workers=int(os.getenv('JOB_WORKERS', '2')),
+    lease_seconds=float(os.getenv('JOB_LEASE_SECONDS', '60')),
+    max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', '3')),
+    retry_delay=float(os.getenv('JOB_RETRY_DELAY_SECONDS', '30')),
+)
+
+@app.on_event("startup")
+async def start_job_workers():
+    # Part of the warm-up, so opening the job store doesn't hold up startup
+    warmup_tasks["jobs"] = asyncio.ensure_future(open_job_queue())
+    warmup_tasks["jobs"].add_done_callback(lambda task: log_warmup_failure("jobs", task))
+
+async def open_job_queue():
+    await job_queue.open()
+    # Unfinished items from before a restart are claimed again as their leases expire
+    await job_queue.purge(JOB_RETENTION_SECONDS)
+    job_queue.start()
+
+async def get_job(job_id: str) -> dict:
+    job = await job_queue.job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return job
+
+def save_job_file(stream, path: str):
+    stream.seek(0)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(stream, f, UPLOAD_CHUNK_BYTES)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    files: List[UploadFile] = File(...),
+    priority: int = Query(0, ge=0, le=9),
+    narrate: bool = False,
+    visualize: bool = False,
+):
+    """Queue a batch of documents for extraction and simplification (and optionally narration/images)."""
+    if len(files) > JOB_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files. Please send at most {JOB_MAX_FILES} per job.")
+
+    # Validate the whole batch before queueing any of it
+    uploads = []
+    for file in files:
+        try:
+            uploads.append((file, *await read_upload(file)))
+        except HTTPException as he:
+            raise HTTPException(status_code=he.status_code, detail=f"{file.filename}: {he.detail}")
+
+    job_id = uuid.uuid4().hex
+    job_dir = job_queue.job_dir(job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    job_files = []
+    for index, (file, stream, file_ext, content_hash) in enumerate(uploads):
+        path = os.path.join(job_dir, f"{index}{file_ext}")
+        await loop.run_in_executor(None, save_job_file, stream, path)
+        job_files.append({"file_name": file.filename, "file_ext": file_ext, "content_hash": content_hash, "path": path})
+
+    await job_queue.submit(job_id, job_files, priority, {"narrate": narrate, "visualize": visualize})
+    logger.info(f"Queued job {job_id} with {len(job_files)} file(s) at priority {priority}")
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "total": len(job_files),
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+        "results_url": f"/jobs/{job_id}/results",
+    }
+
+@app.get("/jobs/stats")
+async def job_statistics():
+    return await job_queue.stats()
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = await get_job(job_id)
+    job["items"] = [
+        {
+            "index": item["index"],
+            "file_name": item["file_name"],
+            "status": item["status"],
+            "completed_stages": list(item["stages"]),
+            "attempts": item["attempts"],
+            "errors": item["errors"],
+        }
+        for item in job["items"]
+    ]
+    return job
+
+@app.get("/jobs/{job_id}/results")
+async def job_results(job_id: str, include_text: bool = False):
+    """Stage results of every item; extracted text only with include_text=true."""
+    job = await get_job(job_id)
+    items = []
+    for item in job["items"]:
+        stages = item["stages"]
+        extracted = stages.get("extract") or {}
+        result = {
+            "index": item["index"],
+            "file_name": item["file_name"],
+            "status": item["status"],
+            "doc_id": extracted.get("doc_id"),
+            "simplified": stages.get("simplify"),
+            "narration": stages.get("narration"),
+            "visual": stages.get("visual"),
+            "errors": item["errors"],
+        }
+        if include_text:
+            result["extracted_text"] = extracted.get("extracted_text")
+        items.append(result)
+    return {"job_id": job_id, "status": job["status"], "counts": job["counts"], "items": items}
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(request: Request, job_id: str):
+    """Server-Sent Events with the job's progress; reconnects resume from Last-Event-ID."""
+    await get_job(job_id)
+    last_event_id = request.headers.get("last-event-id", "")
+    last_seq = int(last_event_id) if last_event_id.isdigit() else 0
+
+    async def body():
+        nonlocal last_seq
+        while True:
+            for seq, event_type, data in await job_queue.events(job_id, after=last_seq):
+                last_seq = seq
+                yield f"id: {seq}\n" + sse_event(event_type, data)
+                if event_type == "done":
+                    return
+            if await request.is_disconnected():
+                return
+            await job_queue.wait_for_events(JOB_EVENTS_POLL_SECONDS)
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel the job's queued items; items already running finish their current attempt."""
+    job = await job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return {"job_id": job_id, "status": job["status"], "counts": job["counts"]}
+
+# Q&A prompts carry only the top passages of long contexts
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '4'))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv('RETRIEVAL_TOKEN_BUDGET', '1500'))
+
+# One BM25 index per distinct context (and therefore per document), built on first question
+retrieval_indexes = LRUCache(
+    max_bytes=int(os.getenv('RETRIEVAL_INDEX_CACHE_MAX_MB', '64')) * 1024 * 1024,
+    sizeof=lambda index: index.size_bytes
+)
+retrieval_stats = RetrievalStats()
+
+async def relevant_context(context: str, question: str) -> str:
+    """The passages of `context` most relevant to `question`, within the token budget."""
+    tokens_before = estimate_tokens(context)
+    if tokens_before <= RETRIEVAL_TOKEN_BUDGET:
+        retrieval_stats.record(tokens_before, tokens_before)
+        return context
+
+    with span('retrieval'):
+        key = sha256_hex(context.encode('utf-8'))
+        index = retrieval_indexes.get(key)
+        if index is None:
+            loop = asyncio.get_running_loop()
+            index = await loop.run_in_executor(None, BM25Index, context)
+            retrieval_indexes.set(key, index)
+
+        selected = "\n\n".join(index.select(question, RETRIEVAL_TOP_K, RETRIEVAL_TOKEN_BUDGET))
+    tokens_after = estimate_tokens(selected)
+    retrieval_stats.record(tokens_before, tokens_after)
+    logger.info(f"Retrieval reduced Q&A context from ~{tokens_before} to ~{tokens_after} tokens")
+    return selected
+
 @app.post("/ask-questions")
 async def ask_question(request: dict):
+    # With a doc_id, repeated Q&A turns only need to carry the question
+    doc_id = request.get("doc_id")
+    document = await get_document(doc_id) if doc_id else None
     try:
-        context = request.get("context", "")
+        context = document["extracted_text"] if document else request.get("context", "")
         question = request.get("question", "")
+        context = await relevant_context(context, question)
         #prompt for the question-answering model with context and question
         prompt = f"""You are a helpful tutor for students with learning differences.
 Using the following educational material, answer the student's question clearly and simply.
@@ -393,24 +1551,86 @@ Student's question:
 
 Answer:"""
 
-        response = bedrock_client.invoke_model(
-            modelId = 'meta.llama3-8b-instruct-v1:0', # LLaMA 3 model ID
-            body = json.dumps({
-                "prompt": prompt,
-                "max_gen_len": 512,
-                "temperature": 0.7
-            })
-        )
+        with span('bedrock'):
+            response_body = await resilient_call(
+                'bedrock-text',
+                invoke_bedrock_json,
+                name='meta.llama3-8b-instruct-v1:0',
+                idempotent=False,
+                modelId = 'meta.llama3-8b-instruct-v1:0', # LLaMA 3 model ID
+                body = json.dumps({
+                    "prompt": prompt,
+                    "max_gen_len": 512,
+                    "temperature": 0.7
+                })
+            )
 
-        response_body = json.loads(response['body'].read())
         answer = response_body.get("generation", "I'm not sure how to answer that.")
         
         #return original questions and answer
         return {"question": question, "answer": answer}
 
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "extraction": extraction_cache.stats(),
+        "simplify": {**simplify_cache.stats(), **simplify_flights.stats()},
+        "audio": audio_cache.stats(),
+        "documents": document_store.stats(),
+        "images": {**image_cache.stats(), **image_flights.stats()},
+        "retrieval": {**retrieval_stats.stats(), "indexes": retrieval_indexes.stats()},
+    }
+
+register_caches(lambda: {
+    "extraction": extraction_cache.stats(),
+    "simplify": simplify_cache.stats(),
+    "audio": audio_cache.stats(),
+    "documents": document_store.stats(),
+    "images": image_cache.stats(),
+    "image_variants": image_variant_cache.stats(),
+    "retrieval_indexes": retrieval_indexes.stats(),
+})
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of request, upstream and cache metrics."""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled.")
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/upload/stats")
+async def upload_statistics():
+    return upload_stats.stats()
+
+@app.get("/upstream/stats")
+async def upstream_stats():
+    return {
+        "admission": {service: controller.stats() for service, controller in admission_controllers.items()},
+        "circuits": resilience_stats(),
+    }
+
+@app.get("/ready")
+async def readiness():
+    """200 once the startup warm-up (AWS clients, OCR process pool, storage, job workers) has finished, else 503."""
+    checks = {}
+    for name, task in warmup_tasks.items():
+        if not task.done():
+            checks[name] = "warming"
+        elif task.cancelled() or task.exception() is not None:
+            checks[name] = "failed"
+        else:
+            checks[name] = "ready"
+    ready = bool(checks) and all(state == "ready" for state in checks.values())
+    content = {"ready": ready, "checks": checks, "clients": aws_clients.stats()}
+    if not ready:
+        return JSONResponse(status_code=503, content=content)
+    return content
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to AI Nable Backend"} 
\ No newline at end of file
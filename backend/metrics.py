@@ -0,0 +1,263 @@
+"""Prometheus-style metrics and per-request stage timing.
+
+Everything here is a no-op when METRICS_ENABLED=0: the middleware is not
+installed, `span()` returns a shared null context and the `observe_*`
+helpers return immediately.
+
+Stage spans recorded inside a handler feed the `stage_duration_seconds`
+histogram and, for non-streaming responses, a `Server-Timing` header so a
+single slow request can be broken down from the client side.
+"""
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+from starlette.routing import Match
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 10485760)
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Counter:
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+
+    def dec(self, *label_values, amount: float = 1.0):
+        self.inc(*label_values, amount=-amount)
+
+    def render(self) -> list:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.labels + ('le',), label_values + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels + ('le',), label_values + ('+Inf',))
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {series[-2]}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Time from request start to the last response byte.', ('method', 'route', 'status'))
+requests_in_flight = Gauge('http_requests_in_flight', 'Requests currently being handled.', ('route',))
+request_size = Histogram(
+    'http_request_size_bytes', 'Request body size (uploads included).', ('route',), SIZE_BUCKETS)
+response_size = Histogram(
+    'http_response_size_bytes', 'Response body size.', ('route',), SIZE_BUCKETS)
+stage_duration = Histogram(
+    'stage_duration_seconds', 'Time spent in each stage of a handler.', ('route', 'stage'))
+upstream_duration = Histogram(
+    'upstream_call_duration_seconds', 'AWS call duration, including retries and hedges.', ('service', 'model', 'outcome'))
+upstream_errors = Counter('upstream_errors_total', 'Failed AWS calls by error code.', ('service', 'model', 'code'))
+ocr_preprocess_bytes = Counter(
+    'ocr_preprocess_bytes_total', 'Image bytes before and after preprocessing for Textract.', ('stage',))
+
+registry = [
+    request_duration, requests_in_flight, request_size, response_size,
+    stage_duration, upstream_duration, upstream_errors, ocr_preprocess_bytes,
+]
+# Callables returning {cache_name: stats_dict}; read at scrape time
+cache_collectors = []
+
+_route = contextvars.ContextVar('metrics_route', default='unmatched')
+_spans = contextvars.ContextVar('metrics_spans', default=None)
+_NULL_SPAN = contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def _span(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.observe(elapsed, _route.get(), stage)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+
+def span(stage: str):
+    """Time one stage of the current request (e.g. `with span('textract'):`)."""
+    if not METRICS_ENABLED:
+        return _NULL_SPAN
+    return _span(stage)
+
+
+def error_code(error: Exception) -> str:
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        code = response.get('Error', {}).get('Code')
+        if code:
+            return code
+    status_code = getattr(error, 'status_code', None)
+    return str(status_code) if status_code else type(error).__name__
+
+
+def observe_upstream(service: str, model: str, duration: float, error: Exception = None):
+    if not METRICS_ENABLED:
+        return
+    upstream_duration.observe(duration, service, model, 'error' if error is not None else 'ok')
+    if error is not None:
+        upstream_errors.inc(service, model, error_code(error))
+
+
+def observe_preprocess(bytes_before: int, bytes_after: int):
+    if not METRICS_ENABLED:
+        return
+    ocr_preprocess_bytes.inc('before', amount=bytes_before)
+    ocr_preprocess_bytes.inc('after', amount=bytes_after)
+
+
+def register_caches(collector):
+    cache_collectors.append(collector)
+
+
+def _render_caches() -> list:
+    hits = ['# HELP cache_hits_total Cache hits.', '# TYPE cache_hits_total counter']
+    misses = ['# HELP cache_misses_total Cache misses.', '# TYPE cache_misses_total counter']
+    ratios = ['# HELP cache_hit_ratio Hits / (hits + misses) since start.', '# TYPE cache_hit_ratio gauge']
+    for collector in cache_collectors:
+        for name, stats in collector().items():
+            if 'hits' not in stats or 'misses' not in stats:
+                continue
+            labels = _format_labels(('cache',), (name,))
+            total = stats['hits'] + stats['misses']
+            hits.append(f"cache_hits_total{labels} {stats['hits']}")
+            misses.append(f"cache_misses_total{labels} {stats['misses']}")
+            ratios.append(f"cache_hit_ratio{labels} {stats['hits'] / total if total else 0.0}")
+    return hits + misses + ratios
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    lines.extend(_render_caches())
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, in-flight requests and payload sizes.
+
+    Pure ASGI (rather than BaseHTTPMiddleware) so streaming responses are timed to
+    their last byte and nothing is buffered.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def _route_for(scope) -> str:
+        # Label by route template (/images/{image_id}), not the raw path
+        for route in scope['app'].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, 'path', 'unmatched')
+        return 'unmatched'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        route = self._route_for(scope)
+        spans = []
+        route_token = _route.set(route)
+        spans_token = _spans.set(spans)
+        state = {'status': 500, 'request_bytes': 0, 'response_bytes': 0}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message['type'] == 'http.request':
+                state['request_bytes'] += len(message.get('body', b''))
+            return message
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                state['status'] = message['status']
+                if spans:
+                    timing = ', '.join(f'{stage};dur={elapsed * 1000:.1f}' for stage, elapsed in spans)
+                    message = {**message, 'headers': list(message.get('headers', [])) + [(b'server-timing', timing.encode('latin-1'))]}
+            elif message['type'] == 'http.response.body':
+                state['response_bytes'] += len(message.get('body', b''))
+            await send(message)
+
+        requests_in_flight.inc(route)
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            requests_in_flight.dec(route)
+            request_duration.observe(time.perf_counter() - started, scope['method'], route, str(state['status']))
+            request_size.observe(state['request_bytes'], route)
+            response_size.observe(state['response_bytes'], route)
+            _route.reset(route_token)
+            _spans.reset(spans_token)
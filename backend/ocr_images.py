@@ -0,0 +1,54 @@
+"""Shrinking photo and scan uploads before they are sent to Textract.
+
+Phone photos carry far more pixels and colour than text detection needs.
+Pillow is optional: without it images are sent to Textract unchanged.
+"""
+import io
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = None
+
+EXIF_ORIENTATION = 0x0112
+
+
+def preprocessing_supported() -> bool:
+    return Image is not None
+
+
+def preprocess_for_ocr(data: bytes, max_edge: int, jpeg_quality: int) -> bytes:
+    """Upright, downscaled, grayscale re-encode of an image for text detection.
+
+    Runs in the process pool, so it must stay a picklable top-level function.
+    Returns the original bytes when re-encoding wouldn't make them smaller
+    and no rotation was needed.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        source_format = source.format
+        if source_format == 'JPEG':
+            # Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding
+            scale = max_edge / max(source.size)
+            if scale < 1:
+                source.draft('L', (int(source.size[0] * scale), int(source.size[1] * scale)))
+        orientation = source.getexif().get(EXIF_ORIENTATION, 1)
+        image = ImageOps.exif_transpose(source)
+
+    if image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+        # Flatten onto white so transparent backgrounds don't turn black
+        image = image.convert('RGBA')
+        image = Image.alpha_composite(Image.new('RGBA', image.size, 'white'), image)
+    image = image.convert('L')
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.BILINEAR)
+
+    output = io.BytesIO()
+    if source_format == 'PNG':
+        image.save(output, format='PNG', optimize=True)
+    else:
+        image.save(output, format='JPEG', quality=jpeg_quality)
+    processed = output.getvalue()
+
+    if len(processed) >= len(data) and orientation == 1:
+        return data
+    return processed
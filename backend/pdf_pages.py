@@ -0,0 +1,107 @@
+"""Splitting PDFs into single-page documents for page-level Textract calls.
+
+Pages are rendered one at a time when a caller asks for them, so only the
+pages currently being processed are held in memory, not the whole split
+document (shared fonts and images are copied into every page).
+"""
+import io
+import threading
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PdfReadError
+
+
+def _read_all(stream) -> bytes:
+    stream.seek(0)
+    return stream.read()
+
+
+class Pages:
+    """The pages of one document as standalone documents, loaded on demand.
+
+    `load(index)` returns a page's bytes and `release(page)` says the caller
+    is done with them; `peak_bytes` is the most page data held at once.
+    `close()` closes the underlying stream.
+    """
+
+    def __init__(self):
+        self.resident_bytes = 0
+        self.peak_bytes = 0
+        self._counter_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def _render(self, index: int) -> bytes:
+        raise NotImplementedError
+
+    def load(self, index: int) -> bytes:
+        page = self._render(index)
+        with self._counter_lock:
+            self.resident_bytes += len(page)
+            self.peak_bytes = max(self.peak_bytes, self.resident_bytes)
+        return page
+
+    def release(self, page: bytes):
+        with self._counter_lock:
+            self.resident_bytes -= len(page)
+
+    def close(self):
+        pass
+
+
+class StaticPages(Pages):
+    """Pages that are already in memory, e.g. a single (preprocessed) image."""
+
+    def __init__(self, pages: list):
+        super().__init__()
+        self._pages = pages
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def _render(self, index: int) -> bytes:
+        return self._pages[index]
+
+
+class PdfPages(Pages):
+    """One standalone PDF per page, rendered from `source` when it is loaded.
+
+    `source` is the PDF as bytes or a seekable binary file (e.g. a spooled
+    upload), which must stay open until the pages are no longer needed.
+
+    Single-page or unreadable PDFs are a single page holding the original
+    bytes, so Textract can still accept or reject them with its usual errors.
+    Output is deterministic, so unchanged pages hash the same across uploads.
+    """
+
+    def __init__(self, source):
+        super().__init__()
+        self._stream = io.BytesIO(source) if isinstance(source, bytes) else source
+        # The reader and the stream are shared by every page; render one page at a time
+        self._lock = threading.Lock()
+        self._reader = None
+        try:
+            self._stream.seek(0)
+            reader = PdfReader(self._stream)
+            if len(reader.pages) > 1:
+                self._reader = reader
+        except (PdfReadError, ValueError, KeyError):
+            pass
+
+    def __len__(self) -> int:
+        return len(self._reader.pages) if self._reader is not None else 1
+
+    def _render(self, index: int) -> bytes:
+        with self._lock:
+            if self._reader is None:
+                return _read_all(self._stream)
+            writer = PdfWriter()
+            writer.add_page(self._reader.pages[index])
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            return buffer.getvalue()
+
+    def close(self):
+        self._stream.close()
+
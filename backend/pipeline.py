@@ -0,0 +1,100 @@
+"""A tiny dependency-graph runner for multi-stage document processing.
+
+Each stage starts as soon as every stage it depends on has finished, so
+independent stages (e.g. narration and image generation, which both only
+need the simplified text) run in parallel and total time is the critical
+path rather than the sum of the stages.
+"""
+import asyncio
+import time
+from typing import Callable, Dict, List, Sequence
+
+
+class Stage:
+    """`fn(results)` is awaited with the results of the stages it depends on."""
+
+    def __init__(self, name: str, fn: Callable, depends_on: Sequence[str] = ()):
+        self.name = name
+        self.fn = fn
+        self.depends_on = tuple(depends_on)
+
+
+class SkippedStage(Exception):
+    """A stage that never ran because one of its dependencies failed."""
+
+    def __init__(self, name: str, failed_dependency: str):
+        super().__init__(f"Skipped '{name}' because '{failed_dependency}' failed")
+        self.failed_dependency = failed_dependency
+
+
+def validate_stages(stages: List[Stage]):
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("Stage names must be unique")
+    seen = set()
+    for stage in stages:
+        # Dependencies must come first, which also rules out cycles
+        missing = [name for name in stage.depends_on if name not in seen]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown or later stages: {missing}")
+        seen.add(stage.name)
+
+
+async def run_stages(stages: List[Stage], completed: Dict[str, object] = None):
+    """Run `stages` as a DAG, yielding `(name, result, error, seconds)` as each one finishes.
+
+    Stages must be listed after their dependencies. A failing stage reports
+    its exception; stages depending on it are reported as `SkippedStage`
+    without running. Stages still running when the consumer stops iterating
+    are cancelled. `completed` holds results from an earlier, interrupted
+    run; those stages are not run (or reported) again.
+    """
+    validate_stages(stages)
+    results: Dict[str, object] = dict(completed or {})
+    failed = set()
+    pending = {stage.name: stage for stage in stages if stage.name not in results}
+    running = {}
+
+    async def run(stage: Stage):
+        started = time.perf_counter()
+        try:
+            return stage.name, await stage.fn(results), None, time.perf_counter() - started
+        except Exception as e:
+            return stage.name, None, e, time.perf_counter() - started
+
+    def start_ready():
+        # Stages are in dependency order, so skips cascade within one pass
+        skipped = []
+        for name, stage in list(pending.items()):
+            failed_dependency = next((dep for dep in stage.depends_on if dep in failed), None)
+            if failed_dependency is not None:
+                del pending[name]
+                failed.add(name)
+                skipped.append((name, None, SkippedStage(name, failed_dependency), 0.0))
+            elif all(dep in results for dep in stage.depends_on):
+                del pending[name]
+                running[asyncio.ensure_future(run(stage))] = name
+        return skipped
+
+    try:
+        while pending or running:
+            outcomes = start_ready()
+            if not outcomes:
+                if not running:
+                    break
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    del running[task]
+                    name, result, error, seconds = task.result()
+                    if error is None:
+                        results[name] = result
+                    else:
+                        failed.add(name)
+                    outcomes.append((name, result, error, seconds))
+                # Start dependents before handing results to a possibly slow consumer
+                outcomes.extend(start_ready())
+            for outcome in outcomes:
+                yield outcome
+    finally:
+        for task in running:
+            task.cancel()
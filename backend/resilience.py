@@ -0,0 +1,305 @@
+"""Deadlines, retries, hedging and circuit breaking for upstream AWS calls.
+
+`resilient_call` wraps `admission.call_service` with:
+  - an overall deadline per call,
+  - jittered exponential retries on retryable errors (throttling, 5xx,
+    connection and read timeouts),
+  - optional hedging: for idempotent calls a second identical request is
+    started once the first has run longer than the recent p95 latency,
+  - a circuit breaker per model (or per service) that fails fast while
+    the upstream keeps failing. Each call reports one outcome to it, however
+    many attempts it took; throttling is left to admission control and
+    doesn't count as a failure.
+"""
+import asyncio
+import math
+import os
+import random
+import time
+from collections import deque
+
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
+from botocore.exceptions import ConnectTimeoutError, ReadTimeoutError
+from fastapi import HTTPException
+
+from admission import ServiceOverloaded, call_service, is_throttling_error
+from metrics import observe_upstream
+
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException',
+    'ThrottledException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'ServiceUnavailable',
+    'InternalServerException',
+    'InternalServerError',
+    'InternalFailure',
+    'ModelTimeoutException',
+    'ModelNotReadyException',
+    'RequestTimeout',
+}
+
+# Defaults: (deadline seconds, hedge idempotent calls)
+DEFAULT_POLICIES = {
+    'textract': (30.0, True),
+    'bedrock-text': (60.0, False),
+    'bedrock-image': (60.0, False),
+    'polly': (20.0, True),
+}
+
+
+class CircuitOpen(HTTPException):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=503,
+            detail=f"Tobi can't reach this service right now. Please try again in {self.retry_after} seconds.",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+class UpstreamTimeout(HTTPException):
+
+    def __init__(self, name: str, deadline: float):
+        super().__init__(status_code=504, detail=f"The request took longer than {deadline:.0f} seconds. Please try again.")
+        self.name = name
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, ServiceOverloaded):
+        return error.upstream
+    if isinstance(error, (BotocoreConnectionError, ConnectTimeoutError, ReadTimeoutError)):
+        return True
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        if response.get('Error', {}).get('Code') in RETRYABLE_ERROR_CODES:
+            return True
+        return response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+    return False
+
+
+class LatencyTracker:
+    """Rolling window of recent successful call latencies."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, latency: float):
+        self.samples.append(latency)
+
+    def percentile(self, q: float):
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures; lets one trial call through after `reset_timeout`."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+
+    def check(self) -> bool:
+        """Raise CircuitOpen unless a call may go through; True if it is the half-open trial."""
+        if self.state == "closed":
+            return False
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == "open" and elapsed >= self.reset_timeout:
+            self.state = "half-open"
+        if self.state == "half-open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        raise CircuitOpen(self.name, max(1.0, self.reset_timeout - elapsed))
+
+    def is_open(self) -> bool:
+        return self.state == "open" and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def abandon_trial(self):
+        """The trial call ended without telling us anything about upstream health."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "times_opened": self.times_opened}
+
+
+def record_outcome(breaker: CircuitBreaker, error: Exception = None, trial: bool = False):
+    """Report how a call ended; `trial` is what `breaker.check()` returned for it.
+
+    Throttling and local rejections say nothing about upstream health, so they
+    only hand back the half-open trial if the call held it.
+    """
+    if error is None:
+        breaker.record_success()
+    elif isinstance(error, ServiceOverloaded) or is_throttling_error(error):
+        if trial:
+            breaker.abandon_trial()
+    elif isinstance(error, asyncio.TimeoutError) or is_retryable(error):
+        breaker.record_failure()
+    elif isinstance(error, HTTPException):
+        if trial:
+            breaker.abandon_trial()
+    else:
+        # Client-side errors (bad input) mean the upstream answered
+        breaker.record_success()
+
+
+class ResiliencePolicy:
+
+    def __init__(self, deadline: float, hedge: bool, max_attempts: int, base_delay: float, max_delay: float):
+        self.deadline = deadline
+        self.hedge = hedge
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls, service: str) -> "ResiliencePolicy":
+        prefix = service.upper().replace('-', '_')
+        deadline, hedge = DEFAULT_POLICIES[service]
+        return cls(
+            deadline=float(os.getenv(f'{prefix}_DEADLINE_SECONDS', deadline)),
+            hedge=os.getenv(f'{prefix}_HEDGE', '1' if hedge else '0') == '1',
+            max_attempts=int(os.getenv(f'{prefix}_MAX_ATTEMPTS', 3)),
+            base_delay=float(os.getenv('RETRY_BASE_DELAY_SECONDS', 0.2)),
+            max_delay=float(os.getenv('RETRY_MAX_DELAY_SECONDS', 5.0)),
+        )
+
+
+policies = {}
+breakers = {}
+latencies = {}
+hedges_started = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    breaker = breakers.get(name)
+    if breaker is None:
+        breaker = breakers[name] = CircuitBreaker(
+            name,
+            failure_threshold=int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5)),
+            reset_timeout=float(os.getenv('CIRCUIT_RESET_SECONDS', 30.0)),
+        )
+    return breaker
+
+
+def _policy(service: str) -> ResiliencePolicy:
+    policy = policies.get(service)
+    if policy is None:
+        policy = policies[service] = ResiliencePolicy.from_env(service)
+    return policy
+
+
+async def _hedged(service: str, name: str, fn, args, kwargs):
+    """Start a backup request if the first one outlives the recent p95 latency."""
+    primary = asyncio.ensure_future(call_service(service, fn, *args, **kwargs))
+    hedge_after = latencies[name].percentile(0.95)
+    if hedge_after is None:
+        return await primary
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    hedges_started[name] = hedges_started.get(name, 0) + 1
+    backup = asyncio.ensure_future(call_service(service, fn, *args, **kwargs))
+    pending = {primary, backup}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        # Both failed: report the primary's error
+        return primary.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def resilient_call(service: str, fn, *args, name: str = None, idempotent: bool = True, **kwargs):
+    """Call `fn` on `service` with a deadline, retries, optional hedging and a circuit breaker.
+
+    `name` identifies the circuit (e.g. the model ID); it defaults to the service.
+    """
+    name = name or service
+    policy = _policy(service)
+    breaker = get_breaker(name)
+    latencies.setdefault(name, LatencyTracker())
+    trial = breaker.check()
+
+    deadline_at = time.monotonic() + policy.deadline
+    attempt = 0
+    try:
+        while True:
+            attempt += 1
+            started = time.monotonic()
+            remaining = deadline_at - started
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                if policy.hedge and idempotent:
+                    call = _hedged(service, name, fn, args, kwargs)
+                else:
+                    call = call_service(service, fn, *args, **kwargs)
+                result = await asyncio.wait_for(call, timeout=remaining)
+            except asyncio.TimeoutError as e:
+                observe_upstream(service, name, time.monotonic() - started, e)
+                record_outcome(breaker, e, trial)
+                raise UpstreamTimeout(name, policy.deadline)
+            except Exception as e:
+                observe_upstream(service, name, time.monotonic() - started, e)
+                # Stop retrying once other calls have opened the circuit
+                if is_retryable(e) and attempt < policy.max_attempts and not breaker.is_open():
+                    # Full jitter: sleep a random amount up to the exponential backoff cap
+                    delay = random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** attempt))
+                    if time.monotonic() + delay < deadline_at:
+                        await asyncio.sleep(delay)
+                        continue
+                record_outcome(breaker, e, trial)
+                raise
+            elapsed = time.monotonic() - started
+            observe_upstream(service, name, elapsed)
+            latencies[name].record(elapsed)
+            record_outcome(breaker, None, trial)
+            return result
+    except asyncio.CancelledError:
+        # The caller went away; don't leave the half-open trial marked as in flight
+        if trial:
+            breaker.abandon_trial()
+        raise
+
+
+def resilience_stats() -> dict:
+    return {
+        name: {
+            **breaker.stats(),
+            "p95_latency": latencies[name].percentile(0.95) if name in latencies else None,
+            "hedges_started": hedges_started.get(name, 0),
+        }
+        for name, breaker in breakers.items()
+    }
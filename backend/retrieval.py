@@ -0,0 +1,104 @@
+"""Per-document BM25 retrieval so Q&A prompts only carry relevant passages."""
+import math
+import re
+from collections import Counter
+
+from chunking import pack, split_sentences
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'can', 'do', 'does', 'for',
+    'from', 'had', 'has', 'have', 'how', 'i', 'if', 'in', 'is', 'it', 'its', 'of', 'on',
+    'or', 'so', 'that', 'the', 'their', 'them', 'then', 'there', 'these', 'they', 'this',
+    'to', 'was', 'we', 'were', 'what', 'when', 'where', 'which', 'who', 'why', 'will',
+    'with', 'you', 'your',
+}
+
+
+def tokenize(text: str) -> list:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough model-token count (~4 characters per token for English)."""
+    return (len(text) + 3) // 4
+
+
+class BM25Index:
+    """Okapi BM25 over the passages of one document."""
+
+    def __init__(self, text: str, passage_chars: int = 800, k1: float = 1.5, b: float = 0.75):
+        self.passages = pack(split_sentences(text), passage_chars)
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(passage)) for passage in self.passages]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_frequency = Counter()
+        for counts in self.term_counts:
+            document_frequency.update(counts.keys())
+        n = len(self.passages)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+        self.size_bytes = sum(len(passage) for passage in self.passages) * 3
+
+    def scores(self, query: str) -> list:
+        query_terms = set(tokenize(query))
+        results = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            for term in query_terms:
+                tf = counts.get(term)
+                if not tf:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * length / (self.avg_length or 1))
+                score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            results.append(score)
+        return results
+
+    def select(self, query: str, top_k: int, token_budget: int) -> list:
+        """Best-scoring passages (at most `top_k`, within `token_budget`), in document order."""
+        scores = self.scores(query)
+        ranked = sorted(range(len(self.passages)), key=lambda i: scores[i], reverse=True)
+        chosen = []
+        used_tokens = 0
+        for i in ranked:
+            if len(chosen) >= top_k:
+                break
+            if chosen and scores[i] <= 0:
+                break
+            tokens = estimate_tokens(self.passages[i])
+            if chosen and used_tokens + tokens > token_budget:
+                continue
+            chosen.append(i)
+            used_tokens += tokens
+        return [self.passages[i] for i in sorted(chosen)]
+
+
+class RetrievalStats:
+    """Running totals of Q&A context size before and after retrieval."""
+
+    def __init__(self):
+        self.questions = 0
+        self.retrieved = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def record(self, before: int, after: int):
+        self.questions += 1
+        if after < before:
+            self.retrieved += 1
+        self.tokens_before += before
+        self.tokens_after += after
+
+    def stats(self) -> dict:
+        return {
+            "questions": self.questions,
+            "retrieved": self.retrieved,
+            "context_tokens_before": self.tokens_before,
+            "context_tokens_after": self.tokens_after,
+            "avg_context_tokens_before": self.tokens_before / self.questions if self.questions else 0,
+            "avg_context_tokens_after": self.tokens_after / self.questions if self.questions else 0,
+        }
@@ -0,0 +1,105 @@
+"""Helpers for streaming model output to clients as it is generated."""
+import json
+
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class IncrementalJSONParser:
+    """Parses a JSON object fed in fragments, reporting values as they complete.
+
+    Any text before the first `{` is ignored. `feed` returns a list of events:
+      ("field", key, value)        a top-level non-array value completed
+      ("item", key, index, value)  an element of a top-level array completed
+      ("done", obj)                the whole object completed
+    Only top-level fields and the elements of top-level arrays are reported,
+    which is all the /simplify schema needs. Numbers, booleans and null are
+    only reported inside a containing value or the final "done" object.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.done = False
+        self._pos = 0
+        self._started = False
+        self._start = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._expect_key = True
+        self._key = None
+        self._key_start = 0
+        self._value_start = 0
+        self._item_start = 0
+        self._item_index = 0
+
+    def feed(self, fragment: str) -> list:
+        self.buffer += fragment
+        events = []
+        buf = self.buffer
+        for i in range(self._pos, len(buf)):
+            if self.done:
+                break
+            ch = buf[i]
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._start = i
+                    self._stack.append(ch)
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._end_token(i, events)
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._start_token(i)
+            elif ch in '{[':
+                self._start_token(i)
+                self._stack.append(ch)
+            elif ch in '}]':
+                self._stack.pop()
+                self._end_token(i, events)
+            elif len(self._stack) == 1:
+                if ch == ':':
+                    self._expect_key = False
+                elif ch == ',':
+                    self._expect_key = True
+        self._pos = len(buf)
+        return events
+
+    def _in_top_level_array(self) -> bool:
+        return len(self._stack) == 2 and self._stack[1] == '['
+
+    def _start_token(self, i: int):
+        depth = len(self._stack)
+        if depth == 1:
+            if self._expect_key:
+                self._key_start = i
+            else:
+                self._value_start = i
+                self._item_index = 0
+        elif self._in_top_level_array():
+            self._item_start = i
+
+    def _end_token(self, i: int, events: list):
+        depth = len(self._stack)
+        if depth == 0:
+            self.done = True
+            events.append(("done", json.loads(self.buffer[self._start:i + 1])))
+        elif depth == 1:
+            if self._expect_key:
+                self._key = json.loads(self.buffer[self._key_start:i + 1])
+            elif self.buffer[self._value_start] != '[':
+                events.append(("field", self._key, json.loads(self.buffer[self._value_start:i + 1])))
+        elif self._in_top_level_array():
+            value = json.loads(self.buffer[self._item_start:i + 1])
+            events.append(("item", self._key, self._item_index, value))
+            self._item_index += 1
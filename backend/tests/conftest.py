@@ -0,0 +1,62 @@
+"""Shared setup: run the backend offline with throwaway storage and no AWS credentials."""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'TEST')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ['CACHE_DIR'] = tempfile.mkdtemp(prefix='ainable-tests-')
+
+
+class AppClient:
+    """Minimal synchronous client calling the ASGI app in-process.
+
+    Every request runs on the same event loop, since the app's asyncio
+    primitives bind to the loop that first uses them.
+    """
+
+    def __init__(self, app, loop):
+        self.app = app
+        self.loop = loop
+
+    def request(self, method: str, path: str, **kwargs):
+        import httpx
+
+        async def send():
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as http:
+                return await http.request(method, path, **kwargs)
+        return self.loop.run_until_complete(send())
+
+    def get(self, path: str, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+
+@pytest.fixture(scope='session')
+def app_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def make_client(app_loop):
+    """Build a client for any ASGI app."""
+    return lambda app: AppClient(app, app_loop)
+
+
+@pytest.fixture
+def client(app_loop):
+    """Client for the app, without startup hooks (no job workers or warm-up)."""
+    import main
+    return AppClient(main.app, app_loop)
@@ -0,0 +1,203 @@
+import asyncio
+
+import pytest
+from botocore.exceptions import ClientError
+
+import admission
+from admission import AdmissionController, AIMDLimiter, ServiceOverloaded, admitted, bulk_priority, call_service
+
+
+def controller(**overrides):
+    settings = dict(rate=0.0, burst=1.0, max_concurrency=2, max_queue=8, queue_timeout=1.0, bulk_share=0.5)
+    settings.update(overrides)
+    return AdmissionController('polly', **settings)
+
+
+def throttling_error():
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'},
+                        'ResponseMetadata': {'HTTPStatusCode': 400}}, 'SynthesizeSpeech')
+
+
+class ThrottlingClient:
+    """Fake upstream that throttles its first `throttles` calls."""
+
+    def __init__(self, throttles: int):
+        self.throttles = throttles
+        self.calls = 0
+
+    def synthesize_speech(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.throttles:
+            raise throttling_error()
+        return b'audio'
+
+
+@pytest.fixture
+def polly(monkeypatch):
+    """Install a fresh controller for 'polly' in the shared registry."""
+    def install(**overrides):
+        polly_controller = controller(**overrides)
+        monkeypatch.setitem(admission.admission_controllers, 'polly', polly_controller)
+        return polly_controller
+    return install
+
+
+def test_empty_bucket_rejects_with_429_and_retry_after(app_loop):
+    limited = controller(rate=1.0, burst=1.0, queue_timeout=0.1)
+    app_loop.run_until_complete(limited.acquire())
+
+    with pytest.raises(ServiceOverloaded) as error:
+        app_loop.run_until_complete(limited.acquire())
+
+    assert error.value.status_code == 429
+    assert error.value.headers == {"Retry-After": "1"}
+    assert limited.rejected_rate == 1
+
+
+def test_full_queue_rejects_with_503(app_loop):
+    limited = controller(max_concurrency=1, max_queue=1)
+
+    async def scenario():
+        await limited.acquire()
+        queued = asyncio.ensure_future(limited.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(ServiceOverloaded) as error:
+            await limited.acquire()
+        limited.release(0.01, False)
+        await queued
+        return error.value
+
+    error = app_loop.run_until_complete(scenario())
+
+    assert error.status_code == 503
+    assert "queue full" in error.detail
+    assert limited.stats()["in_flight"] == 1
+    assert limited.stats()["queued"] == 0
+
+
+def test_wait_past_deadline_rejects_with_503(app_loop):
+    limited = controller(max_concurrency=1, queue_timeout=0.05)
+    app_loop.run_until_complete(limited.acquire())
+
+    with pytest.raises(ServiceOverloaded) as error:
+        app_loop.run_until_complete(limited.acquire())
+
+    assert error.value.status_code == 503
+    assert "Retry-After" in error.value.headers
+    assert limited.stats()["in_flight"] == 1
+    assert limited.stats()["queued"] == 0
+
+
+def test_throttling_shrinks_the_limit_and_successes_restore_it(app_loop, polly):
+    limited = polly(max_concurrency=4)
+    client = ThrottlingClient(throttles=1)
+
+    with pytest.raises(ServiceOverloaded) as error:
+        app_loop.run_until_complete(call_service('polly', client.synthesize_speech, Text='hi'))
+
+    assert error.value.status_code == 503
+    assert error.value.upstream
+    assert limited.throttled == 1
+    assert limited.limiter.current == 2
+
+    for _ in range(20):
+        assert app_loop.run_until_complete(call_service('polly', client.synthesize_speech, Text='hi')) == b'audio'
+
+    assert limited.limiter.current == 4
+    assert limited.in_flight == 0
+
+
+def test_burst_of_throttles_counts_as_one_signal():
+    limiter = AIMDLimiter(max_limit=10, backoff=0.5, decrease_cooldown=60.0)
+    for _ in range(5):
+        limiter.on_congestion()
+
+    assert limiter.current == 5
+
+
+def test_slow_calls_shrink_the_limit():
+    limiter = AIMDLimiter(max_limit=10, backoff=0.5, latency_target=1.0, decrease_cooldown=0.0)
+    limiter.on_success(0.5)
+    assert limiter.current == 10
+
+    limiter.on_success(2.0)
+    assert limiter.current == 5
+
+
+def test_latency_target_defaults_per_service(monkeypatch):
+    assert AdmissionController.from_env('polly').limiter.latency_target == admission.DEFAULT_LATENCY_TARGETS['polly']
+
+    monkeypatch.setenv('POLLY_LATENCY_TARGET_SECONDS', '0')
+    assert AdmissionController.from_env('polly').limiter.latency_target is None
+
+
+def test_freed_slots_go_to_interactive_waiters_before_bulk(app_loop, polly):
+    limited = polly(max_concurrency=2, bulk_share=0.5)
+    order = []
+
+    async def hold(name: str, bulk: bool, release: asyncio.Event):
+        if bulk:
+            with bulk_priority():
+                async with admitted('polly'):
+                    order.append(name)
+                    await release.wait()
+        else:
+            async with admitted('polly'):
+                order.append(name)
+                await release.wait()
+
+    async def scenario():
+        events = {name: asyncio.Event() for name in ('a', 'b', 'bulk', 'interactive')}
+        holders = [asyncio.ensure_future(hold('a', False, events['a'])),
+                   asyncio.ensure_future(hold('b', False, events['b']))]
+        await asyncio.sleep(0)
+        # The bulk call queues first, then an interactive one
+        holders.append(asyncio.ensure_future(hold('bulk', True, events['bulk'])))
+        await asyncio.sleep(0)
+        holders.append(asyncio.ensure_future(hold('interactive', False, events['interactive'])))
+        await asyncio.sleep(0)
+        assert limited.stats()["queued"] == 1 and limited.stats()["queued_bulk"] == 1
+
+        events['a'].set()
+        await asyncio.sleep(0.01)
+        assert order == ['a', 'b', 'interactive']
+        assert limited.stats()["queued_bulk"] == 1
+
+        events['b'].set()
+        await asyncio.sleep(0.01)
+        assert order == ['a', 'b', 'interactive', 'bulk']
+
+        events['interactive'].set()
+        events['bulk'].set()
+        await asyncio.gather(*holders)
+
+    app_loop.run_until_complete(scenario())
+
+    assert limited.stats()["in_flight"] == 0
+    assert limited.stats()["in_flight_bulk"] == 0
+    assert limited.admitted_bulk == 1
+
+
+def test_bulk_calls_are_capped_at_their_share(app_loop, polly):
+    limited = polly(max_concurrency=4, bulk_share=0.5, bulk_queue_timeout=0.05)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def bulk_call():
+            with bulk_priority():
+                async with admitted('polly'):
+                    await release.wait()
+
+        running = [asyncio.ensure_future(bulk_call()) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(ServiceOverloaded):
+            await bulk_call()
+        # Interactive calls still get the remaining slots
+        async with admitted('polly'):
+            assert limited.stats()["in_flight"] == 3
+        release.set()
+        await asyncio.gather(*running)
+
+    app_loop.run_until_complete(scenario())
+    assert limited.stats()["in_flight_bulk"] == 0
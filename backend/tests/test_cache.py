@@ -0,0 +1,79 @@
+import os
+
+from cache import DiskBlobCache, ExtractionCache, LRUCache
+
+
+def test_lru_evicts_least_recently_used_by_size():
+    cache = LRUCache(max_bytes=10)
+    cache.set('a', b'xxxx')
+    cache.set('b', b'xxxx')
+    cache.get('a')
+    cache.set('c', b'xxxx')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'xxxx'
+    assert cache.current_bytes == 8
+
+
+def test_blob_cache_round_trip(app_loop, tmp_path):
+    cache = DiskBlobCache(str(tmp_path), max_bytes=1000, extension='.bin')
+    run = app_loop.run_until_complete
+
+    path = run(cache.put('key', b'data'))
+
+    assert path == cache.path('key')
+    assert run(cache.get('key')) == b'data'
+    assert run(cache.get_path('key')) == path
+    assert run(cache.get('missing')) is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_blob_cache_overwrite_replaces_size(app_loop, tmp_path):
+    cache = DiskBlobCache(str(tmp_path), max_bytes=1000)
+    for size in (100, 300, 50):
+        app_loop.run_until_complete(cache.put('key', b'x' * size))
+
+    assert cache.stats()['bytes'] == 50
+    assert cache.evictions == 0
+
+
+def test_blob_cache_touches_disk_only_when_opened_or_written(app_loop, tmp_path):
+    directory = tmp_path / 'blobs'
+    cache = DiskBlobCache(str(directory), max_bytes=1000)
+    assert not directory.exists()
+
+    directory.mkdir()
+    (directory / 'existing').write_bytes(b'x' * 70)
+    app_loop.run_until_complete(cache.open())
+    assert cache.stats()['bytes'] == 70
+
+    # Without open(), the first write sizes the directory
+    lazy = DiskBlobCache(str(directory), max_bytes=1000)
+    app_loop.run_until_complete(lazy.put('new', b'x' * 30))
+    assert lazy.stats()['bytes'] == 100
+
+
+def test_blob_cache_evicts_oldest_down_to_low_water(app_loop, tmp_path):
+    cache = DiskBlobCache(str(tmp_path), max_bytes=1000, low_water=0.5)
+    for index in range(10):
+        app_loop.run_until_complete(cache.put(f'k{index}', b'x' * 100))
+        # Distinct mtimes so eviction order is deterministic
+        os.utime(cache.path(f'k{index}'), (index, index))
+
+    app_loop.run_until_complete(cache.put('k10', b'x' * 100))
+
+    assert cache.stats()['bytes'] == 500
+    assert cache.evictions == 6
+    remaining = sorted(name for name in os.listdir(tmp_path))
+    assert remaining == ['k10', 'k6', 'k7', 'k8', 'k9']
+
+
+def test_extraction_cache_disk_tier_survives_a_new_instance(app_loop, tmp_path):
+    db_path = str(tmp_path / 'extractions.db')
+    app_loop.run_until_complete(ExtractionCache(1024, db_path).set('hash', 'text'))
+
+    cache = ExtractionCache(1024, db_path)
+
+    assert app_loop.run_until_complete(cache.get('hash')) == 'text'
+    assert app_loop.run_until_complete(cache.get('hash')) == 'text'
+    assert cache.stats()['disk_hits'] == 1
@@ -0,0 +1,37 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import documents
+from documents import DocumentStore
+
+
+def test_disk_tier_runs_on_its_own_pool(app_loop, tmp_path, monkeypatch):
+    threads = []
+    write = DocumentStore._write
+
+    def recording_write(self, doc_id, document):
+        threads.append(threading.current_thread().name)
+        write(self, doc_id, document)
+
+    monkeypatch.setattr(DocumentStore, '_write', recording_write)
+    store = DocumentStore(ttl=60, max_bytes=1024, directory=str(tmp_path))
+
+    async def scenario():
+        await store.put('doc', {"extracted_text": "hello"})
+        await store.update('doc', audio_id='a1')
+        # Another worker only has the disk copy
+        return await DocumentStore(ttl=60, max_bytes=1024, directory=str(tmp_path)).get('doc')
+
+    assert app_loop.run_until_complete(scenario()) == {"extracted_text": "hello", "audio_id": "a1"}
+    assert threads and all(name.startswith('pool-documents') for name in threads)
+
+
+def test_expired_documents_are_gone_from_both_tiers(app_loop, tmp_path, monkeypatch):
+    store = DocumentStore(ttl=60, max_bytes=1024, directory=str(tmp_path))
+    app_loop.run_until_complete(store.put('doc', {"extracted_text": "hello"}))
+    later = SimpleNamespace(monotonic=lambda: time.monotonic() + 61, time=lambda: time.time() + 61)
+    monkeypatch.setattr(documents, 'time', later)
+
+    assert app_loop.run_until_complete(store.get('doc')) is None
+    assert not list(tmp_path.iterdir())
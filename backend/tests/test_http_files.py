@@ -0,0 +1,61 @@
+import pytest
+from fastapi import FastAPI, Request
+
+from http_files import cached_file_response
+
+CONTENT = bytes(range(10))
+
+
+@pytest.fixture
+def files_client(make_client, tmp_path):
+    path = tmp_path / 'file.bin'
+    path.write_bytes(CONTENT)
+    app = FastAPI()
+
+    @app.get('/file')
+    async def get_file(request: Request):
+        return cached_file_response(request, str(path), media_type='application/octet-stream', etag='abc')
+
+    return make_client(app)
+
+
+@pytest.mark.parametrize('header, start, end', [
+    ('bytes=2-4', 2, 4),
+    ('bytes=7-', 7, 9),
+    ('bytes=-3', 7, 9),
+    ('bytes=5-100', 5, 9),
+    ('bytes=-100', 0, 9),
+])
+def test_single_range(files_client, header, start, end):
+    response = files_client.get('/file', headers={'Range': header})
+
+    assert response.status_code == 206
+    assert response.content == CONTENT[start:end + 1]
+    assert response.headers['content-range'] == f'bytes {start}-{end}/{len(CONTENT)}'
+
+
+@pytest.mark.parametrize('header', ['bytes=0-1,4-5', 'bytes=4-2', 'bytes=-', 'items=0-1', 'garbage'])
+def test_unsupported_or_malformed_range_serves_whole_file(files_client, header):
+    response = files_client.get('/file', headers={'Range': header})
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+@pytest.mark.parametrize('header', ['bytes=10-', 'bytes=20-30', 'bytes=-0'])
+def test_out_of_bounds_range_is_416(files_client, header):
+    response = files_client.get('/file', headers={'Range': header})
+
+    assert response.status_code == 416
+    assert response.headers['content-range'] == f'bytes */{len(CONTENT)}'
+
+
+def test_if_range_mismatch_serves_whole_file(files_client):
+    response = files_client.get('/file', headers={'Range': 'bytes=0-1', 'If-Range': '"other"'})
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_none_match(files_client):
+    assert files_client.get('/file', headers={'If-None-Match': '"abc"'}).status_code == 304
@@ -0,0 +1,222 @@
+import asyncio
+import os
+import sqlite3
+import time
+
+import pytest
+
+from jobs import JobQueue, JobStore, LeaseLost
+from pipeline import Stage
+
+
+def simple_stages(item: dict) -> list:
+    async def extract(results):
+        return {"doc_id": f"doc-{item['index']}", "extracted_text": item["file_name"].upper()}
+
+    async def simplify(results):
+        return {"simplified_text": results["extract"]["extracted_text"].lower()}
+
+    return [Stage("extract", extract), Stage("simplify", simplify, depends_on=["extract"])]
+
+
+def describe_error(stage: str, error: Exception) -> dict:
+    return {"stage": stage, "detail": str(error)}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    return JobQueue(store, str(tmp_path / 'files'), simple_stages, describe_error, workers=2, poll_interval=0.05)
+
+
+def job_files(queue: JobQueue, job_id: str, count: int) -> list:
+    os.makedirs(queue.directory, exist_ok=True)
+    files = []
+    for index in range(count):
+        path = f"{queue.job_dir(job_id)}-{index}.txt"
+        with open(path, 'w') as f:
+            f.write('x')
+        files.append({"file_name": f"file{index}.txt", "file_ext": ".txt", "content_hash": str(index), "path": path})
+    return files
+
+
+async def wait_until_done(queue: JobQueue, job_id: str, timeout: float = 5.0) -> list:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        events = await queue.events(job_id)
+        if events and events[-1][1] == "done":
+            return events
+        await queue.wait_for_events(0.05)
+    raise AssertionError("Job did not finish")
+
+
+def test_job_runs_every_item_through_the_stages(app_loop, queue):
+    async def scenario():
+        queue.start()
+        try:
+            await queue.submit("job1", job_files(queue, "job1", 3), 0, {})
+            events = await wait_until_done(queue, "job1")
+            return events, await queue.job("job1"), await queue.stats()
+        finally:
+            await queue.stop()
+
+    events, job, stats = app_loop.run_until_complete(scenario())
+
+    assert job["status"] == "completed"
+    assert [item["stages"]["simplify"]["simplified_text"] for item in job["items"]] == ["file0.txt", "file1.txt", "file2.txt"]
+    assert events[-1][2]["status"] == "completed"
+    assert sum(1 for _, event_type, _ in events if event_type == "stage") == 6
+    assert stats["items_done"] == 3
+
+
+def test_store_lock_held_elsewhere_does_not_block_the_loop(app_loop, queue):
+    # Another process holds the write lock, so claim() waits on SQLite's busy timeout
+    other = sqlite3.connect(queue.store.path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    async def scenario():
+        queue.start()
+        try:
+            gaps = []
+            last = time.monotonic()
+            for _ in range(20):
+                await asyncio.sleep(0.01)
+                now = time.monotonic()
+                gaps.append(now - last)
+                last = now
+            other.execute("ROLLBACK")
+            return max(gaps)
+        finally:
+            await queue.stop()
+
+    try:
+        worst_gap = app_loop.run_until_complete(scenario())
+    finally:
+        other.close()
+
+    assert worst_gap < 0.1
+
+
+def test_cancel_removes_queued_items_and_their_files(app_loop, queue):
+    async def scenario():
+        files = job_files(queue, "job2", 2)
+        await queue.submit("job2", files, 0, {})
+        return files, await queue.cancel("job2"), await queue.cancel("missing")
+
+    files, job, missing = app_loop.run_until_complete(scenario())
+
+    assert job["status"] == "cancelled"
+    assert {item["status"] for item in job["items"]} == {"cancelled"}
+    assert missing is None
+    for f in files:
+        with pytest.raises(FileNotFoundError):
+            open(f["path"])
+
+
+def flaky(fn, failures: int):
+    """Wrap a store method so its first `failures` calls find the database locked."""
+    calls = []
+
+    def call(*args):
+        calls.append(args)
+        if len(calls) <= failures:
+            raise sqlite3.OperationalError("database is locked")
+        return fn(*args)
+    call.__name__ = fn.__name__
+    call.calls = calls
+    return call
+
+
+def test_worker_survives_store_errors(app_loop, queue, monkeypatch):
+    monkeypatch.setattr(queue.store, 'save_stage', flaky(queue.store.save_stage, 2))
+    monkeypatch.setattr(queue.store, 'finish', flaky(queue.store.finish, 2))
+
+    async def scenario():
+        queue.start()
+        try:
+            await queue.submit("job3", job_files(queue, "job3", 1), 0, {})
+            await wait_until_done(queue, "job3")
+            await queue.submit("job4", job_files(queue, "job4", 1), 0, {})
+            await wait_until_done(queue, "job4")
+            return await queue.job("job3"), [task.done() for task in queue._tasks]
+        finally:
+            await queue.stop()
+
+    job, workers_done = app_loop.run_until_complete(scenario())
+
+    assert job["status"] == "completed"
+    assert job["items"][0]["attempts"] == 1
+    assert workers_done == [False, False]
+
+
+def test_worker_that_lost_its_lease_cannot_overwrite_the_new_owner(app_loop, queue):
+    app_loop.run_until_complete(queue.submit("job5", job_files(queue, "job5", 1), 0, {}))
+    stale, _ = queue.store.claim("stale-worker", -1.0, 3)
+    current, _ = queue.store.claim("current-worker", 60.0, 3)
+    queue.store.save_stage(current, "extract", {"doc_id": "current"})
+
+    with pytest.raises(LeaseLost):
+        queue.store.save_stage(stale, "extract", {"doc_id": "stale"})
+    with pytest.raises(LeaseLost):
+        queue.store.finish(stale, "failed", [{"detail": "stale"}])
+
+    item = queue.store.job("job5")["items"][0]
+    assert item["status"] == "running"
+    assert item["stages"] == {"extract": {"doc_id": "current"}}
+    assert queue.store.finish(current, "done") == ("done", True)
+
+
+def test_expired_lease_on_the_last_attempt_fails_the_item(app_loop, tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    queue = JobQueue(store, str(tmp_path / 'files'), simple_stages, describe_error, workers=1,
+                     max_attempts=2, poll_interval=0.05)
+    files = job_files(queue, "job6", 1)
+    app_loop.run_until_complete(queue.submit("job6", files, 0, {}))
+    # Two workers in turn crash while holding the item
+    for owner in ("crashed-1", "crashed-2"):
+        item, abandoned = store.claim(owner, -1.0, 2)
+        assert item is not None and not abandoned
+
+    async def scenario():
+        queue.start()
+        try:
+            return await wait_until_done(queue, "job6")
+        finally:
+            await queue.stop()
+
+    events = app_loop.run_until_complete(scenario())
+
+    job = store.job("job6")
+    assert job["status"] == "failed"
+    assert job["items"][0]["attempts"] == 2
+    assert job["items"][0]["errors"][0]["detail"] == "Processing was interrupted too many times."
+    assert [event_type for _, event_type, _ in events][-2:] == ["item_failed", "done"]
+    with pytest.raises(FileNotFoundError):
+        open(files[0]["path"])
+
+
+def test_heartbeat_keeps_renewing_after_an_error(app_loop, tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+
+    def slow_stages(item: dict) -> list:
+        async def extract(results):
+            await asyncio.sleep(0.5)
+            return {"doc_id": "slow"}
+        return [Stage("extract", extract)]
+
+    queue = JobQueue(store, str(tmp_path / 'files'), slow_stages, describe_error, workers=1,
+                     lease_seconds=0.3, poll_interval=0.05)
+    monkeypatch.setattr(store, 'renew', flaky(store.renew, 1))
+
+    async def scenario():
+        queue.start()
+        try:
+            await queue.submit("job7", job_files(queue, "job7", 1), 0, {})
+            await wait_until_done(queue, "job7")
+        finally:
+            await queue.stop()
+
+    app_loop.run_until_complete(scenario())
+
+    assert store.job("job7")["status"] == "completed"
+    assert len(store.renew.calls) >= 3
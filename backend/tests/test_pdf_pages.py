@@ -0,0 +1,108 @@
+import io
+import threading
+
+from pypdf import PdfReader, PdfWriter
+
+import main
+from pdf_pages import PdfPages
+from uploads import UploadStats
+
+
+def pdf_bytes(page_count: int) -> bytes:
+    writer = PdfWriter()
+    for index in range(page_count):
+        # Distinct sizes, so every page has its own bytes (and extraction cache entry)
+        writer.add_blank_page(width=200 + index, height=200)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+class PageSizeTextract:
+    """Stands in for the Textract client, "reading" each page's width."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def detect_document_text(self, Document):
+        self.calls += 1
+        width = PdfReader(io.BytesIO(Document['Bytes'])).pages[0].mediabox.width
+        return {'Blocks': [{'BlockType': 'LINE', 'Text': f"page {int(width) - 200}"}]}
+
+
+def test_pages_are_split_out_only_when_loaded():
+    pages = PdfPages(pdf_bytes(5))
+
+    assert len(pages) == 5
+    assert pages.peak_bytes == 0
+
+    first = pages.load(0)
+    second = pages.load(3)
+    assert len(PdfReader(io.BytesIO(first)).pages) == 1
+    assert pages.resident_bytes == len(first) + len(second)
+
+    pages.release(first)
+    pages.release(second)
+    assert pages.resident_bytes == 0
+    assert pages.peak_bytes == len(first) + len(second)
+
+
+def test_single_page_and_unreadable_pdfs_are_passed_through():
+    single = pdf_bytes(1)
+    assert PdfPages(single).load(0) == single
+
+    garbage = b'%PDF-1.4 not really a pdf'
+    pages = PdfPages(garbage)
+    assert len(pages) == 1
+    assert pages.load(0) == garbage
+
+
+def test_upload_extracts_pages_in_order(client, monkeypatch):
+    textract = PageSizeTextract()
+    monkeypatch.setattr(main, 'textract_client', textract)
+
+    response = client.post('/upload', files={'file': ('pages.pdf', pdf_bytes(6), 'application/pdf')})
+
+    assert response.status_code == 200
+    assert response.json()['extracted_text'] == ' '.join(f"page {index}" for index in range(6))
+    assert textract.calls == 6
+
+
+def test_upload_over_the_page_limit_is_rejected(client, monkeypatch):
+    textract = PageSizeTextract()
+    monkeypatch.setattr(main, 'textract_client', textract)
+    monkeypatch.setattr(main, 'PDF_MAX_PAGES', 3)
+
+    response = client.post('/upload', files={'file': ('long.pdf', pdf_bytes(4), 'application/pdf')})
+    streamed = client.post('/upload/stream', files={'file': ('long.pdf', pdf_bytes(5), 'application/pdf')})
+
+    assert response.status_code == 400
+    assert "at most 3" in response.json()['detail']
+    assert streamed.status_code == 400
+    assert textract.calls == 0
+
+
+class OverlappingTextract(PageSizeTextract):
+    """Holds each call until `overlap` pages are being extracted at once."""
+
+    def __init__(self, overlap: int):
+        super().__init__()
+        self.barrier = threading.Barrier(overlap, timeout=5)
+
+    def detect_document_text(self, Document):
+        self.barrier.wait()
+        return super().detect_document_text(Document)
+
+
+def test_peak_memory_counts_every_page_in_flight(client, monkeypatch):
+    monkeypatch.setattr(main, 'textract_client', OverlappingTextract(overlap=2))
+    monkeypatch.setattr(main, 'PDF_PAGE_CONCURRENCY', 2)
+    monkeypatch.setattr(main, 'upload_stats', UploadStats())
+    document = pdf_bytes(2)
+    pages = PdfPages(document)
+    both_pages = len(pages.load(0)) + len(pages.load(1))
+
+    response = client.post('/upload', files={'file': ('overlap.pdf', document, 'application/pdf')})
+
+    assert response.status_code == 200
+    assert main.upload_stats.peak_in_memory_bytes == both_pages
@@ -0,0 +1,169 @@
+import asyncio
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+import admission
+import resilience
+from admission import AdmissionController, ServiceOverloaded
+from resilience import CircuitBreaker, CircuitOpen, LatencyTracker, ResiliencePolicy, UpstreamTimeout, resilient_call
+from test_admission import throttling_error
+
+
+def server_error():
+    return ClientError({'Error': {'Code': 'ServiceUnavailableException', 'Message': 'Try later'},
+                        'ResponseMetadata': {'HTTPStatusCode': 503}}, 'SynthesizeSpeech')
+
+
+class FakePolly:
+    """Fake upstream that answers from a script: an exception to raise, seconds to stall, or a result."""
+
+    def __init__(self, *script, then=b'audio'):
+        self.script = list(script)
+        self.then = then
+        self.calls = 0
+
+    def synthesize_speech(self, **kwargs):
+        self.calls += 1
+        step = self.script.pop(0) if self.script else self.then
+        if isinstance(step, Exception):
+            raise step
+        if isinstance(step, float):
+            time.sleep(step)
+            return b'slow audio'
+        return step
+
+
+@pytest.fixture
+def polly(monkeypatch):
+    """Fresh admission controller, breaker and latency window for 'polly'; returns a policy installer."""
+    monkeypatch.setitem(admission.admission_controllers, 'polly', AdmissionController(
+        'polly', rate=0.0, burst=1.0, max_concurrency=8, max_queue=8, queue_timeout=1.0, bulk_share=0.5))
+    monkeypatch.setitem(resilience.latencies, 'polly', LatencyTracker())
+
+    def install(deadline=5.0, hedge=False, max_attempts=3, failure_threshold=5, reset_timeout=30.0):
+        monkeypatch.setitem(resilience.policies, 'polly', ResiliencePolicy(
+            deadline=deadline, hedge=hedge, max_attempts=max_attempts, base_delay=0.001, max_delay=0.01))
+        breaker = CircuitBreaker('polly', failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        monkeypatch.setitem(resilience.breakers, 'polly', breaker)
+        return breaker
+    return install
+
+
+def test_retries_until_success(app_loop, polly):
+    breaker = polly()
+    client = FakePolly(server_error(), server_error())
+
+    assert app_loop.run_until_complete(resilient_call('polly', client.synthesize_speech, Text='hi')) == b'audio'
+    assert client.calls == 3
+    assert breaker.failures == 0
+
+
+def test_retries_stop_at_max_attempts_and_count_as_one_failure(app_loop, polly):
+    breaker = polly(max_attempts=3)
+    client = FakePolly(*[server_error()] * 5)
+
+    with pytest.raises(ClientError):
+        app_loop.run_until_complete(resilient_call('polly', client.synthesize_speech, Text='hi'))
+
+    assert client.calls == 3
+    assert breaker.failures == 1
+
+
+def test_stalled_call_stops_at_the_deadline(app_loop, polly):
+    breaker = polly(deadline=0.1)
+    client = FakePolly(0.5)
+
+    started = time.monotonic()
+    with pytest.raises(UpstreamTimeout) as error:
+        app_loop.run_until_complete(resilient_call('polly', client.synthesize_speech, Text='hi'))
+
+    assert time.monotonic() - started < 0.4
+    assert error.value.status_code == 504
+    assert client.calls == 1
+    assert breaker.failures == 1
+
+
+def test_hedge_fires_after_p95(app_loop, polly):
+    polly(hedge=True)
+    for _ in range(20):
+        resilience.latencies['polly'].record(0.02)
+    hedges = resilience.hedges_started.get('polly', 0)
+    # The first request stalls; the hedge answers
+    client = FakePolly(0.5)
+
+    started = time.monotonic()
+    result = app_loop.run_until_complete(resilient_call('polly', client.synthesize_speech, Text='hi'))
+
+    assert result == b'audio'
+    assert time.monotonic() - started < 0.4
+    assert client.calls == 2
+    assert resilience.hedges_started['polly'] == hedges + 1
+
+
+def test_no_hedge_without_enough_latency_samples(app_loop, polly):
+    polly(hedge=True)
+    client = FakePolly(0.1)
+
+    assert app_loop.run_until_complete(resilient_call('polly', client.synthesize_speech, Text='hi')) == b'slow audio'
+    assert client.calls == 1
+
+
+def test_throttling_does_not_open_the_circuit(app_loop, polly):
+    breaker = polly(max_attempts=2, failure_threshold=2)
+    client = FakePolly(*[throttling_error()] * 4)
+
+    for _ in range(2):
+        with pytest.raises(ServiceOverloaded):
+            app_loop.run_until_complete(resilient_call('polly', client.synthesize_speech, Text='hi'))
+
+    assert client.calls == 4
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_circuit_opens_then_half_opens_for_one_trial(app_loop, polly):
+    breaker = polly(max_attempts=1, failure_threshold=2, reset_timeout=0.05)
+    client = FakePolly(server_error(), server_error())
+
+    for _ in range(2):
+        with pytest.raises(ClientError):
+            app_loop.run_until_complete(resilient_call('polly', client.synthesize_speech, Text='hi'))
+    assert breaker.state == "open"
+
+    # Fails fast without calling upstream
+    with pytest.raises(CircuitOpen):
+        app_loop.run_until_complete(resilient_call('polly', client.synthesize_speech, Text='hi'))
+    assert client.calls == 2
+
+    time.sleep(0.06)
+    slow = FakePolly(0.1)
+
+    async def trial_and_concurrent_call():
+        trial = asyncio.ensure_future(resilient_call('polly', slow.synthesize_speech, Text='hi'))
+        await asyncio.sleep(0.01)
+        with pytest.raises(CircuitOpen):
+            await resilient_call('polly', slow.synthesize_speech, Text='hi')
+        return await trial
+
+    assert app_loop.run_until_complete(trial_and_concurrent_call()) == b'slow audio'
+    assert slow.calls == 1
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens_the_circuit(app_loop, polly):
+    breaker = polly(max_attempts=2, failure_threshold=1, reset_timeout=0.05)
+    client = FakePolly(*[server_error()] * 4)
+
+    with pytest.raises(ClientError):
+        app_loop.run_until_complete(resilient_call('polly', client.synthesize_speech, Text='hi'))
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    with pytest.raises(ClientError):
+        app_loop.run_until_complete(resilient_call('polly', client.synthesize_speech, Text='hi'))
+
+    assert client.calls == 4
+    assert breaker.state == "open"
+    assert breaker.times_opened == 2
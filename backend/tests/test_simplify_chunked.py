@@ -0,0 +1,55 @@
+import json
+
+import main
+from test_streaming import StubBody
+
+PARAGRAPHS = [
+    "Chunked test: mitochondria make energy for the cell.",
+    "Chunked test: ribosomes build proteins from amino acids.",
+    "Chunked test: the membrane controls what enters the cell.",
+]
+
+
+class ChunkBedrock:
+    """Simplifies each chunk, but answers gibberish for chunks containing `broken`."""
+
+    def __init__(self, broken: str = None):
+        self.broken = broken
+        self.calls = 0
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.calls += 1
+        text = json.loads(body)['messages'][0]['content'][0]['text']
+        if self.broken and self.broken in text:
+            answer = "Sorry, I can't help with that."
+        else:
+            sentence = next(paragraph for paragraph in PARAGRAPHS if paragraph in text)
+            answer = json.dumps({"simplified_text": sentence.upper(), "key_terms": [], "step_by_step": []})
+        return {'body': StubBody(json.dumps({'content': [{'text': answer}]}).encode('utf-8'))}
+
+
+def test_partial_merge_is_reported_and_not_stored(app_loop, client, monkeypatch):
+    monkeypatch.setattr(main, 'SIMPLIFY_CHUNK_CHARS', 70)
+    doc_id = 'chunked-test-doc'
+    app_loop.run_until_complete(main.document_store.put(doc_id, {
+        "extracted_text": "\n\n".join(PARAGRAPHS), "file_name": "cells.pdf", "file_type": ".pdf",
+    }))
+    bedrock = ChunkBedrock(broken="ribosomes")
+    monkeypatch.setattr(main, 'bedrock_client', bedrock)
+
+    partial = client.post('/simplify', json={"doc_id": doc_id}).json()
+
+    assert partial["failed_chunks"] == [2]
+    assert partial["simplified_text"] == f"{PARAGRAPHS[0].upper()}\n\n{PARAGRAPHS[2].upper()}"
+    assert "simplified" not in app_loop.run_until_complete(main.document_store.get(doc_id))
+
+    # Only the missing chunk goes back to the model
+    bedrock.broken = None
+    calls = bedrock.calls
+    complete = client.post('/simplify', json={"doc_id": doc_id}).json()
+
+    assert complete["failed_chunks"] == []
+    assert complete["simplified_text"] == "\n\n".join(paragraph.upper() for paragraph in PARAGRAPHS)
+    assert bedrock.calls == calls + 1
+    assert client.post('/simplify', json={"doc_id": doc_id}).json() == complete
+    assert bedrock.calls == calls + 1
@@ -0,0 +1,178 @@
+import json
+
+import pytest
+
+import main
+import resilience
+from streaming import IncrementalJSONParser
+
+SIMPLIFIED = {
+    "simplified_text": "Cells say \"hi\" with {braces} and [brackets], a back\\slash\nand café.",
+    "key_terms": [
+        {"term": "cell", "definition": "The smallest unit {of life}."},
+        {"term": "nucleus", "definition": "Holds DNA, \"the code\".", "extra": {"nested": [1, {"a": "]"}]}},
+    ],
+    "step_by_step": ["Step 1: eat", "Step 2: grow ]}"],
+}
+
+
+def feed_in_pieces(text: str, size: int):
+    parser = IncrementalJSONParser()
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return parser, events
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10000])
+def test_reports_fields_items_and_done_for_any_split(size):
+    text = json.dumps(SIMPLIFIED)
+    parser, events = feed_in_pieces(text, size)
+
+    assert parser.done
+    assert events == [
+        ("field", "simplified_text", SIMPLIFIED["simplified_text"]),
+        ("item", "key_terms", 0, SIMPLIFIED["key_terms"][0]),
+        ("item", "key_terms", 1, SIMPLIFIED["key_terms"][1]),
+        ("item", "step_by_step", 0, SIMPLIFIED["step_by_step"][0]),
+        ("item", "step_by_step", 1, SIMPLIFIED["step_by_step"][1]),
+        ("done", SIMPLIFIED),
+    ]
+
+
+@pytest.mark.parametrize("size", [1, 5])
+def test_ignores_preamble_and_trailing_text(size):
+    text = "Sure! Here is the JSON you asked for:\n" + json.dumps({"simplified_text": "ok"}) + "\nHope that helps {"
+    parser, events = feed_in_pieces(text, size)
+
+    assert parser.done
+    assert events == [("field", "simplified_text", "ok"), ("done", {"simplified_text": "ok"})]
+
+
+def test_escaped_quote_split_across_fragments():
+    parser = IncrementalJSONParser()
+    events = parser.feed('{"simplified_text": "a \\')
+    events += parser.feed('"quoted\\" } b"}')
+
+    assert events == [("field", "simplified_text", 'a "quoted" } b'), ("done", {"simplified_text": 'a "quoted" } b'})]
+
+
+def test_nested_object_field_is_reported_whole():
+    parser, events = feed_in_pieces('{"meta": {"a": [1, 2], "b": "}"}, "steps": [[1], ["x"]]}', 1)
+
+    assert events[0] == ("field", "meta", {"a": [1, 2], "b": "}"})
+    assert events[1:3] == [("item", "steps", 0, [1]), ("item", "steps", 1, ["x"])]
+    assert events[-1][0] == "done"
+
+
+def test_truncated_stream_reports_only_completed_values():
+    text = json.dumps(SIMPLIFIED)
+    cut = text.index('"step_by_step"') + len('"step_by_step": ["Step 1: ea')
+    parser, events = feed_in_pieces(text[:cut], 4)
+
+    assert not parser.done
+    assert [event[0] for event in events] == ["field", "item", "item"]
+
+
+class StreamingBedrock:
+    """Stands in for the Bedrock runtime client, streaming `text` in small deltas."""
+
+    def __init__(self, text: str, delta_chars: int = 7):
+        self.text = text
+        self.delta_chars = delta_chars
+        self.calls = 0
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        self.calls += 1
+
+        def events():
+            yield {'chunk': {'bytes': json.dumps({'type': 'message_start'}).encode('utf-8')}}
+            for i in range(0, len(self.text), self.delta_chars):
+                delta = {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': self.text[i:i + self.delta_chars]}}
+                yield {'chunk': {'bytes': json.dumps(delta).encode('utf-8')}}
+            yield {'chunk': {'bytes': json.dumps({'type': 'message_stop'}).encode('utf-8')}}
+        return {'body': events()}
+
+
+def parse_sse(body: str) -> list:
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_simplify_stream_emits_events_as_the_model_streams(client, monkeypatch):
+    bedrock = StreamingBedrock("Here you go: " + json.dumps(SIMPLIFIED))
+    monkeypatch.setattr(main, 'bedrock_client', bedrock)
+
+    response = client.post('/simplify/stream', json={"text": "Streaming test text about cells."})
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/event-stream')
+    assert parse_sse(response.text) == [
+        ("simplified_text", {"simplified_text": SIMPLIFIED["simplified_text"]}),
+        ("key_term", {"index": 0, "item": SIMPLIFIED["key_terms"][0]}),
+        ("key_term", {"index": 1, "item": SIMPLIFIED["key_terms"][1]}),
+        ("step", {"index": 0, "item": SIMPLIFIED["step_by_step"][0]}),
+        ("step", {"index": 1, "item": SIMPLIFIED["step_by_step"][1]}),
+        ("done", SIMPLIFIED),
+    ]
+
+    # The completed result is cached, so the same text is served without calling the model again
+    again = client.post('/simplify/stream', json={"text": "Streaming test text about cells."})
+    assert parse_sse(again.text)[-1] == ("done", SIMPLIFIED)
+    assert bedrock.calls == 1
+
+
+def test_simplify_stream_reports_fallback_when_the_stream_is_cut_off(client, monkeypatch):
+    text = json.dumps(SIMPLIFIED)
+    monkeypatch.setattr(main, 'bedrock_client', StreamingBedrock(text[:len(text) // 2]))
+
+    response = client.post('/simplify/stream', json={"text": "Truncated stream test text."})
+
+    events = parse_sse(response.text)
+    assert events[0] == ("simplified_text", {"simplified_text": SIMPLIFIED["simplified_text"]})
+    assert events[-1] == ("error", main.SIMPLIFY_FALLBACK)
+    assert "done" not in [event for event, _ in events]
+
+
+def test_simplify_stream_rejects_empty_text(client):
+    response = client.post('/simplify/stream', json={"text": ""})
+
+    assert response.status_code == 400
+
+
+class FallbackBedrock(StreamingBedrock):
+    """Also answers (non-streaming) calls to the fallback model."""
+
+    def invoke_model(self, modelId, body, **kwargs):
+        assert modelId == main.SIMPLIFY_FALLBACK_MODEL_ID
+        payload = {'generation': json.dumps(SIMPLIFIED)}
+        return {'body': StubBody(json.dumps(payload).encode('utf-8'))}
+
+
+class StubBody:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+def test_simplify_stream_does_not_steal_the_half_open_trial(client, monkeypatch):
+    breaker = resilience.CircuitBreaker(main.SIMPLIFY_MODEL_ID, failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    monkeypatch.setitem(resilience.breakers, main.SIMPLIFY_MODEL_ID, breaker)
+    bedrock = FallbackBedrock(json.dumps(SIMPLIFIED))
+    monkeypatch.setattr(main, 'bedrock_client', bedrock)
+    # Another request's trial call is in flight
+    breaker.check()
+
+    response = client.post('/simplify/stream', json={"text": "Half-open circuit test text."})
+
+    assert parse_sse(response.text)[-1] == ("done", SIMPLIFIED)
+    assert bedrock.calls == 0
+    # The trial is still owned by the other request, so nobody else gets one
+    with pytest.raises(resilience.CircuitOpen):
+        breaker.check()
@@ -0,0 +1,28 @@
+import main
+
+
+class CountingBedrock:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke_model(self, **kwargs):
+        self.calls += 1
+        raise AssertionError("No image should be generated")
+
+
+def test_visualize_rejects_too_many_steps(client, monkeypatch):
+    bedrock = CountingBedrock()
+    monkeypatch.setattr(main, 'bedrock_client', bedrock)
+    steps = [f"Step {index}" for index in range(main.VISUALIZE_MAX_STEPS + 1)]
+
+    for path in ('/visualize', '/visualize/stream'):
+        response = client.post(path, json={"step_by_step": steps})
+        assert response.status_code == 400
+        assert str(main.VISUALIZE_MAX_STEPS) in response.json()["detail"]
+    assert bedrock.calls == 0
+
+
+def test_visualize_rejects_blank_steps(client):
+    response = client.post('/visualize', json={"step_by_step": ["  ", ""]})
+
+    assert response.status_code == 400
@@ -0,0 +1,195 @@
+"""Bounded-memory upload handling.
+
+Oversized uploads are rejected before their body is buffered: from the
+Content-Length header when there is one, otherwise as soon as the running
+byte count passes the limit. Accepted bodies are spooled by the multipart
+parser (memory up to UPLOAD_SPOOL_MAX_BYTES, then a temp file) and read
+back in fixed-size chunks, so a large upload never becomes one giant bytes
+object. The file type comes from the magic bytes, not the filename.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette.formparsers import MultiPartParser
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Multipart framing (boundaries, part headers) on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+MAGIC_SIGNATURES = (
+    (b'%PDF-', '.pdf'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+)
+SNIFF_BYTES = max(len(signature) for signature, _ in MAGIC_SIGNATURES)
+EQUIVALENT_EXTENSIONS = {'.jpeg': '.jpg'}
+
+# Uploads up to this size stay in memory; larger ones roll over to a temp file
+MultiPartParser.max_file_size = int(os.getenv('UPLOAD_SPOOL_MAX_BYTES', 1024 * 1024))
+
+
+class UploadTooLarge(HTTPException):
+
+    def __init__(self, max_bytes: int):
+        super().__init__(
+            status_code=413,
+            detail=f"File size exceeds maximum limit of {max_bytes/1024/1024:.1f}MB",
+        )
+
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    """The file extension implied by the first bytes of a file, if it is a supported type."""
+    for signature, extension in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+def same_type(file_ext: str, sniffed_ext: str) -> bool:
+    return EQUIVALENT_EXTENSIONS.get(file_ext, file_ext) == sniffed_ext
+
+
+def hash_stream(stream) -> tuple:
+    """SHA-256 hex digest and size of a seekable binary stream, read in chunks."""
+    digest = hashlib.sha256()
+    size = 0
+    stream.seek(0)
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+
+def copy_stream(stream):
+    """Copy an upload into a spooled file the caller owns and must close.
+
+    Uploads are closed as soon as the endpoint returns, so streaming
+    responses that read the document later need their own copy.
+    """
+    copy = tempfile.SpooledTemporaryFile(max_size=MultiPartParser.max_file_size)
+    stream.seek(0)
+    shutil.copyfileobj(stream, copy, UPLOAD_CHUNK_BYTES)
+    copy.seek(0)
+    return copy
+
+
+def read_stream(stream) -> bytes:
+    stream.seek(0)
+    return stream.read()
+
+
+class UploadStats:
+    """Upload sizes, rejections and how much of each body was held in memory."""
+
+    def __init__(self):
+        self.accepted = 0
+        self.bytes_accepted = 0
+        self.rejected_content_length = 0
+        self.rejected_streaming = 0
+        self.rejected_type = 0
+        self.spooled_to_disk = 0
+        self.peak_in_memory_bytes = 0
+        self.images_preprocessed = 0
+        self.preprocess_bytes_before = 0
+        self.preprocess_bytes_after = 0
+        self.preprocess_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_accepted(self, size: int, in_memory_bytes: int, spooled: bool):
+        with self._lock:
+            self.accepted += 1
+            self.bytes_accepted += size
+            if spooled:
+                self.spooled_to_disk += 1
+            self.peak_in_memory_bytes = max(self.peak_in_memory_bytes, in_memory_bytes)
+
+    def record_materialized(self, in_memory_bytes: int):
+        """Note bytes held in memory at once for one upload, e.g. a body or its pages in flight to Textract."""
+        with self._lock:
+            self.peak_in_memory_bytes = max(self.peak_in_memory_bytes, in_memory_bytes)
+
+    def record_preprocess(self, bytes_before: int, bytes_after: int, seconds: float):
+        with self._lock:
+            self.images_preprocessed += 1
+            self.preprocess_bytes_before += bytes_before
+            self.preprocess_bytes_after += bytes_after
+            self.preprocess_seconds += seconds
+
+    def stats(self) -> dict:
+        preprocessed = self.images_preprocessed
+        return {
+            "accepted": self.accepted,
+            "bytes_accepted": self.bytes_accepted,
+            "rejected_content_length": self.rejected_content_length,
+            "rejected_streaming": self.rejected_streaming,
+            "rejected_type": self.rejected_type,
+            "spooled_to_disk": self.spooled_to_disk,
+            "peak_in_memory_bytes": self.peak_in_memory_bytes,
+            "spool_max_bytes": MultiPartParser.max_file_size,
+            "images_preprocessed": preprocessed,
+            "preprocess_bytes_before": self.preprocess_bytes_before,
+            "preprocess_bytes_after": self.preprocess_bytes_after,
+            "preprocess_bytes_saved": self.preprocess_bytes_before - self.preprocess_bytes_after,
+            "avg_preprocess_ms": self.preprocess_seconds * 1000 / preprocessed if preprocessed else 0.0,
+        }
+
+
+class UploadLimitMiddleware:
+    """Reject request bodies over `max_body_bytes` on `paths` without buffering them."""
+
+    def __init__(self, app, paths, max_body_bytes: int, max_file_bytes: int, stats: UploadStats):
+        self.app = app
+        self.paths = set(paths)
+        self.max_body_bytes = max_body_bytes
+        self.max_file_bytes = max_file_bytes
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers', []))
+        content_length = headers.get(b'content-length')
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            self.stats.rejected_content_length += 1
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_body_bytes:
+                    self.stats.rejected_streaming += 1
+                    raise UploadTooLarge(self.max_file_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        error = UploadTooLarge(self.max_file_bytes)
+        body = json.dumps({"detail": error.detail}).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': error.status_code,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'connection', b'close'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
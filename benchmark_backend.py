@@ -0,0 +1,584 @@
+#!/usr/bin/env python3
+"""
+Offline load benchmark for the backend.
+
+Runs the FastAPI app in-process with stand-in Textract/Bedrock/Polly clients
+(no server, no AWS credentials) and drives concurrent load against /upload,
+/simplify, /narrate, /visual-model, /ask-questions and the one-shot /process
+pipeline. Reports RPS, p50/p95/p99
+latency and peak RSS per endpoint, and compares the run against a saved JSON
+baseline.
+
+Startup is measured separately in fresh interpreters: time from spawning the
+process to `import main` finishing, to the first response, to /ready
+returning 200 and to the first stubbed /simplify response (median of
+--startup-runs).
+
+Examples:
+    python benchmark_backend.py                       # run and compare to the baseline
+    python benchmark_backend.py --save-baseline       # run and record a new baseline
+    python benchmark_backend.py --endpoints simplify narrate --latency-ms 50 --throttle-rate 0.1
+    python benchmark_backend.py --endpoints process --startup-runs 10
+    OCR_PREPROCESS=0 python benchmark_backend.py --endpoints upload --upload-type image --textract-ms-per-mb 100
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+ENDPOINTS = ['upload', 'simplify', 'narrate', 'visual-model', 'ask-questions', 'process']
+SERVICES = ['textract', 'bedrock-text', 'bedrock-image', 'polly']
+STARTUP_METRICS = ['import_ms', 'first_response_ms', 'ready_ms', 'first_request_ms']
+
+WORDS = ("the cell uses energy from food to build proteins while the nucleus stores "
+         "genetic information and the membrane controls what enters and leaves").split()
+
+
+# ---------------------------------------------------------------------------
+# Stand-in AWS clients
+# ---------------------------------------------------------------------------
+
+class StubProfile:
+    """Latency, throttling and payload sizes shared by all stub clients."""
+
+    def __init__(self, latency_ms, jitter_ms, throttle_rate, text_chars, image_bytes, audio_bytes,
+                 textract_ms_per_mb=0.0):
+        self.latency_ms = latency_ms
+        # Extra Textract latency per MB of document, standing in for transfer and processing time
+        self.textract_ms_per_mb = textract_ms_per_mb
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.text_chars = text_chars
+        self.image_bytes = image_bytes
+        self.audio_bytes = audio_bytes
+
+    def wait(self, operation, extra_ms=0.0):
+        time.sleep(max(0.0, self.latency_ms + extra_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+        if self.throttle_rate and random.random() < self.throttle_rate:
+            from botocore.exceptions import ClientError
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'},
+                               'ResponseMetadata': {'HTTPStatusCode': 400}}, operation)
+
+
+def sample_text(chars, seed=''):
+    words = []
+    length = 0
+    rng = random.Random(seed)
+    while length < chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return (' '.join(words)[:chars].rstrip() + '.') if chars else ''
+
+
+class StubBody:
+
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+
+class StubErrors:
+    class UnsupportedDocumentException(Exception): pass
+    class DocumentTooLargeException(Exception): pass
+    class BadDocumentException(Exception): pass
+    class ValidationException(Exception): pass
+
+
+class StubTextract:
+    exceptions = StubErrors
+
+    def __init__(self, profile):
+        self.profile = profile
+
+    def detect_document_text(self, Document, **kwargs):
+        self.profile.wait('DetectDocumentText', self.profile.textract_ms_per_mb * len(Document['Bytes']) / (1024 * 1024))
+        # Seeded by content so distinct documents give distinct text downstream (/process)
+        text = sample_text(self.profile.text_chars, seed=zlib.crc32(Document['Bytes']))
+        lines = [text[i:i + 80] for i in range(0, len(text), 80)]
+        return {'Blocks': [{'BlockType': 'LINE', 'Text': line} for line in lines]}
+
+
+class StubBedrock:
+    exceptions = StubErrors
+
+    def __init__(self, profile):
+        self.profile = profile
+        self._image = os.urandom(profile.image_bytes)
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.profile.wait('InvokeModel')
+        request = json.loads(body)
+        if 'taskType' in request:
+            payload = {'images': [base64.b64encode(self._image).decode('ascii')]}
+        elif modelId.startswith('meta.'):
+            if 'JSON object' in request['prompt']:
+                payload = {'generation': json.dumps(self._simplified(body))}
+            else:
+                payload = {'generation': sample_text(400, seed=request['prompt'][-50:])}
+        else:
+            payload = {'content': [{'type': 'text', 'text': json.dumps(self._simplified(body))}]}
+        return {'body': StubBody(json.dumps(payload).encode('utf-8'))}
+
+    def _simplified(self, body):
+        # Distinct inputs simplify to distinct text, so narration/image caches only hit on repeats
+        return {
+            'simplified_text': sample_text(self.profile.text_chars // 2, seed=zlib.crc32(body.encode('utf-8'))),
+            'key_terms': [{'term': word, 'definition': sample_text(60, seed=word)} for word in WORDS[:5]],
+            'step_by_step': [sample_text(80, seed=i) for i in range(4)],
+        }
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        self.profile.wait('InvokeModelWithResponseStream')
+        text = json.dumps(self._simplified(body))
+
+        def events():
+            for i in range(0, len(text), 20):
+                delta = {'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': text[i:i + 20]}}
+                yield {'chunk': {'bytes': json.dumps(delta).encode('utf-8')}}
+        return {'body': events()}
+
+
+class StubPolly:
+
+    def __init__(self, profile):
+        self.profile = profile
+        self._audio = os.urandom(profile.audio_bytes)
+
+    def synthesize_speech(self, Text, **kwargs):
+        self.profile.wait('SynthesizeSpeech')
+        return {'AudioStream': io.BytesIO(self._audio)}
+
+
+# ---------------------------------------------------------------------------
+# Minimal in-process ASGI client (no server, no extra dependencies)
+# ---------------------------------------------------------------------------
+
+async def asgi_request(app, method, path, body=b'', content_type='application/json'):
+    """Send one request straight into the ASGI app. Returns (status, response_bytes)."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method, 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'bench'), (b'content-type', content_type.encode()),
+                    (b'content-length', str(len(body)).encode())],
+        'client': ('127.0.0.1', 50000), 'server': ('bench', 80),
+    }
+    finished = asyncio.Event()
+    request_sent = False
+    response = {'status': 500, 'body': []}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['body'].append(message.get('body', b''))
+            if not message.get('more_body', False):
+                finished.set()
+
+    await app(scope, receive, send)
+    finished.set()
+    return response['status'], b''.join(response['body'])
+
+
+def multipart_body(field, filename, content, content_type):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+_pdf_templates = {}
+
+
+def make_pdf(pages, variant, padding_kb=0):
+    """A PDF whose bytes differ per variant so every upload misses the cache.
+
+    `padding_kb` pads the document metadata to simulate large uploads. The
+    document is built once and only its fixed-width page height is swapped
+    per variant, so large uploads are cheap to generate.
+    """
+    key = (pages, padding_kb)
+    if key not in _pdf_templates:
+        from pypdf import PdfWriter
+        writer = PdfWriter()
+        for page in range(pages):
+            writer.add_blank_page(width=300 + page, height=99999999)
+        writer.add_metadata({'/Subject': 'x' * (padding_kb * 1024)})
+        output = io.BytesIO()
+        writer.write(output)
+        _pdf_templates[key] = output.getvalue()
+    return _pdf_templates[key].replace(b'99999999', f'{10000000 + variant:08d}'.encode())
+
+
+_photo_templates = {}
+
+
+def make_photo(megapixels, variant):
+    """A phone-photo-like JPEG (noisy colour, EXIF-rotated) whose bytes differ per variant.
+
+    Encoded once; only a fixed-width JPEG comment is swapped per variant.
+    """
+    if megapixels not in _photo_templates:
+        from PIL import Image, ImageDraw
+        width = int((megapixels * 1e6 * 3 / 4) ** 0.5)
+        height = int(width * 4 / 3)
+        noise = Image.effect_noise((width, height), 40).convert('RGB')
+        image = Image.blend(Image.new('RGB', (width, height), (235, 225, 205)), noise, 0.3)
+        draw = ImageDraw.Draw(image)
+        for y in range(200, height - 200, 120):
+            draw.rectangle((150, y, width - 150, y + 40), fill=(40, 40, 40))
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees, as phones usually save portrait shots
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=92, exif=exif, comment=b'benchmark-00000000')
+        _photo_templates[megapixels] = output.getvalue()
+    return _photo_templates[megapixels].replace(b'benchmark-00000000', f'benchmark-{variant:08d}'.encode(), 1)
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+def build_request(endpoint, index, args):
+    """Return (method, path, body, content_type) for request number `index`."""
+    # Unique inputs measure the upstream path; --repeat-inputs measures the cached path
+    variant = 0 if args.repeat_inputs else index
+    text = sample_text(args.text_chars, seed=variant)
+    if endpoint == 'upload' and args.upload_type == 'image':
+        body, content_type = multipart_body('file', f'photo-{variant}.jpg', make_photo(args.photo_megapixels, variant), 'image/jpeg')
+        return 'POST', '/upload', body, content_type
+    if endpoint == 'process' and not args.repeat_inputs:
+        # Don't reuse the documents /upload already extracted
+        variant += 10 ** 6
+    if endpoint in ('upload', 'process'):
+        body, content_type = multipart_body('file', f'doc-{variant}.pdf', make_pdf(args.pages, variant, args.upload_padding_kb), 'application/pdf')
+        return 'POST', f'/{endpoint}', body, content_type
+    if endpoint == 'simplify':
+        payload = {'text': f'{text} ({variant})', 'file_name': f'doc-{variant}.pdf'}
+    elif endpoint == 'narrate':
+        payload = {'text': f'{text} ({variant})'}
+    elif endpoint == 'visual-model':
+        payload = {'simplified_text': f'{text[:300]} ({variant})', 'response_format': args.image_format}
+    else:
+        payload = {'context': text, 'question': f'How does the cell use energy? ({variant})'}
+    return 'POST', f'/{endpoint}', json.dumps(payload).encode('utf-8'), 'application/json'
+
+
+class RSSSampler:
+    """Samples resident set size in the background and keeps the peak."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current():
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            # Not Linux: fall back to the process-lifetime peak
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_endpoint(app, endpoint, args):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    statuses = {}
+
+    async def one(index):
+        async with semaphore:
+            # Built lazily (off the loop) so request bodies don't inflate peak RSS
+            request = await asyncio.to_thread(build_request, endpoint, index, args)
+            started = time.perf_counter()
+            status, _ = await send_request(app, request)
+            latencies.append(time.perf_counter() - started)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    # Warm up imports, pools and connection setup outside the measured window
+    for i in range(min(args.warmup, args.requests)):
+        await send_request(app, build_request(endpoint, args.requests + i, args))
+
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    ok = sum(count for status, count in statuses.items() if status.startswith('2'))
+    return {
+        'requests': args.requests,
+        'ok': ok,
+        'statuses': statuses,
+        'rps': args.requests / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(ordered, 0.50) * 1000,
+        'p95_ms': percentile(ordered, 0.95) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'peak_rss_mb': rss.peak / (1024 * 1024),
+    }
+
+
+async def send_request(app, request):
+    method, path, body, content_type = request
+    return await asgi_request(app, method, path, body, content_type)
+
+
+async def run_all(app, args):
+    results = {}
+    for endpoint in args.endpoints:
+        print(f"\n🧪 {endpoint}: {args.requests} requests, concurrency {args.concurrency}")
+        results[endpoint] = await run_endpoint(app, endpoint, args)
+    return results
+
+
+def load_app(args, cache_dir):
+    """Import backend/main.py with stub clients and the benchmark's environment."""
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'BENCHMARK')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+    os.environ['CACHE_DIR'] = cache_dir
+    os.environ.setdefault('RETRY_BASE_DELAY_SECONDS', '0.05')
+    if args.upload_type == 'image' and not args.repeat_inputs:
+        # Photos differ only in metadata, so preprocessed pages would hit the page cache
+        os.environ.setdefault('EXTRACTION_CACHE_MAX_MB', '0')
+    if not args.keep_rate_limits:
+        # Measure the server, not the default per-service AWS quotas
+        for service in SERVICES:
+            os.environ.setdefault(f"{service.upper().replace('-', '_')}_RATE_LIMIT", '0')
+
+    sys.path.insert(0, BACKEND_DIR)
+    import logging
+    import main as backend
+    logging.getLogger('main').setLevel(logging.WARNING)
+    logging.getLogger('aws_clients').setLevel(logging.WARNING)
+
+    profile = StubProfile(args.latency_ms, args.jitter_ms, args.throttle_rate,
+                          args.text_chars, args.image_bytes, args.audio_bytes, args.textract_ms_per_mb)
+    backend.textract_client = StubTextract(profile)
+    backend.bedrock_client = StubBedrock(profile)
+    backend.polly_client = StubPolly(profile)
+    return backend
+
+
+async def probe_startup(app, args, spawned_at):
+    """Startup milestones of this process, in ms since the parent spawned it."""
+    def elapsed():
+        return round((time.time() - spawned_at) * 1000, 1)
+
+    timings = {'import_ms': elapsed()}
+    # What uvicorn does before accepting connections
+    await app.router.startup()
+    status, _ = await asgi_request(app, 'GET', '/')
+    timings['first_response_ms'] = elapsed() if status == 200 else None
+    deadline = time.time() + 60
+    while (await asgi_request(app, 'GET', '/ready'))[0] != 200:
+        if time.time() > deadline:
+            break
+        await asyncio.sleep(0.01)
+    timings['ready_ms'] = elapsed() if time.time() <= deadline else None
+    method, path, body, content_type = build_request('simplify', 0, args)
+    status, _ = await asgi_request(app, method, path, body, content_type)
+    timings['first_request_ms'] = elapsed() if status == 200 else None
+    await app.router.shutdown()
+    return timings
+
+
+def run_startup_probe(args):
+    spawned_at = float(os.environ['BENCHMARK_SPAWNED_AT'])
+    with tempfile.TemporaryDirectory(prefix='ainable-bench-') as cache_dir:
+        backend = load_app(args, cache_dir)
+        timings = asyncio.run(probe_startup(backend.app, args, spawned_at))
+        backend.shutdown_executors()
+    print(json.dumps(timings))
+
+
+def measure_startup(runs):
+    """Median startup milestones over `runs` fresh interpreters."""
+    samples = []
+    for _ in range(runs):
+        env = dict(os.environ, BENCHMARK_SPAWNED_AT=repr(time.time()))
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), '--startup-probe'] + sys.argv[1:],
+                               env=env, capture_output=True, text=True, timeout=120)
+        if child.returncode != 0:
+            raise RuntimeError(f"Startup probe failed:\n{child.stderr[-2000:]}")
+        samples.append(json.loads(child.stdout.strip().splitlines()[-1]))
+    return {
+        metric: round(statistics.median(values), 1) if (values := [s[metric] for s in samples if s[metric] is not None]) else None
+        for metric in STARTUP_METRICS
+    }
+
+
+def benchmark_config(args):
+    keys = ['requests', 'concurrency', 'latency_ms', 'jitter_ms', 'throttle_rate', 'text_chars',
+            'image_bytes', 'audio_bytes', 'pages', 'upload_padding_kb', 'upload_type', 'photo_megapixels', 'textract_ms_per_mb', 'repeat_inputs', 'keep_rate_limits', 'image_format']
+    return {key: getattr(args, key) for key in keys}
+
+
+def compare(results, baseline, tolerance, startup=None):
+    """Print a comparison against the baseline; returns the endpoints that regressed."""
+    regressions = []
+    print(f"\n📊 Comparison against baseline (tolerance {tolerance:.0%}):")
+    for endpoint, current in results.items():
+        previous = baseline.get('results', {}).get(endpoint)
+        if previous is None:
+            print(f"  {endpoint:<14} no baseline")
+            continue
+        rps_change = (current['rps'] - previous['rps']) / previous['rps'] if previous['rps'] else 0.0
+        p95_change = (current['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] if previous['p95_ms'] else 0.0
+        regressed = rps_change < -tolerance or p95_change > tolerance
+        marker = '❌' if regressed else '✅'
+        print(f"  {marker} {endpoint:<14} rps {rps_change:+.1%}  p95 {p95_change:+.1%}  "
+              f"rss {current['peak_rss_mb'] - previous['peak_rss_mb']:+.1f} MB")
+        if regressed:
+            regressions.append(endpoint)
+    current, previous = startup, baseline.get('startup')
+    if current and previous:
+        changes = {metric: (current[metric] - previous[metric]) / previous[metric]
+                   for metric in STARTUP_METRICS if current.get(metric) and previous.get(metric)}
+        regressed = any(change > tolerance for change in changes.values())
+        marker = '❌' if regressed else '✅'
+        print(f"  {marker} {'startup':<14} " + '  '.join(f"{metric[:-3]} {change:+.1%}" for metric, change in changes.items()))
+        if regressed:
+            regressions.append('startup')
+    return regressions
+
+
+def print_startup(startup):
+    print("\nstartup (median ms since spawn): " + '  '.join(
+        f"{metric[:-3]} {startup[metric] if startup[metric] is not None else 'failed'}" for metric in STARTUP_METRICS))
+
+
+def print_results(results):
+    print(f"\n{'endpoint':<14} {'ok/total':>9} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak rss':>9}")
+    for endpoint, result in results.items():
+        print(f"{endpoint:<14} {result['ok']:>4}/{result['requests']:<4} {result['rps']:>8.1f} "
+              f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+              f"{result['peak_rss_mb']:>7.1f}MB")
+        failures = {status: count for status, count in result['statuses'].items() if not status.startswith('2')}
+        if failures:
+            print(f"{'':<14} non-2xx: {failures}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument('--requests', type=int, default=100, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per endpoint')
+    parser.add_argument('--latency-ms', type=float, default=100.0, help='stub AWS call latency')
+    parser.add_argument('--jitter-ms', type=float, default=20.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of stub calls that throttle')
+    parser.add_argument('--text-chars', type=int, default=3000, help='size of extracted/input text')
+    parser.add_argument('--image-bytes', type=int, default=300 * 1024)
+    parser.add_argument('--audio-bytes', type=int, default=64 * 1024, help='audio bytes per Polly call')
+    parser.add_argument('--pages', type=int, default=3, help='pages per uploaded PDF')
+    parser.add_argument('--upload-padding-kb', type=int, default=0, help='extra bytes per uploaded PDF')
+    parser.add_argument('--upload-type', choices=['pdf', 'image'], default='pdf', help='image uploads need Pillow')
+    parser.add_argument('--photo-megapixels', type=float, default=12.0, help='size of image uploads')
+    parser.add_argument('--textract-ms-per-mb', type=float, default=0.0, help='extra stub Textract latency per MB')
+    parser.add_argument('--image-format', choices=['url', 'base64'], default='url')
+    parser.add_argument('--repeat-inputs', action='store_true', help='reuse one input to measure cache hits')
+    parser.add_argument('--keep-rate-limits', action='store_true', help='keep the default per-service rate limits')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed RPS drop / p95 increase')
+    parser.add_argument('--startup-runs', type=int, default=3, help='fresh processes to time startup in (0 to skip)')
+    parser.add_argument('--startup-probe', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.startup_probe:
+        run_startup_probe(args)
+        return
+    random.seed(args.seed)
+    print("🚀 Starting offline backend benchmark...")
+
+    with tempfile.TemporaryDirectory(prefix='ainable-bench-') as cache_dir:
+        backend = load_app(args, cache_dir)
+        results = asyncio.run(run_all(backend.app, args))
+        backend.shutdown_executors()
+
+    print_results(results)
+    run = {'config': benchmark_config(args), 'results': results}
+    if args.startup_runs > 0:
+        startup = measure_startup(args.startup_runs)
+        print_startup(startup)
+        run['startup'] = startup
+
+    exit_code = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != run['config']:
+            print("\n⚠️  Baseline was recorded with different settings; comparison is indicative only.")
+        regressions = compare(results, baseline, args.tolerance, run.get('startup'))
+        if regressions:
+            print(f"\n❌ Regressed: {', '.join(regressions)}")
+            exit_code = 1
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=2, sort_keys=True)
+        print(f"\n💾 Saved baseline to {args.baseline}")
+
+    print("\n✅ Benchmark completed!")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -44,7 +44,7 @@ class ApiService {
     var response = await http.post(
       uri,
       headers: {'Content-Type': 'application/json'},
-      body: jsonEncode({'simplified_text': simplifiedText}),
+      body: jsonEncode({'simplified_text': simplifiedText, 'response_format': 'base64'}),
     );
 
     if (response.statusCode == 200) {
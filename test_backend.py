@@ -47,7 +47,7 @@ def test_visual_storytelling():
             print(f"Simplified text preview: {simplified_text[:100]}...")
             
             # Now test visual model generation
-            visual_response = requests.post(f"{BASE_URL}/visual-model", json={"simplified_text": simplified_text})
+            visual_response = requests.post(f"{BASE_URL}/visual-model", json={"simplified_text": simplified_text, "response_format": "base64"})
             print(f"Visual model response status: {visual_response.status_code}")
             
             if visual_response.status_code == 200: